@@ -14,6 +14,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import bisect
+from typing import NamedTuple
 
 from gi.repository import Gdk, Gio, GObject, Graphene, Gsk, Gtk
 
@@ -21,9 +22,21 @@ from meld.const import ActionMode, ChunkAction
 from meld.matchers.myers import DiffChunk
 from meld.settings import get_meld_settings
 from meld.style import get_common_theme
+from meld.tracing import frame_profiled
 from meld.ui.gtkutil import alpha_tint
 
 
+class ChunkLayout(NamedTuple):
+    """Position, action and rendering of a chunk in buffer coordinates"""
+
+    y: int
+    height: int
+    action: ActionMode | None
+    button_y: int
+    button_height: int
+    node: Gsk.RenderNode | None
+
+
 class ActionGutter(Gtk.Widget):
     __gtype_name__ = "ActionGutter"
 
@@ -45,6 +58,7 @@ class ActionGutter(Gtk.Widget):
         self._chunks = chunks
         self.chunk_starts = [c.start_a for c in chunks]
         self.pointer_chunk = None
+        self.invalidate_layout()
 
     @GObject.Property(
         type=Gtk.TextDirection,
@@ -92,7 +106,7 @@ class ActionGutter(Gtk.Widget):
             self._source_view.disconnect(self._source_editable_connect_id)
 
         self._source_editable_connect_id = view.connect(
-            "notify::editable", lambda *args: self.queue_draw()
+            "notify::editable", self.invalidate_layout
         )
         self._source_view = view
         self.queue_draw()
@@ -114,7 +128,7 @@ class ActionGutter(Gtk.Widget):
             self._target_view.disconnect(self._target_editable_connect_id)
 
         self._target_editable_connect_id = view.connect(
-            "notify::editable", lambda *args: self.queue_draw()
+            "notify::editable", self.invalidate_layout
         )
         self._target_view = view
         self.queue_draw()
@@ -131,12 +145,20 @@ class ActionGutter(Gtk.Widget):
     def __init__(self):
         super().__init__()
 
+        #: Chunk layouts by chunk index, valid while the layout key is
+        #: unchanged
+        self._chunk_layouts = {}
+        self._layout_key = None
+        #: Rendered buttons by action, state and size
+        self._button_nodes = {}
+        #: Offset from buffer to widget coordinates in the last frame
+        self._y_translate = 0
+
         # Object-type defaults
         self.chunks = []
         self.action_map = {}
 
         # State for "button" implementation
-        self.buttons = []
         self.pointer_chunk = None
         self.pressed_chunk = None
 
@@ -155,7 +177,8 @@ class ActionGutter(Gtk.Widget):
 
     def on_setting_changed(self, settings, key):
         if key == "font":
-            self.queue_draw()
+            self._button_nodes = {}
+            self.invalidate_layout()
         elif key == "style-scheme":
             self.fill_colors, self.line_colors = get_common_theme()
             alpha = self.fill_colors["current-chunk-highlight"].alpha
@@ -163,9 +186,17 @@ class ActionGutter(Gtk.Widget):
                 state: alpha_tint(colour, alpha)
                 for state, colour in self.fill_colors.items()
             }
+            self._button_nodes = {}
+            self.invalidate_layout()
+
+    def invalidate_layout(self, *args):
+        """Discard cached chunk layouts, e.g., when actions change"""
+        self._chunk_layouts = {}
+        self._layout_key = None
+        self.queue_draw()
 
     def on_realize(self, *args):
-        self.connect("notify::action-mode", lambda *args: self.queue_draw())
+        self.connect("notify::action-mode", self.invalidate_layout)
 
         meld_settings = get_meld_settings()
         meld_settings.connect("changed", self.on_setting_changed)
@@ -198,25 +229,39 @@ class ActionGutter(Gtk.Widget):
         popover.set_halign(Gtk.Align.START)
         self.popover_menu = popover
 
+    def _get_button_bounds(self, index):
+        """Get the bounds of a chunk's button in widget coordinates"""
+        layout = self._chunk_layouts.get(index)
+        if layout is None or layout.action is None:
+            return None
+        y1 = layout.button_y + self._y_translate
+        return 1, y1, self.get_width() - 1, y1 + layout.button_height
+
+    def _get_chunk_indices_at_line(self, line):
+        start = bisect.bisect_left(self.chunk_starts, line)
+        end = bisect.bisect_right(self.chunk_starts, line)
+        return range(start, end)
+
     def get_coords_for_button(self, chunk):
-        for button in self.buttons:
-            x1, y1, x2, y2, button_chunk = button
-            if button_chunk == chunk:
-                return x1, y1, x2, y2
+        for index in self._get_chunk_indices_at_line(chunk.start_a):
+            if self.chunks[index] == chunk:
+                return self._get_button_bounds(index)
         return None
 
     def update_pointer_chunk(self, x, y):
-        # This is the simplest button/intersection implementation in
-        # the world, but it basically works for our purposes.
-        for button in self.buttons:
-            x1, y1, x2, y2, chunk = button
-
-            # Check y first; it's more likely to be out of range
-            if y1 <= y <= y2 and x1 <= x <= x2:
-                new_pointer_chunk = chunk
-                break
-        else:
-            new_pointer_chunk = None
+        # Buttons are drawn on their chunk's first line, so only chunks
+        # starting on the line under the pointer need to be checked.
+        new_pointer_chunk = None
+        if self._layout_key is not None:
+            line = self.source_view.get_line_num_for_y(int(y - self._y_translate))
+            for index in self._get_chunk_indices_at_line(line):
+                bounds = self._get_button_bounds(index)
+                if bounds is None:
+                    continue
+                x1, y1, x2, y2 = bounds
+                if y1 <= y <= y2 and x1 <= x <= x2:
+                    new_pointer_chunk = self.chunks[index]
+                    break
 
         if new_pointer_chunk != self.pointer_chunk:
             self.pointer_chunk = new_pointer_chunk
@@ -293,7 +338,7 @@ class ActionGutter(Gtk.Widget):
     def action_copy_down(self, action, param, chunk):
         self._action_on_chunk(ChunkAction.copy_down, chunk)
 
-    def get_chunk_range(self, start_y, end_y):
+    def get_chunk_index_range(self, start_y, end_y):
         start_line = self.source_view.get_line_num_for_y(start_y)
         end_line = self.source_view.get_line_num_for_y(end_y)
 
@@ -308,106 +353,141 @@ class ActionGutter(Gtk.Widget):
         if start_idx > 0 and start_line <= self.chunks[start_idx - 1].end_a:
             start_idx -= 1
 
-        return self.chunks[start_idx:end_idx]
+        return start_idx, end_idx
+
+    def _get_chunk_layout(self, index, width):
+        layout = self._chunk_layouts.get(index)
+        if layout is not None:
+            return layout
+
+        view = self.source_view
+        chunk = self.chunks[index]
+        change_type, start_line, end_line, *_unused = chunk
+
+        rect_y = view.get_y_for_line_num(start_line)
+        rect_height = max(2, view.get_y_for_line_num(end_line) - rect_y + 1)
+
+        snapshot = Gtk.Snapshot()
+        if start_line != end_line:
+            rect = Graphene.Rect().init(-0.5, rect_y, width + 1, rect_height)
+            snapshot.append_color(self.fill_colors[change_type], rect)
+
+        path_builder = Gsk.PathBuilder()
+        path_builder.move_to(0, rect_y + 0.5)
+        path_builder.rel_line_to(width, 0)
+        path_builder.move_to(0, rect_y - 0.5 + rect_height)
+        path_builder.rel_line_to(width, 0)
+        path = path_builder.to_path()
+        snapshot.append_stroke(path, Gsk.Stroke(1.0), self.line_colors[change_type])
+
+        action = self._classify_change_actions(chunk)
+        button_y = button_height = 0
+        if action is not None:
+            _found, it = view.get_buffer().get_iter_at_line(start_line)
+            button_y, button_height = view.get_line_yrange(it)
+            button_y += 1
+            button_height -= 2
+
+        layout = ChunkLayout(
+            rect_y, rect_height, action, button_y, button_height, snapshot.to_node()
+        )
+        self._chunk_layouts[index] = layout
+        return layout
+
+    def _get_button_node(self, action, state, width, height):
+        key = (action, state, width, height)
+        if key in self._button_nodes:
+            return self._button_nodes[key]
 
+        if state == Gtk.StateFlags.NORMAL:
+            css_classes = ("action-button", "flat")
+        else:
+            css_classes = ("action-button",)
+
+        # The button is only shown while it's being rendered, so that
+        # our ActionGutter widget continues to receive motion events
+        # for the places it's drawn.
+        button_transform = Gsk.Transform().translate(Graphene.Point().init(1, 0))
+        self.button.set_visible(True)
+        self.button.set_size_request(width, height)
+        self.button.props.icon_name = self.action_icon_name_map.get(action)
+        self.button.allocate(width, height, -1, button_transform)
+        self.button.set_state_flags(state, clear=True)
+        self.button.set_css_classes(css_classes)
+
+        snapshot = Gtk.Snapshot()
+        self.snapshot_child(self.button, snapshot)
+        self.button.set_visible(False)
+
+        node = snapshot.to_node()
+        self._button_nodes[key] = node
+        return node
+
+    @frame_profiled()
     def do_snapshot(self, snapshot):
         view = self.source_view
         if not view or not view.get_realized():
             return
 
-        self.buttons = []
-
         width = self.get_allocated_width()
         height = self.get_allocated_height()
 
-        buf = view.get_buffer()
-
         # Get our linked view's visible offset, get our vertical offset
         # against our view (e.g., for info bars at the top of the view)
         # and translate our context to match.
         view_y_start = view.get_visible_rect().y
         view_y_offset = view.translate_coordinates(self, 0, 0)[1]
         gutter_y_translate = view_y_offset - view_y_start
+        self._y_translate = gutter_y_translate
+
+        # Chunk layouts are in buffer coordinates, so they only change
+        # when the chunks, text or line heights do, and not on scroll.
+        layout_key = (view.chunk_generation, view.get_vadjustment().get_upper(), width)
+        if layout_key != self._layout_key:
+            self._chunk_layouts = {}
+            self._layout_key = layout_key
 
-        button_x = 1
         button_width = width - 2
-        rect = Graphene.Rect()
         highlight = self.fill_colors["current-chunk-highlight"]
-        self.button.set_visible(True)
 
         snapshot.save()
         snapshot.push_clip(Graphene.Rect().init(0, 0, width, height))
         snapshot.translate(Graphene.Point().init(0, gutter_y_translate))
 
-        for chunk in self.get_chunk_range(view_y_start, view_y_start + height):
-            change_type, start_line, end_line, *_unused = chunk
-
-            rect_y = view.get_y_for_line_num(start_line)
-            rect_height = max(2, view.get_y_for_line_num(end_line) - rect_y + 1)
-
-            # Fill first, then over-fill to highlight if in the focused chunk
-            if start_line != end_line:
-                rect.init(-0.5, rect_y, width + 1, rect_height)
-                snapshot.append_color(self.fill_colors[change_type], rect)
-                if view.current_chunk_check(chunk):
-                    snapshot.append_color(highlight, rect)
-
-            path_builder = Gsk.PathBuilder()
-            path_builder.move_to(0, rect_y + 0.5)
-            path_builder.rel_line_to(width, 0)
-            path_builder.move_to(0, rect_y - 0.5 + rect_height)
-            path_builder.rel_line_to(width, 0)
-            path = path_builder.to_path()
-            snapshot.append_stroke(path, Gsk.Stroke(1.0), self.line_colors[chunk[0]])
-
-            # Button rendering and tracking
-            action = self._classify_change_actions(chunk)
-            if action is None:
+        start_idx, end_idx = self.get_chunk_index_range(
+            view_y_start, view_y_start + height
+        )
+        for index in range(start_idx, end_idx):
+            chunk = self.chunks[index]
+            layout = self._get_chunk_layout(index, width)
+            if layout.node:
+                snapshot.append_node(layout.node)
+
+            # Over-fill to highlight if in the focused chunk
+            if chunk.start_a != chunk.end_a and view.current_chunk_check(chunk):
+                rect = Graphene.Rect().init(-0.5, layout.y, width + 1, layout.height)
+                snapshot.append_color(highlight, rect)
+
+            if layout.action is None:
                 continue
 
-            _found, it = buf.get_iter_at_line(start_line)
-            button_y, button_height = view.get_line_yrange(it)
-            button_y += 1
-            button_height -= 2
-
-            button_transform = Gsk.Transform().translate(
-                Graphene.Point().init(button_x, button_y)
-            )
-            self.button.set_size_request(button_width, button_height)
-            self.button.props.icon_name = self.action_icon_name_map.get(action)
-            self.button.allocate(button_width, button_height, -1, button_transform)
-
             match chunk:
                 case self.pressed_chunk:
                     state = Gtk.StateFlags.ACTIVE
-                    css_classes = ("action-button",)
                 case self.pointer_chunk:
                     state = Gtk.StateFlags.PRELIGHT
-                    css_classes = ("action-button",)
                 case _:
                     state = Gtk.StateFlags.NORMAL
-                    css_classes = ("action-button", "flat")
-
-            self.button.set_state_flags(state, clear=True)
-            self.button.set_css_classes(css_classes)
-            self.snapshot_child(self.button, snapshot)
-
-            # TODO: Ideally we'd do this in a pre-render step of some
-            # kind, but I'm having trouble figuring out what that would
-            # look like.
-            self.buttons.append(
-                (
-                    button_x,
-                    button_y + gutter_y_translate,
-                    button_x + button_width,
-                    button_y + gutter_y_translate + button_height,
-                    chunk,
-                )
+
+            node = self._get_button_node(
+                layout.action, state, button_width, layout.button_height
             )
+            if node:
+                snapshot.save()
+                snapshot.translate(Graphene.Point().init(0, layout.button_y))
+                snapshot.append_node(node)
+                snapshot.restore()
 
-        # Hide the button so that our ActionGutter widget continues to receive
-        # motion events for the place we last drew the button.
-        self.button.set_visible(False)
         snapshot.pop()
         snapshot.restore()
 
@@ -13,15 +13,20 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import bisect
 import collections
+import contextlib
+import itertools
 import logging
+import math
 from typing import Any, ClassVar, List, Mapping, Tuple
 
 import cairo
-from gi.repository import Gdk, GObject, Gtk
+from gi.repository import Gdk, GLib, GObject, Gtk
 
 from meld.settings import get_meld_settings
 from meld.style import get_common_theme
+from meld.tracing import frame_profiled
 from meld.tree import STATE_ERROR, STATE_MODIFIED, STATE_NEW
 from meld.ui.gtkutil import make_gdk_rgba
 
@@ -59,16 +64,22 @@ class ChunkMap(Gtk.DrawingArea):
     @chunks.setter
     def chunks_set(self, chunks):
         self._chunks = chunks
-        self._cached_map = None
-        self.queue_draw()
+        self.queue_map_update()
 
     overdraw_padding: int = 2
 
+    #: Height in pixels of the tiles that the map is rendered in
+    TILE_HEIGHT = 64
+
     def __init__(self):
+        self._tiles = []
+        self._tiles_key = None
+        self._map_rects = []
+        self._map_scale = None
+        self._map_dirty = True
         super().__init__()
         self.chunks = []
         self._grab_coordinates = None
-        self._cached_map = None
 
         click_controller = Gtk.GestureClick()
         click_controller.connect("pressed", self.button_press_event)
@@ -97,13 +108,28 @@ class ChunkMap(Gtk.DrawingArea):
         return Gtk.DrawingArea.do_realize(self)
 
     def do_size_allocate(self, *args):
-        self._cached_map = None
+        self.invalidate_map()
         return Gtk.DrawingArea.do_size_allocate(self, *args)
 
     def on_setting_changed(self, settings, key):
         if key == "style-scheme":
             self.fill_colors, self.line_colors = get_common_theme()
-            self._cached_map = None
+            self.invalidate_map()
+
+    def invalidate_map(self, *args):
+        """Discard the whole rendered map"""
+        self._tiles = []
+        self._map_dirty = True
+        self.queue_draw()
+
+    def queue_map_update(self, *args):
+        """Update the rendered map for changed chunks
+
+        Only the tiles covering chunks that have moved, appeared or
+        disappeared are re-rendered.
+        """
+        self._map_dirty = True
+        self.queue_draw()
 
     def get_height_scale(self) -> float:
         return 1.0
@@ -136,6 +162,82 @@ class ChunkMap(Gtk.DrawingArea):
         """Map chunks to buffer offsets for drawing, ordered by tag"""
         raise NotImplementedError()
 
+    def chunk_coords(self) -> List[Tuple[str, float, float]]:
+        """Get chunk tags and buffer offsets for drawing, in map order"""
+        coords = [
+            (tag, y0, y1)
+            for tag, diffs in self.chunk_coords_by_tag().items()
+            for y0, y1 in diffs
+        ]
+        coords.sort(key=lambda c: c[1])
+        return coords
+
+    def _update_map_rects(self, height_scale: float, num_tiles: int) -> None:
+        """Recalculate chunk rectangles, and mark changed tiles dirty"""
+        rects = []
+        for tag, y0, y1 in self.chunk_coords():
+            y0 = round(y0 * height_scale) + 0.5
+            y1 = round(y1 * height_scale) - 0.5
+            rects.append((y0, y1, tag))
+
+        # Rectangles, including their outlines, that have been added or
+        # removed, as well as the map's bottom edge if that has moved.
+        changed = [(y0, y1) for y0, y1, _tag in set(self._map_rects) ^ set(rects)]
+        if self._map_scale != height_scale:
+            old_scale = self._map_scale or height_scale
+            changed.append((min(old_scale, height_scale), max(old_scale, height_scale)))
+
+        for y0, y1 in changed:
+            first = math.floor((min(y0, y1) - 1) / self.TILE_HEIGHT)
+            last = math.floor((max(y0, y1) + 1) / self.TILE_HEIGHT)
+            for index in range(max(first, 0), min(last + 1, num_tiles)):
+                self._tiles[index] = None
+
+        self._map_rects = rects
+        self._map_scale = height_scale
+        self._map_dirty = False
+
+    def _render_tile(self, context, index, width, height_scale, base_colors):
+        base_bg, base_outline = base_colors
+        x0 = self.overdraw_padding + 0.5
+        x1 = width - 2 * x0
+        top = index * self.TILE_HEIGHT
+        bottom = top + self.TILE_HEIGHT
+
+        surface = cairo.Surface.create_similar(
+            context.get_target(), cairo.CONTENT_COLOR_ALPHA, width, self.TILE_HEIGHT
+        )
+        tile_ctx = cairo.Context(surface)
+        tile_ctx.translate(0, -top)
+        tile_ctx.set_line_width(1)
+
+        tile_ctx.rectangle(x0, -0.5, x1, height_scale + 0.5)
+        Gdk.cairo_set_source_rgba(tile_ctx, base_bg)
+        tile_ctx.fill()
+
+        # Chunks don't overlap, so at most the chunk before the first
+        # one starting in this tile can extend into it.
+        rects = self._map_rects
+        start = bisect.bisect_left(rects, (top - 1,))
+        while start > 0 and max(rects[start - 1][:2]) >= top - 1:
+            start -= 1
+
+        for y0, y1, tag in itertools.islice(rects, start, None):
+            if min(y0, y1) > bottom + 1:
+                break
+            tile_ctx.rectangle(x0, y0, x1, y1 - y0)
+            Gdk.cairo_set_source_rgba(tile_ctx, self.fill_colors[tag])
+            tile_ctx.fill_preserve()
+            Gdk.cairo_set_source_rgba(tile_ctx, self.line_colors[tag])
+            tile_ctx.stroke()
+
+        tile_ctx.rectangle(x0, 0.5, x1, height_scale - 1)
+        Gdk.cairo_set_source_rgba(tile_ctx, base_outline)
+        tile_ctx.stroke()
+
+        return surface
+
+    @frame_profiled()
     def draw(self, _chunkmap, context, width, height):
         if not self.adjustment or self.adjustment.get_upper() <= 0:
             return
@@ -154,39 +256,33 @@ class ChunkMap(Gtk.DrawingArea):
         x1 = width - 2 * x0
         height_scale = height * self.get_height_scale()
 
-        if self._cached_map is None:
-            surface = cairo.Surface.create_similar(
-                context.get_target(), cairo.CONTENT_COLOR_ALPHA, width, height
-            )
-            cache_ctx = cairo.Context(surface)
-            cache_ctx.set_line_width(1)
-
-            cache_ctx.rectangle(x0, -0.5, x1, height_scale + 0.5)
-            Gdk.cairo_set_source_rgba(cache_ctx, base_bg)
-            cache_ctx.fill()
-
-            # We get drawing coordinates by tag to minimise our source
-            # colour setting, and make this loop slightly cleaner.
-            tagged_diffs = self.chunk_coords_by_tag()
-
-            for tag, diffs in tagged_diffs.items():
-                Gdk.cairo_set_source_rgba(cache_ctx, self.fill_colors[tag])
-                for y0, y1 in diffs:
-                    y0 = round(y0 * height_scale) + 0.5
-                    y1 = round(y1 * height_scale) - 0.5
-                    cache_ctx.rectangle(x0, y0, x1, y1 - y0)
-                cache_ctx.fill_preserve()
-                Gdk.cairo_set_source_rgba(cache_ctx, self.line_colors[tag])
-                cache_ctx.stroke()
-
-            cache_ctx.rectangle(x0, 0.5, x1, height_scale - 1)
-            Gdk.cairo_set_source_rgba(cache_ctx, base_outline)
-            cache_ctx.stroke()
-
-            self._cached_map = surface
-
-        context.set_source_surface(self._cached_map, 0, 0)
-        context.paint()
+        # The map is rendered in tiles, so that a change to a few chunks
+        # only needs the tiles around them to be redrawn.
+        num_tiles = math.ceil(height / self.TILE_HEIGHT)
+        tiles_key = (
+            width,
+            height,
+            base_bg.to_string(),
+            base_outline.to_string(),
+        )
+        if tiles_key != self._tiles_key or len(self._tiles) != num_tiles:
+            self._tiles = [None] * num_tiles
+            self._tiles_key = tiles_key
+            self._map_dirty = True
+
+        if self._map_dirty:
+            self._update_map_rects(height_scale, num_tiles)
+
+        for index, tile in enumerate(self._tiles):
+            if tile is None:
+                tile = self._render_tile(
+                    context, index, width, height_scale, (base_bg, base_outline)
+                )
+                self._tiles[index] = tile
+            top = index * self.TILE_HEIGHT
+            context.set_source_surface(tile, 0, top)
+            context.rectangle(0, top, width, self.TILE_HEIGHT)
+            context.fill()
 
         # Draw our scroll position indicator
         context.set_line_width(1)
@@ -280,15 +376,32 @@ class TextViewChunkMap(ChunkMap):
         flags=(GObject.ParamFlags.READWRITE | GObject.ParamFlags.CONSTRUCT_ONLY),
     )
 
+    def __init__(self):
+        #: Chunks and buffer coordinates of the last coordinate update
+        self._coord_chunks = []
+        self._chunk_starts = []
+        self._chunk_ends = []
+        self._coords_max_y = 0.0
+        self._coords_line_count = 0
+        #: Layout key of the last coordinate update
+        self._coords_key = None
+        super().__init__()
+
     def do_realize(self):
 
         def force_redraw(*args: Any) -> None:
-            self._cached_map = None
-            self.queue_draw()
+            self._coord_chunks = []
+            self.invalidate_map()
 
         self.textview.connect("notify::wrap-mode", force_redraw)
         return ChunkMap.do_realize(self)
 
+    def on_setting_changed(self, settings, key):
+        if key == "font":
+            self._coords_key = None
+            self.invalidate_map()
+        ChunkMap.on_setting_changed(self, settings, key)
+
     def get_height_scale(self):
         adjustments = [
             self.props.adjustment,
@@ -301,32 +414,91 @@ class TextViewChunkMap(ChunkMap):
     def get_map_base_colors(self):
         return self._make_map_base_colors(self.textview)
 
-    def chunk_coords_by_tag(self):
-
+    def _get_line_coords(self, chunk):
+        buf = self.textview.get_buffer()
+        _found, start_iter = buf.get_iter_at_line(chunk.start_a)
+        y0, _ = self.textview.get_line_yrange(start_iter)
+        if chunk.start_a == chunk.end_a:
+            return y0, y0
+        _found, end_iter = buf.get_iter_at_line(chunk.end_a - 1)
+        y, h = self.textview.get_line_yrange(end_iter)
+        return y0, y + h
+
+    def _update_chunk_coords(self):
+        """Update the buffer coordinates of changed chunks
+
+        Edits only change chunks around the edit, so chunks before the
+        changed ones keep their coordinates, and chunks after them are
+        moved by the change in document height. Line heights aren't
+        uniform when wrapping, so then everything is recalculated.
+
+        Line heights can also change without an edit, e.g., with a font
+        change or as the text view validates lines. Everything is
+        recalculated when the font or the adjustment bounds change.
+        """
         buf = self.textview.get_buffer()
-
-        tagged_diffs: Mapping[str, List[Tuple[float, float]]]
-        tagged_diffs = collections.defaultdict(list)
-
         y, h = self.textview.get_line_yrange(buf.get_end_iter())
         max_y = float(y + h)
-        for chunk in self.chunks:
-            _found, start_iter = buf.get_iter_at_line(chunk.start_a)
-            y0, _ = self.textview.get_line_yrange(start_iter)
-            if chunk.start_a == chunk.end_a:
-                y, h = y0, 0
-            else:
-                _found, end_iter = buf.get_iter_at_line(chunk.end_a - 1)
-                y, h = self.textview.get_line_yrange(end_iter)
-
-            tagged_diffs[chunk.tag].append((y0 / max_y, (y + h) / max_y))
-
-        return tagged_diffs
+        line_count = buf.get_line_count()
+        coords_key = self.textview.get_vadjustment().get_upper()
+
+        old, new = self._coord_chunks, self.chunks
+        prefix = suffix = 0
+        if (
+            self.textview.get_wrap_mode() == Gtk.WrapMode.NONE
+            and coords_key == self._coords_key
+        ):
+            limit = min(len(old), len(new))
+            while prefix < limit and old[prefix][:3] == new[prefix][:3]:
+                prefix += 1
+
+            line_shift = line_count - self._coords_line_count
+            while suffix < limit - prefix:
+                old_chunk, new_chunk = old[-1 - suffix], new[-1 - suffix]
+                if (
+                    old_chunk.tag != new_chunk.tag
+                    or old_chunk.start_a + line_shift != new_chunk.start_a
+                    or old_chunk.end_a + line_shift != new_chunk.end_a
+                ):
+                    break
+                suffix += 1
+
+        y_shift = max_y - self._coords_max_y
+        changed = [self._get_line_coords(c) for c in new[prefix : len(new) - suffix]]
+        old_suffix = slice(len(old) - suffix, len(old))
+        self._chunk_starts = [
+            *self._chunk_starts[:prefix],
+            *(y0 for y0, _y1 in changed),
+            *(y0 + y_shift for y0 in self._chunk_starts[old_suffix]),
+        ]
+        self._chunk_ends = [
+            *self._chunk_ends[:prefix],
+            *(y1 for _y0, y1 in changed),
+            *(y1 + y_shift for y1 in self._chunk_ends[old_suffix]),
+        ]
+        self._coord_chunks = new
+        self._coords_max_y = max_y
+        self._coords_line_count = line_count
+        self._coords_key = coords_key
+
+    def chunk_coords(self):
+        self._update_chunk_coords()
+        max_y = self._coords_max_y or 1.0
+        return [
+            (chunk.tag, y0 / max_y, y1 / max_y)
+            for chunk, y0, y1 in zip(
+                self._coord_chunks, self._chunk_starts, self._chunk_ends
+            )
+        ]
 
     def draw(self, chunkmap, context, width, height):
         if not self.textview:
             return
 
+        # Chunk coordinates are recalculated when the layout changes
+        if self.textview.get_vadjustment().get_upper() != self._coords_key:
+            self._map_dirty = True
+
         return ChunkMap.draw(self, chunkmap, context, width, height)
 
     def _scroll_to_location(self, location: float, animate: bool):
@@ -363,48 +535,169 @@ class TreeViewChunkMap(ChunkMap):
         STATE_MODIFIED: "replace",
     }
 
+    #: Minimum interval between map updates for model changes, in ms
+    UPDATE_INTERVAL = 200
+
     def __init__(self):
         super().__init__()
         self.model_signal_ids = []
+        self.treeview_signal_ids = []
+        #: States of the rows shown in the tree view in display order,
+        #: or None if they need to be collected again
+        self._row_states = None
+        #: Index into the row states of each shown row, by path
+        self._row_indices = {}
+        self._last_update = 0
+        self._update_source_id = 0
 
     def do_realize(self):
-        self.treeview.connect("row-collapsed", self.clear_cached_map)
-        self.treeview.connect("row-expanded", self.clear_cached_map)
-        self.treeview.connect("notify::model", self.connect_model)
+        self.treeview_signal_ids = [
+            self.treeview.connect("row-collapsed", self.on_row_expansion_changed),
+            self.treeview.connect("row-expanded", self.on_row_expansion_changed),
+            self.treeview.connect("notify::model", self.connect_model),
+        ]
         self.connect_model()
 
         return ChunkMap.do_realize(self)
 
-    def connect_model(self, *args):
+    def do_unrealize(self):
+        for signal_id in self.treeview_signal_ids:
+            self.treeview.disconnect(signal_id)
+        self.treeview_signal_ids = []
+        self.disconnect_model()
+
+        if self._update_source_id:
+            GLib.source_remove(self._update_source_id)
+            self._update_source_id = 0
+
+        return ChunkMap.do_unrealize(self)
+
+    def disconnect_model(self):
         for model, signal_id in self.model_signal_ids:
             model.disconnect(signal_id)
+        self.model_signal_ids = []
+
+    def connect_model(self, *args):
+        self.disconnect_model()
 
         model = self.treeview.get_model()
         self.model_signal_ids = [
-            (model, model.connect("row-changed", self.clear_cached_map)),
-            (model, model.connect("row-deleted", self.clear_cached_map)),
-            (model, model.connect("row-inserted", self.clear_cached_map)),
-            (model, model.connect("rows-reordered", self.clear_cached_map)),
+            (model, model.connect("row-changed", self.on_row_changed)),
+            (model, model.connect("row-deleted", self.on_row_deleted)),
+            (model, model.connect("row-inserted", self.on_row_inserted)),
+            (model, model.connect("rows-reordered", self.on_rows_reordered)),
         ]
+        self.clear_cached_map()
 
     def clear_cached_map(self, *args):
-        self._cached_map = None
+        self._row_states = None
+        self._queue_throttled_update()
 
-    def get_map_base_colors(self):
-        return self._make_map_base_colors(self.treeview)
+    def _queue_throttled_update(self):
+        # Scans change the model constantly, so rather than updating
+        # for every change, we update at most once per interval.
+        if self._update_source_id:
+            return
+        elapsed = (GLib.get_monotonic_time() - self._last_update) // 1000
+        if elapsed >= self.UPDATE_INTERVAL:
+            self._update_map()
+        else:
+            self._update_source_id = GLib.timeout_add(
+                self.UPDATE_INTERVAL - elapsed, self._update_map
+            )
+
+    def on_row_expansion_changed(self, *args):
+        # Expanding or collapsing is a direct user action, so the map
+        # is updated right away rather than throttled.
+        self._row_states = None
+        if self._update_source_id:
+            GLib.source_remove(self._update_source_id)
+        self._update_map()
+
+    def _update_map(self):
+        self._update_source_id = 0
+        self._last_update = GLib.get_monotonic_time()
+        self.queue_map_update()
+        return GLib.SOURCE_REMOVE
+
+    def _children_shown(self, path: Gtk.TreePath | None) -> bool:
+        return path is None or self.treeview.row_expanded(path)
+
+    def _parent_shown(self, path: Gtk.TreePath) -> bool:
+        if path.get_depth() <= 1:
+            return True
+        parent = path.copy()
+        parent.up()
+        return self.treeview.row_expanded(parent)
+
+    def on_row_changed(self, model, path, it):
+        if self._row_states is None:
+            return
+        index = self._row_indices.get(tuple(path.get_indices()))
+        if index is None:
+            return
+        state = model.get_state(it, self.treeview_idx)
+        if state != self._row_states[index]:
+            self._row_states[index] = state
+            self._queue_throttled_update()
+
+    def on_row_inserted(self, model, path, it):
+        # Rows added under collapsed folders don't change what's shown
+        if self._parent_shown(path):
+            self.clear_cached_map()
+
+    def on_row_deleted(self, model, path):
+        if tuple(path.get_indices()) in self._row_indices:
+            self.clear_cached_map()
+
+    def on_rows_reordered(self, model, path, it, new_order):
+        if self._children_shown(path if it is not None else None):
+            self.clear_cached_map()
+
+    @contextlib.contextmanager
+    def batched_updates(self, parent: Gtk.TreePath | None = None):
+        """Update the map once for all model changes in the block
+
+        If the changes are all to the children of a single parent, the
+        map is only updated if those children are shown.
+        """
+        for model, signal_id in self.model_signal_ids:
+            model.handler_block(signal_id)
+        try:
+            yield
+        finally:
+            for model, signal_id in self.model_signal_ids:
+                model.handler_unblock(signal_id)
+            if parent is None or self._children_shown(parent):
+                self.clear_cached_map()
+
+    def _get_row_states(self):
+        """Get the states of all rows shown in the tree view"""
+        if self._row_states is not None:
+            return self._row_states
 
-    def chunk_coords_by_tag(self):
         def recurse_tree_states(rowiter):
+            row_indices[tuple(rowiter.path.get_indices())] = len(row_states)
             row_states.append(model.get_state(rowiter.iter, self.treeview_idx))
             if self.treeview.row_expanded(rowiter.path):
                 for row in rowiter.iterchildren():
                     recurse_tree_states(row)
 
         row_states = []
+        row_indices = {}
         model = self.treeview.get_model()
         recurse_tree_states(next(iter(model)))
+
+        self._row_states = row_states
+        self._row_indices = row_indices
+        return row_states
+
+    def get_map_base_colors(self):
+        return self._make_map_base_colors(self.treeview)
+
+    def chunk_coords_by_tag(self):
         # Terminating mark to force the last chunk to be added
-        row_states.append(None)
+        row_states = [*self._get_row_states(), None]
 
         tagged_diffs: Mapping[str, List[Tuple[float, float]]]
         tagged_diffs = collections.defaultdict(list)
@@ -15,6 +15,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import collections
+import contextlib
 import copy
 import errno
 import functools
@@ -54,6 +55,8 @@ from meld.iohelpers import find_shared_parent_path, trash_or_confirm
 from meld.melddoc import ComparisonState, MeldDoc
 from meld.misc import all_same, apply_text_filters, with_focused_pane
 from meld.settings import bind_settings, get_meld_settings, settings
+from meld.task import CancellationToken, Offload
+from meld.tracing import traced_iter
 from meld.treehelpers import refocus_deleted_path, tree_path_as_tuple
 from meld.ui.cellrenderers import (
     CellRendererByteSize,
@@ -272,6 +275,51 @@ COL_EMBLEM, COL_SIZE, COL_TIME, COL_PERMS, COL_END = range(
 )
 
 
+def _list_folders(roots, name_filters, token):
+    """Read and stat the entries of a set of folders being compared
+
+    This is run off the main thread, and so must not touch any state
+    shared with it. If the token is cancelled, this stops early and the
+    returned listings are incomplete.
+
+    Returns a list with an item for each root, which is None if the
+    root isn't a folder, the OSError raised while listing it, or a
+    list of (name, stat) pairs for its entries. For each entry, stat is
+    None if the name can't be encoded, or the OSError raised by lstat.
+    """
+    listings = []
+    for root in roots:
+        if not os.path.isdir(root):
+            listings.append(None)
+            continue
+
+        try:
+            entries = os.listdir(root)
+        except OSError as err:
+            listings.append(err)
+            continue
+
+        for name_filter in name_filters:
+            entries = [e for e in entries if name_filter.match(e) is None]
+
+        listing = []
+        for e in entries:
+            if token.cancelled:
+                break
+            try:
+                e.encode("utf8")
+            except UnicodeEncodeError:
+                listing.append((e, None))
+                continue
+
+            try:
+                listing.append((e, os.lstat(os.path.join(root, e))))
+            except OSError as err:
+                listing.append((e, err))
+        listings.append(listing)
+    return listings
+
+
 class DirDiffTreeStore(tree.DiffTreeStore):
     def __init__(self, ntree):
         # FIXME: size should be a GObject.TYPE_UINT64, but we use -1 as a flag
@@ -966,9 +1014,11 @@ class DirDiff(Gtk.Box, MeldDoc):
         else:
             self._update_item_state(it)
         self._scan_in_progress += 1
-        self.scheduler.add_task(self._search_recursively_iter(path))
+        token = CancellationToken()
+        self.scheduler.add_task(self._search_recursively_iter(path, token), token=token)
 
-    def _search_recursively_iter(self, rootpath):
+    @traced_iter("dirdiff")
+    def _search_recursively_iter(self, rootpath, token):
         for t in self.treeview:
             sel = t.get_selection()
             sel.unselect_all()
@@ -1010,36 +1060,30 @@ class DirDiff(Gtk.Box, MeldDoc):
             dirs = CanonicalListing(self.num_panes, comparison_options)
             files = CanonicalListing(self.num_panes, comparison_options)
 
-            for pane, root in enumerate(roots):
-                if not os.path.isdir(root):
+            name_filters = [
+                f.filter for f in self.name_filters if f.active and f.filter is not None
+            ]
+            listings = yield Offload(_list_folders, roots, name_filters, token)
+
+            for pane, (root, listing) in enumerate(zip(roots, listings)):
+                if listing is None:
                     continue
 
-                try:
-                    entries = os.listdir(root)
-                except OSError as err:
-                    self.model.add_error(it, err.strerror, pane)
+                if isinstance(listing, OSError):
+                    self.model.add_error(it, listing.strerror, pane)
                     differences = True
                     continue
 
-                for f in self.name_filters:
-                    if not f.active or f.filter is None:
-                        continue
-                    entries = [e for e in entries if f.filter.match(e) is None]
-
-                for e in entries:
-                    try:
-                        e.encode("utf8")
-                    except UnicodeEncodeError:
+                for e, s in listing:
+                    if s is None:
                         invalid = e.encode("utf8", "surrogatepass")
                         printable = invalid.decode("utf8", "backslashreplace")
                         encoding_errors.append((pane, printable))
                         continue
 
-                    try:
-                        s = os.lstat(os.path.join(root, e))
                     # Covers certain unreadable symlink cases; see bgo#585895
-                    except OSError as err:
-                        error_string = e + err.strerror
+                    if isinstance(s, OSError):
+                        error_string = e + s.strerror
                         self.model.add_error(it, error_string, pane)
                         continue
 
@@ -1084,15 +1128,14 @@ class DirDiff(Gtk.Box, MeldDoc):
             allfiles = self._filter_on_state(roots, files.get())
 
             if alldirs or allfiles:
-                for names in alldirs:
-                    entries = [os.path.join(r, n) for r, n in zip(roots, names)]
-                    child = self.model.add_entries(it, entries)
-                    differences |= self._update_item_state(child)
+                entries = [
+                    [os.path.join(r, n) for r, n in zip(roots, names)]
+                    for names in alldirs + allfiles
+                ]
+                children, children_differ = self._add_item_rows(it, entries)
+                differences |= children_differ
+                for child in children[: len(alldirs)]:
                     todo.append(self.model.get_path(child))
-                for names in allfiles:
-                    entries = [os.path.join(r, n) for r, n in zip(roots, names)]
-                    child = self.model.add_entries(it, entries)
-                    differences |= self._update_item_state(child)
             else:
                 # Our subtree is empty, or has been filtered to be empty
                 if tree.STATE_NORMAL in self.state_filters or not all(
@@ -1807,6 +1850,48 @@ class DirDiff(Gtk.Box, MeldDoc):
         only place where row details are changed.
         """
         files = self.model.value_paths(it)
+        is_root = self.model.iter_is_root(it)
+        different, pane_values = self._get_item_state(files, is_root, it)
+        for j, values in enumerate(pane_values):
+            # Size is handled independently, because unsafe_set
+            # can't correctly box GObject.TYPE_INT64.
+            size = values.pop(COL_SIZE)
+            self.model.unsafe_set(it, j, values)
+            self.model.set(it, self.model.column_index(COL_SIZE, j), size)
+        return different
+
+    def _add_item_rows(self, parent, entries):
+        """Add fully populated rows for the given entries to parent
+
+        Each row's state is calculated before it is added, so that rows
+        are inserted in a single operation, and the chunk maps are
+        updated at most once for the whole batch.
+
+        Returns a list of the new rows' iters, and whether any of the
+        new rows are different.
+        """
+        differences = False
+        rows = []
+        for files in entries:
+            different, pane_values = self._get_item_state(files, False)
+            for values, path in zip(pane_values, files):
+                values[tree.COL_PATH] = path
+            rows.append(pane_values)
+            differences |= different
+
+        parent_path = self.model.get_path(parent)
+        with contextlib.ExitStack() as stack:
+            for chunkmap in self.chunkmap[: self.num_panes]:
+                stack.enter_context(chunkmap.batched_updates(parent_path))
+            iters = self.model.insert_rows(parent, rows)
+        return iters, differences
+
+    def _get_item_state(self, files, is_root, it=None):
+        """Calculate the display state of a set of files
+
+        Returns whether the files are different, and a list with a dict
+        of column values for each pane.
+        """
         regexes = [f.byte_filter for f in self.text_filters if f.active]
 
         def none_stat(f):
@@ -1829,8 +1914,6 @@ class DirDiff(Gtk.Box, MeldDoc):
         lstats = [none_lstat(f) for f in files[: self.num_panes]]
         symlinks = {i for i, s in enumerate(lstats) if s and stat.S_ISLNK(s.st_mode)}
 
-        is_root = self.model.iter_is_root(it)
-
         def name_override(i: int, file: str) -> str | None:
             if i in symlinks:
                 source = GLib.markup_escape_text(os.path.basename(file))
@@ -1876,40 +1959,40 @@ class DirDiff(Gtk.Box, MeldDoc):
         different = state not in {tree.STATE_NORMAL, tree.STATE_NOCHANGE}
 
         isdir = [os.path.isdir(files[j]) for j in range(self.model.ntree)]
+        pane_values = []
         for j in range(self.model.ntree):
             if stats[j]:
-                self.model.set_path_state(
-                    it, j, state, isdir[j], display_text=name_overrides[j]
+                label = name_overrides[j] or GLib.markup_escape_text(
+                    os.path.basename(files[j])
                 )
+                values = self.model.state_values(state, label, isdir[j])
 
-                if self.marked and self.marked.matches_iter(j, it):
+                if it and self.marked and self.marked.matches_iter(j, it):
                     emblem = EMBLEM_SELECTED
                 else:
                     emblem = EMBLEM_NEW if j in newest else None
 
-                self.model.unsafe_set(
-                    it, j, {COL_EMBLEM: emblem, COL_TIME: times[j], COL_PERMS: perms[j]}
+                values.update(
+                    {
+                        COL_EMBLEM: emblem,
+                        COL_TIME: times[j],
+                        COL_PERMS: perms[j],
+                        COL_SIZE: sizes[j],
+                    }
                 )
                 if j in symlinks:
-                    self.model.unsafe_set(
-                        it,
-                        j,
-                        {
-                            tree.COL_ICON: "symbolic-link-symbolic",
-                        },
-                    )
-                # Size is handled independently, because unsafe_set
-                # can't correctly box GObject.TYPE_INT64.
-                self.model.set(it, self.model.column_index(COL_SIZE, j), sizes[j])
+                    values[tree.COL_ICON] = "symbolic-link-symbolic"
             else:
-                self.model.set_path_state(it, j, tree.STATE_NONEXIST, any(isdir))
+                label = GLib.markup_escape_text(os.path.basename(files[j]))
+                values = self.model.state_values(tree.STATE_NONEXIST, label, any(isdir))
                 # Set sentinel values for time, size and perms
                 # TODO: change sentinels to float('nan'), pending:
                 #   https://gitlab.gnome.org/GNOME/glib/issues/183
-                self.model.unsafe_set(
-                    it, j, {COL_TIME: MISSING_TIMESTAMP, COL_SIZE: -1, COL_PERMS: -1}
+                values.update(
+                    {COL_TIME: MISSING_TIMESTAMP, COL_SIZE: -1, COL_PERMS: -1}
                 )
-        return different
+            pane_values.append(values)
+        return different, pane_values
 
     def set_num_panes(self, num_panes):
         if num_panes == self.num_panes or num_panes not in (1, 2, 3):
@@ -1941,7 +2024,9 @@ class DirDiff(Gtk.Box, MeldDoc):
         self.num_panes = num_panes
 
     def refresh(self):
-        self.set_locations()
+        # Refreshes often come in quick succession, e.g., from toggling
+        # several filters, so these are collapsed into a single rescan.
+        self.scheduler.add_task(self.set_locations, atfront=True, key="refresh")
 
     def recompute_label(self):
         root = self.model.get_iter_first()
@@ -16,8 +16,13 @@
 
 import copy
 import functools
+import itertools
 import logging
 import math
+import os
+import stat
+import time
+from collections import deque
 from typing import Callable, ClassVar, Optional, Tuple, Type
 
 from gi.repository import Adw, Gdk, Gio, GLib, GObject, Gtk, GtkSource
@@ -36,10 +41,19 @@ from meld.const import (
 )
 from meld.externalhelpers import open_files_external
 from meld.gutterrendererchunk import GutterRendererChunkLines
-from meld.iohelpers import find_shared_parent_path, prompt_save_filename
+from meld.iohelpers import (
+    files_identical,
+    find_shared_parent_path,
+    is_ascii_compatible,
+    prompt_save_filename,
+    read_text,
+    scan_file,
+)
 from meld.matchers.diffutil import Differ, merged_chunk_order
 from meld.matchers.helpers import CachedSequenceMatcher
+from meld.matchers.largefile import LargeFileComparison, LineIndex
 from meld.matchers.merge import AutoMergeDiffer, Merger
+from meld.matchers.myers import MyersSequenceMatcher
 from meld.meldbuffer import (
     BufferDeletionAction,
     BufferInsertionAction,
@@ -57,6 +71,8 @@ from meld.sourceview import (
     get_custom_encoding_candidates,
 )
 from meld.syncpoints import SyncpointAction, Syncpoints
+from meld.task import Offload
+from meld.tracing import frame_profiled, traced_iter
 from meld.ui.findbar import FindBar
 from meld.ui.util import (
     make_multiobject_property_action,
@@ -104,6 +120,18 @@ PANE_LEFT, PANE_RIGHT = -1, +1
 LOAD_PROGRESS_MARK = "meld-load-progress"
 #: Line length at which we'll cancel loads because of potential hangs
 LINE_LENGTH_LIMIT = 16 * 1024
+#: File size at or above which byte-identical files aren't loaded
+IDENTICAL_SKIP_SIZE = 4 * 1024 * 1024
+#: File size at or above which only changed regions are loaded
+LARGE_FILE_SIZE = 256 * 1024 * 1024
+#: Chunk text length above which inline highlighting is done line-by-line
+INLINE_LIMIT = 20000
+#: Chunk text length above which we don't do inline highlighting at all
+LINE_INLINE_LIMIT = 1000000
+#: Time in seconds that inline highlighting may use in a single frame
+HIGHLIGHT_FRAME_BUDGET = 0.004
+#: Number of inline highlight tags applied between frame budget checks
+HIGHLIGHT_BATCH_SIZE = 50
 
 
 class CursorDetails:
@@ -136,6 +164,7 @@ class FileDiff(Gtk.Box, MeldDoc):
 
     __gsettings_bindings_view__ = (
         ("ignore-blank-lines", "ignore-blank-lines"),
+        ("inline-granularity", "inline-granularity"),
         ("show-overview-map", "show-overview-map"),
         ("overview-map-style", "overview-map-style"),
     )
@@ -146,6 +175,12 @@ class FileDiff(Gtk.Box, MeldDoc):
         blurb="Whether to ignore blank lines when comparing file contents",
         default=False,
     )
+    inline_granularity = GObject.Property(
+        type=str,
+        nick="Inline highlighting granularity",
+        blurb="Whether to highlight inline changes by character or by word",
+        default="char",
+    )
     show_overview_map = GObject.Property(type=bool, default=True)
     overview_map_style = GObject.Property(type=str, default="chunkmap")
 
@@ -311,10 +346,24 @@ class FileDiff(Gtk.Box, MeldDoc):
         self.linediffer = self.differ()
         self.force_highlight = False
         self.force_load = False
+        self.load_identical = False
+        self.load_large_files = False
+        self._pipelined_pairs = set()
+        #: The most recently queued full comparison task
+        self._initial_comparison = None
 
         self.syncpoints = Syncpoints(self.textbuffer[:num_panes])
         self.in_nested_textview_gutter_expose = False
         self._cached_match = CachedSequenceMatcher(self.scheduler)
+        self._pending_highlights = deque()
+        self._highlight_tick_id = 0
+        self._highlight_idle_id = 0
+        self._text_generation = 0
+        #: Number of distinct inline highlight jobs carried over to a later
+        #: frame because the per-frame budget ran out
+        self.deferred_highlights = 0
+        # Jobs at the head of the queue already counted as deferred
+        self._counted_highlights = 0
 
         # Set up property actions for statusbar toggles
         sourceview_prop_actions = [
@@ -471,6 +520,10 @@ class FileDiff(Gtk.Box, MeldDoc):
             self.bind_property("action_mode", gutter, "action_mode")
             gutter.connect("chunk_action_activated", self.on_chunk_action_activated)
 
+        # Tick callbacks don't run while the view is unmapped, so
+        # pending highlighting is handed off to an idle handler instead
+        self.textview[0].connect("unmap", self._schedule_highlights)
+
         self.linediffer.connect("diffs-changed", self.on_diffs_changed)
         self.undosequence.connect("checkpointed", self.on_undo_checkpointed)
         self.undosequence.connect("can-undo", self.on_can_undo)
@@ -535,6 +588,7 @@ class FileDiff(Gtk.Box, MeldDoc):
             t.line_renderer = renderer
 
         self.connect("notify::ignore-blank-lines", self.refresh_comparison)
+        self.connect("notify::inline-granularity", self.refresh_comparison)
 
     def do_realize(self):
         Gtk.Box().do_realize(self)
@@ -1211,6 +1265,7 @@ class FileDiff(Gtk.Box, MeldDoc):
         self._set_focused_textview(None)
 
     def _after_text_modified(self, buf, startline, sizechange):
+        self._text_generation += 1
         if self.num_panes > 1:
             pane = self.textbuffer.index(buf)
             if not self.linediffer.syncpoints:
@@ -1361,6 +1416,8 @@ class FileDiff(Gtk.Box, MeldDoc):
         for buf in self.textbuffer:
             buf.data.disconnect_monitor()
 
+        self._clear_pending_highlights()
+
         try:
             self._cached_match.stop()
             self._cached_match = None
@@ -1577,7 +1634,14 @@ class FileDiff(Gtk.Box, MeldDoc):
         )
 
     def pre_comparison_init(self):
+        self.force_load = False
+        self.load_identical = False
+        self.load_large_files = False
         self._disconnect_buffer_handlers()
+        self._clear_pending_highlights()
+        for pair in self._pipelined_pairs:
+            self.scheduler.cancel_keyed_task(("pair", pair))
+        self._pipelined_pairs = set()
         self.linediffer.clear()
         for bufferlines in self.buffer_filtered:
             bufferlines.clear_cache()
@@ -1590,15 +1654,29 @@ class FileDiff(Gtk.Box, MeldDoc):
             if mgr.get_msg_id() in self.TRANSIENT_MESSAGES:
                 mgr.clear()
 
-    def set_files(self, gfiles, encodings=None):
+    def set_files(
+        self,
+        gfiles,
+        encodings=None,
+        *,
+        force_load=False,
+        load_identical=False,
+        load_large_files=False,
+    ):
         """Load the given files
 
         If an element is None, the text of a pane is left as is.
+
+        The keyword arguments skip the checks that would otherwise stop
+        files from being loaded in full, for this load only.
         """
         if len(gfiles) != self.num_panes:
             return
 
         self.pre_comparison_init()
+        self.force_load = force_load
+        self.load_identical = load_identical
+        self.load_large_files = load_large_files
         self.undosequence.clear()
 
         encodings = encodings or ((None,) * len(gfiles))
@@ -1611,16 +1689,155 @@ class FileDiff(Gtk.Box, MeldDoc):
                 self.textbuffer[pane].data.state = MeldBufferState.LOAD_FINISHED
 
         if not files:
-            self.scheduler.add_task(self._compare_files_internal())
+            self._queue_comparison()
+
+        if self._may_be_identical(files):
+            self.scheduler.add_task(self._load_unless_identical(files), key="load")
+            return
+
+        if self._use_large_file_mode(files):
+            self.scheduler.add_task(self._load_large_files(files), key="load")
+            return
 
         for pane, gfile, encoding in files:
             self.load_file_in_pane(pane, gfile, encoding)
 
+    def _stat_local_files(self, files) -> Optional[list[os.stat_result]]:
+        """Get stat results if all files are distinct, local regular files"""
+        if len(files) != self.num_panes or self.num_panes < 2:
+            return None
+        if self.comparison_mode == FileComparisonMode.AutoMerge:
+            return None
+
+        stats = []
+        for _pane, gfile, _encoding in files:
+            path = gfile.get_path()
+            if not path:
+                return None
+            try:
+                stats.append(os.stat(path))
+            except OSError:
+                return None
+
+        # Files compared to themselves get their own message after loading
+        if len({(s.st_dev, s.st_ino) for s in stats}) != len(stats):
+            return None
+        if not all(stat.S_ISREG(s.st_mode) for s in stats):
+            return None
+        return stats
+
+    def _may_be_identical(self, files) -> bool:
+        """Check whether files are worth checking for identical contents
+
+        Comparing the raw contents of large files is much cheaper than
+        loading and diffing them, but only if they're the same size.
+        """
+        if self.load_identical:
+            return False
+        stats = self._stat_local_files(files)
+        return (
+            stats is not None
+            and misc.all_same([s.st_size for s in stats])
+            and stats[0].st_size >= IDENTICAL_SKIP_SIZE
+        )
+
+    def _use_large_file_mode(self, files) -> bool:
+        """Check whether files are too large to load in full"""
+        if self.load_large_files or self.num_panes != 2:
+            return False
+        stats = self._stat_local_files(files)
+        return stats is not None and any(s.st_size >= LARGE_FILE_SIZE for s in stats)
+
+    def _load_unless_identical(self, files):
+        paths = [gfile.get_path() for _pane, gfile, _encoding in files]
+        try:
+            identical = yield Offload(files_identical, paths)
+        except OSError:
+            # Leave reporting any read errors to the normal load
+            identical = False
+
+        if not identical:
+            if self._use_large_file_mode(files):
+                yield from self._load_large_files(files)
+                return
+            for pane, gfile, encoding in files:
+                self.load_file_in_pane(pane, gfile, encoding)
+            return
+
+        # The panes stay bound to their files so that they can be loaded
+        # later, but can't be edited or saved until they are.
+        for pane, gfile, _encoding in files:
+            buf = self.textbuffer[pane]
+            self._set_pane_file(pane, gfile, MeldBufferState.EMPTY)
+            buf.set_text("")
+            buf.set_modified(False)
+            self.update_buffer_writable(buf)
+        self.recompute_label()
+        self._prompt_load_identical()
+
     def set_file(self, pane: int, gfile: Gio.File, encoding: GtkSource.Encoding = None):
         self.pre_comparison_init()
         self.undosequence.clear()
         self.load_file_in_pane(pane, gfile, encoding)
 
+    def _load_large_files(self, files):
+        """Load a condensed, read-only view of very large files
+
+        Rather than loading the files into their buffers, we index and
+        diff them from memory-mapped data, and then load only the lines
+        around each change. The condensed texts are then compared as
+        normal.
+        """
+        indexes = []
+        try:
+            for _pane, gfile, _encoding in files:
+                index = LineIndex(gfile.get_path())
+                indexes.append(index)
+                status = _("Indexing {file}").format(file=gfile.get_parse_name())
+                for _step in index.build_iter():
+                    yield status
+
+            comparison = LargeFileComparison(*indexes)
+            for _step in comparison.initialise():
+                yield _("Comparing large files")
+            texts = comparison.get_condensed_texts()
+        except (OSError, ValueError) as err:
+            log.warning("Couldn't index large files: %s", err)
+            texts = None
+        finally:
+            for index in indexes:
+                index.close()
+
+        if texts is None:
+            for pane, gfile, encoding in files:
+                self.load_file_in_pane(pane, gfile, encoding)
+            return
+
+        for (pane, gfile, _encoding), text in zip(files, texts):
+            buf = self.textbuffer[pane]
+            self._set_pane_file(pane, gfile, MeldBufferState.LOAD_FINISHED)
+            buf.data.condensed = True
+            buf.set_text(text)
+            buf.set_modified(False)
+            buf.data.update_mtime()
+            self.update_buffer_writable(buf)
+
+        self.recompute_label()
+        self._prompt_load_large_files()
+        self._queue_comparison()
+
+    def _set_pane_file(self, pane: int, gfile: Gio.File, state: MeldBufferState):
+        self.msgarea_mgr[pane].clear()
+
+        buf = self.textbuffer[pane]
+        buf.data.reset(gfile, state)
+        self.file_open_button[pane].props.file = gfile
+
+        self.filelabel[pane].props.parent_gfile = None
+        # FIXME: this was self.textbuffer[pane].data.label, which could be
+        # either a custom label or the fallback
+        self.filelabel[pane].props.gfile = gfile
+
     def load_file_in_pane(
         self, pane: int, gfile: Gio.File, encoding: GtkSource.Encoding = None
     ):
@@ -1633,16 +1850,35 @@ class FileDiff(Gtk.Box, MeldDoc):
         duplicate handlers, etc. if you don't do this thing.
         """
 
-        self.msgarea_mgr[pane].clear()
+        self._set_pane_file(pane, gfile, MeldBufferState.LOADING)
+        self.scheduler.add_task(
+            self._load_file_in_pane(pane, gfile, encoding), key=("load", pane)
+        )
 
+    def _load_file_in_pane(
+        self, pane: int, gfile: Gio.File, encoding: Optional[GtkSource.Encoding]
+    ):
         buf = self.textbuffer[pane]
-        buf.data.reset(gfile, MeldBufferState.LOADING)
-        self.file_open_button[pane].props.file = gfile
+        custom_candidates = get_custom_encoding_candidates()
+        if encoding:
+            custom_candidates = [encoding]
 
-        self.filelabel[pane].props.parent_gfile = None
-        # FIXME: this was self.textbuffer[pane].data.label, which could be
-        # either a custom label or the fallback
-        self.filelabel[pane].props.gfile = gfile
+        # For local files, we check for long lines and binary content on
+        # the raw bytes up front, rather than walking the loaded buffer.
+        # This only works for encodings that keep ASCII bytes as they
+        # are, so for e.g., UTF-16 we fall back to checking as we load.
+        scan = None
+        path = gfile.get_path()
+        if (
+            path
+            and not buf.data.is_special
+            and all(is_ascii_compatible(e.get_charset()) for e in custom_candidates)
+        ):
+            try:
+                scan = yield Offload(scan_file, path, LINE_LENGTH_LIMIT)
+            except (OSError, ValueError):
+                # Leave reporting any actual read errors to the loader
+                pass
 
         if buf.data.is_special:
             loader = GtkSource.FileLoader.new_from_stream(
@@ -1650,23 +1886,41 @@ class FileDiff(Gtk.Box, MeldDoc):
             )
         else:
             loader = GtkSource.FileLoader.new(buf, buf.data.sourcefile)
-
-        custom_candidates = get_custom_encoding_candidates()
-        if encoding:
-            custom_candidates = [encoding]
         if custom_candidates:
             loader.set_candidate_encodings(custom_candidates)
 
         buf.move_mark_by_name(LOAD_PROGRESS_MARK, buf.get_start_iter())
         cancellable = Gio.Cancellable()
         errors = {}
+        if scan and scan.long_line and not self.force_load:
+            line_number, line_length = scan.long_line
+            errors[pane] = self._long_line_error(line_number, line_length)
+            # Cancelling before we start means that the loader doesn't
+            # read the file at all, and reports back as a failed load.
+            cancellable.cancel()
+
         loader.load_async(
             GLib.PRIORITY_HIGH,
             cancellable=cancellable,
-            progress_callback=self.file_load_progress,
+            progress_callback=None if scan else self.file_load_progress,
             progress_callback_data=(loader, cancellable, errors),
             callback=self.file_loaded,
-            user_data=(pane, errors),
+            user_data=(pane, errors, scan.binary if scan else None),
+        )
+
+    def _long_line_error(self, line_number: int, line_length: int):
+        return (
+            FileLoadError.LINE_TOO_LONG,
+            _(
+                "Line {line_number} exceeded maximum line length "
+                "({line_length} > {LINE_LENGTH_LIMIT}).\n\n"
+                "Loading files with very long lines may make Meld slow or "
+                "unresponsive."
+            ).format(
+                line_number=line_number + 1,
+                line_length=line_length,
+                LINE_LENGTH_LIMIT=LINE_LENGTH_LIMIT,
+            ),
         )
 
     def get_comparison(self):
@@ -1716,18 +1970,8 @@ class FileDiff(Gtk.Box, MeldDoc):
             # Ideally we'd have custom GError handling here instead, but
             # set_error_if_cancelled() doesn't appear to work in pygobject
             # bindings.
-            errors[self.textbuffer.index(buffer)] = (
-                FileLoadError.LINE_TOO_LONG,
-                _(
-                    "Line {line_number} exceeded maximum line length "
-                    "({line_length} > {LINE_LENGTH_LIMIT}).\n\n"
-                    "Loading files with very long lines may make Meld slow or "
-                    "unresponsive."
-                ).format(
-                    line_number=failed_it.get_line() + 1,
-                    line_length=failed_it.get_chars_in_line(),
-                    LINE_LENGTH_LIMIT=LINE_LENGTH_LIMIT,
-                ),
+            errors[self.textbuffer.index(buffer)] = self._long_line_error(
+                failed_it.get_line(), failed_it.get_chars_in_line()
             )
             cancellable.cancel()
 
@@ -1739,11 +1983,11 @@ class FileDiff(Gtk.Box, MeldDoc):
         self,
         loader: GtkSource.FileLoader,
         result: Gio.AsyncResult,
-        user_data: Tuple[int, dict[int, str]],
+        user_data: Tuple[int, dict[int, str], Optional[bool]],
     ):
         gfile = loader.get_location()
         buf = loader.get_buffer()
-        pane, errors = user_data
+        pane, errors, binary = user_data
 
         try:
             loader.load_finish(result)
@@ -1785,14 +2029,17 @@ class FileDiff(Gtk.Box, MeldDoc):
                 )
             buf.data.state = MeldBufferState.LOAD_ERROR
 
-        start, end = buf.get_bounds()
-        buffer_text = buf.get_text(start, end, False)
+        if binary is None:
+            # We couldn't check the raw file before loading, so look for
+            # the escaped NUL bytes that the loader will have inserted.
+            start, end = buf.get_bounds()
+            binary = "\\00" in buf.get_text(start, end, False)
 
         # Don't risk overwriting a more-important "we didn't load the file
         # correctly" message with this semi-helpful "is it binary?" prompt
         if (
             not loader.get_encoding()
-            and "\\00" in buffer_text
+            and binary
             and not self.msgarea_mgr[pane].has_message()
         ):
             filename = GLib.markup_escape_text(gfile.get_parse_name())
@@ -1821,10 +2068,46 @@ class FileDiff(Gtk.Box, MeldDoc):
 
         buffer_states = [b.data.state for b in self.textbuffer[: self.num_panes]]
         if all(state == MeldBufferState.LOAD_FINISHED for state in buffer_states):
-            self.scheduler.add_task(self._compare_files_internal())
+            self._queue_comparison()
+        else:
+            self._queue_loaded_pair_diffs()
 
         self.recompute_label()
 
+    def _queue_loaded_pair_diffs(self):
+        """Start diffing pane pairs whose files have finished loading
+
+        In three-way comparisons, this lets us get on with diffing as
+        soon as a pair is available, instead of waiting for a slow load
+        in the third pane. The full comparison then picks up the
+        finished pair diffs.
+        """
+        if (
+            self.num_panes != 3
+            or self.comparison_mode == FileComparisonMode.AutoMerge
+            or self.linediffer.syncpoints
+        ):
+            return
+
+        loaded = [
+            b.data.state == MeldBufferState.LOAD_FINISHED
+            for b in self.textbuffer[: self.num_panes]
+        ]
+        for pair, pane in enumerate((0, 2)):
+            if not (loaded[1] and loaded[pane]) or pair in self._pipelined_pairs:
+                continue
+            self._pipelined_pairs.add(pair)
+            self.scheduler.add_task(self._diff_pair(pair), key=("pair", pair))
+
+    def _diff_pair(self, pair):
+        labels = [self.textbuffer[pane].data.label for pane in (1, pair * 2)]
+        status = _("Comparing {first} and {second}").format(
+            first=labels[0], second=labels[1]
+        )
+        texts = self.buffer_filtered[: self.num_panes]
+        for _step in self.linediffer.diff_pair_iter(texts, pair):
+            yield status
+
     def _merge_files(self):
         if self.comparison_mode == FileComparisonMode.AutoMerge:
             merger = Merger()
@@ -1839,6 +2122,7 @@ class FileDiff(Gtk.Box, MeldDoc):
         else:
             yield 1
 
+    @traced_iter("filediff")
     def _diff_files(self, refresh=False):
         texts = self.buffer_filtered[: self.num_panes]
         self.linediffer.ignore_blanks = self.props.ignore_blank_lines
@@ -1914,15 +2198,114 @@ class FileDiff(Gtk.Box, MeldDoc):
             primary,
             secondary,
             _("_Reload"),
-            self.revert_pane,
+            self.reload_pane,
             pane,
         )
 
+    def reload_pane(self, pane):
+        """Reload a pane's file after it has changed on disk
+
+        Where possible, the changes on disk are applied to the existing
+        buffer as edits, so that only the affected chunks are updated
+        and the cursor, scroll position and syncpoints are kept.
+        """
+        buf = self.textbuffer[pane]
+        if not self._can_reload_incrementally(buf):
+            self.revert_pane(pane)
+            return
+        self.scheduler.add_task(
+            self._reload_pane_incrementally(pane), key=("reload", pane)
+        )
+
+    def _can_reload_incrementally(self, buf):
+        data = buf.data
+        return (
+            data.state == MeldBufferState.LOAD_FINISHED
+            and not data.condensed
+            and not buf.get_modified()
+            # Without our buffer handlers, edits wouldn't update the
+            # comparison, e.g., while a comparison is still running.
+            and bool(buf.handlers)
+            and data.gfile is not None
+            and data.gfile.get_path() is not None
+            # Without a known encoding, only the loader can decode it
+            and data.encoding is not None
+            and buf.props.implicit_trailing_newline
+        )
+
+    def _reload_pane_incrementally(self, pane):
+        buf = self.textbuffer[pane]
+        data = buf.data
+        # The pane may have changed since the reload was queued
+        if not self._can_reload_incrementally(buf):
+            self.revert_pane(pane)
+            return
+        try:
+            text = yield Offload(
+                read_text,
+                data.gfile.get_path(),
+                data.encoding.get_charset(),
+                LINE_LENGTH_LIMIT,
+            )
+        except (OSError, LookupError, UnicodeDecodeError) as err:
+            log.debug("Couldn't reload %s in place: %s", data.label, err)
+            text = None
+
+        # The buffer may have been edited or reloaded while we read
+        if text is None or not self._can_reload_incrementally(buf):
+            self.revert_pane(pane)
+            return
+
+        old_lines = buf.get_text(*buf.get_bounds(), False).splitlines(True)
+        new_lines = text.splitlines(True)
+        matcher = MyersSequenceMatcher(None, old_lines, new_lines)
+        work = matcher.initialise()
+        status = _("Reloading {file}").format(file=data.label)
+        while next(work) is None:
+            yield status
+        if not self._can_reload_incrementally(buf):
+            self.revert_pane(pane)
+            return
+
+        # Apply changes from the end of the buffer, so that the
+        # offsets of earlier changes stay valid.
+        offsets = list(itertools.accumulate(map(len, old_lines), initial=0))
+        buf.begin_user_action()
+        for chunk in reversed(matcher.get_difference_opcodes()):
+            start = buf.get_iter_at_offset(offsets[chunk.start_a])
+            if chunk.end_a > chunk.start_a:
+                end = buf.get_iter_at_offset(offsets[chunk.end_a])
+                buf.delete(start, end)
+            if chunk.end_b > chunk.start_b:
+                buf.insert(start, "".join(new_lines[chunk.start_b : chunk.end_b]))
+        buf.end_user_action()
+
+        # The reload is a single undoable action, after which the
+        # buffer matches the file on disk.
+        self.undosequence.checkpoint(buf)
+        data.update_mtime()
+        if self.linediffer.syncpoints:
+            # Live updating is disabled with syncpoints, so refresh
+            self.refresh_comparison()
+
     def refresh_comparison(self, *args):
         """Refresh the view by clearing and redoing all comparisons"""
         self.pre_comparison_init()
         self.queue_draw()
-        self.scheduler.add_task(self._diff_files(refresh=True))
+        self._queue_comparison(refresh=True)
+
+    def _queue_comparison(self, refresh=False):
+        # Comparisons and refreshes share a key, so that each replaces
+        # the other rather than both running in full. Refreshing during
+        # the initial comparison restarts it, so that its merging and
+        # cursor placement still happen.
+        running = self.scheduler.keyed_tasks.get("compare")
+        if refresh and (running is None or running is not self._initial_comparison):
+            task = self._diff_files(refresh=True)
+        else:
+            task = self._compare_files_internal()
+            self._initial_comparison = task
+        self.scheduler.add_task(task, key="compare")
 
     def _set_merge_action_sensitivity(self):
         if self.focus_pane:
@@ -1959,6 +2342,7 @@ class FileDiff(Gtk.Box, MeldDoc):
             )
 
         for textview in self.textview:
+            textview.invalidate_chunk_layer()
             textview.line_renderer.queue_draw()
 
         removed_chunks, added_chunks, modified_chunks = chunk_changes
@@ -2000,82 +2384,17 @@ class FileDiff(Gtk.Box, MeldDoc):
                 text1 = bufs[0].get_text(*buf_from_iters, False)
                 textn = bufs[1].get_text(*buf_to_iters, False)
 
-                # Bail on long sequences, rather than try a slow comparison
-                inline_limit = 20000
-                if len(text1) + len(textn) > inline_limit and not self.force_highlight:
+                # Long sequences are too slow to compare as a whole, so we
+                # pair up their lines and compare those instead. We bail
+                # entirely on very long sequences.
+                text_length = len(text1) + len(textn)
+                by_lines = text_length > INLINE_LIMIT and not self.force_highlight
+                if text_length > LINE_INLINE_LIMIT and not self.force_highlight:
                     bufs[0].apply_tag(tags[0], *buf_from_iters)
                     bufs[1].apply_tag(tags[1], *buf_to_iters)
                     self._prompt_long_highlighting()
                     continue
 
-                def apply_highlight(
-                    bufs, tags, start_marks, end_marks, texts, to_pane, chunk, matches
-                ):
-                    starts = [
-                        bufs[0].get_iter_at_mark(start_marks[0]),
-                        bufs[1].get_iter_at_mark(start_marks[1]),
-                    ]
-                    ends = [
-                        bufs[0].get_iter_at_mark(end_marks[0]),
-                        bufs[1].get_iter_at_mark(end_marks[1]),
-                    ]
-
-                    bufs[0].delete_mark(start_marks[0])
-                    bufs[0].delete_mark(end_marks[0])
-                    bufs[1].delete_mark(start_marks[1])
-                    bufs[1].delete_mark(end_marks[1])
-
-                    if not self.linediffer.has_chunk(to_pane, chunk):
-                        return
-
-                    text1 = bufs[0].get_text(starts[0], ends[0], False)
-                    textn = bufs[1].get_text(starts[1], ends[1], False)
-
-                    if texts != (text1, textn):
-                        return
-
-                    if clear:
-                        bufs[0].remove_tag(tags[0], starts[0], ends[0])
-                        bufs[1].remove_tag(tags[1], starts[1], ends[1])
-
-                    offsets = [
-                        ends[0].get_offset() - starts[0].get_offset(),
-                        ends[1].get_offset() - starts[1].get_offset(),
-                    ]
-
-                    def process_matches(match):
-                        if match.tag != "equal":
-                            return True
-                        # Always keep matches occurring at the start or end
-                        is_start = match.start_a == 0 and match.start_b == 0
-                        is_end = match.end_a == offsets[0] and match.end_b == offsets[1]
-                        if is_start or is_end:
-                            return False
-                        # Remove equal matches of size less than 3
-                        too_short = (match.end_a - match.start_a < 3) or (
-                            match.end_b - match.start_b < 3
-                        )
-                        return too_short
-
-                    matches = [m for m in matches if process_matches(m)]
-
-                    for i in range(2):
-                        start, end = starts[i].copy(), starts[i].copy()
-                        offset = start.get_offset()
-                        for o in matches:
-                            start.set_offset(offset + o[1 + 2 * i])
-                            end.set_offset(offset + o[2 + 2 * i])
-
-                            # Check whether the identified difference is just a
-                            # combining diacritic. If so, we want to highlight
-                            # the visual character it's a part of
-                            if not start.is_cursor_position():
-                                start.backward_cursor_position()
-                            if not end.is_cursor_position():
-                                end.forward_cursor_position()
-
-                            bufs[i].apply_tag(tags[i], start, end)
-
                 start_marks = [
                     bufs[0].create_mark(None, buf_from_iters[0], True),
                     bufs[1].create_mark(None, buf_to_iters[0], True),
@@ -2085,7 +2404,7 @@ class FileDiff(Gtk.Box, MeldDoc):
                     bufs[1].create_mark(None, buf_to_iters[1], True),
                 ]
                 match_cb = functools.partial(
-                    apply_highlight,
+                    self._queue_inline_highlight,
                     bufs,
                     tags,
                     start_marks,
@@ -2093,8 +2412,15 @@ class FileDiff(Gtk.Box, MeldDoc):
                     (text1, textn),
                     to_pane,
                     chunk,
+                    clear,
+                )
+                self._cached_match.match(
+                    text1,
+                    textn,
+                    match_cb,
+                    by_lines=by_lines,
+                    granularity=self.props.inline_granularity,
                 )
-                self._cached_match.match(text1, textn, match_cb)
 
         self._cached_match.clean(self.linediffer.diff_count())
 
@@ -2175,6 +2501,187 @@ class FileDiff(Gtk.Box, MeldDoc):
                 if m.get_msg_id() == FileDiff.MSG_SAME:
                     m.clear()
 
+    def _queue_inline_highlight(self, *args):
+        """Queue inline highlighting for a chunk to be applied per-frame
+
+        Tag application is batched across matcher results and done from
+        a tick callback within a per-frame time budget, so that streams
+        of results for files with many small differences don't cause
+        dropped frames. If the view isn't mapped, the queue is drained
+        from a low-priority idle handler instead.
+        """
+        job = self._inline_highlight_iter(*args)
+        # Prime the job, so that closing it always cleans up its marks
+        next(job)
+        self._pending_highlights.append(job)
+        self._schedule_highlights()
+
+    def _schedule_highlights(self, *args):
+        if not self._pending_highlights or self._highlight_idle_id:
+            return
+
+        view = self.textview[0]
+        if view.get_mapped():
+            if not self._highlight_tick_id:
+                self._highlight_tick_id = view.add_tick_callback(
+                    self._on_highlight_tick
+                )
+            return
+
+        if self._highlight_tick_id:
+            view.remove_tick_callback(self._highlight_tick_id)
+            self._highlight_tick_id = 0
+        self._highlight_idle_id = GLib.idle_add(
+            self._on_highlight_idle, priority=GLib.PRIORITY_LOW
+        )
+
+    def _clear_pending_highlights(self):
+        if self._highlight_tick_id:
+            self.textview[0].remove_tick_callback(self._highlight_tick_id)
+            self._highlight_tick_id = 0
+        if self._highlight_idle_id:
+            GLib.source_remove(self._highlight_idle_id)
+            self._highlight_idle_id = 0
+        while self._pending_highlights:
+            self._pending_highlights.popleft().close()
+        self._counted_highlights = 0
+
+    def _run_highlight_jobs(self):
+        """Run queued highlight jobs until the frame budget is used up
+
+        Returns whether any jobs remain queued.
+        """
+        deadline = time.perf_counter() + HIGHLIGHT_FRAME_BUDGET
+        while self._pending_highlights:
+            try:
+                next(self._pending_highlights[0])
+            except StopIteration:
+                self._pending_highlights.popleft()
+                if self._counted_highlights:
+                    self._counted_highlights -= 1
+            if time.perf_counter() > deadline:
+                break
+
+        if not self._pending_highlights:
+            return False
+
+        # Only count jobs the first time they're carried over
+        remaining = len(self._pending_highlights)
+        self.deferred_highlights += remaining - self._counted_highlights
+        self._counted_highlights = remaining
+        log.debug(
+            "Deferred %d inline highlight jobs to a later frame (%d total)",
+            remaining,
+            self.deferred_highlights,
+        )
+        return True
+
+    def _on_highlight_tick(self, widget, frame_clock):
+        if self._run_highlight_jobs():
+            return GLib.SOURCE_CONTINUE
+
+        self._highlight_tick_id = 0
+        return GLib.SOURCE_REMOVE
+
+    def _on_highlight_idle(self):
+        if self._run_highlight_jobs():
+            return GLib.SOURCE_CONTINUE
+
+        self._highlight_idle_id = 0
+        return GLib.SOURCE_REMOVE
+
+    def _inline_highlight_iter(
+        self, bufs, tags, start_marks, end_marks, texts, to_pane, chunk, clear, matches
+    ):
+        """Apply inline highlight tags for a chunk in batches
+
+        This yields after every batch of tags. Since the buffers may be
+        edited between batches, chunk bounds are retrieved from marks
+        each time, and the chunk is revalidated after any edit.
+        """
+
+        def get_bounds():
+            starts = [
+                bufs[0].get_iter_at_mark(start_marks[0]),
+                bufs[1].get_iter_at_mark(start_marks[1]),
+            ]
+            ends = [
+                bufs[0].get_iter_at_mark(end_marks[0]),
+                bufs[1].get_iter_at_mark(end_marks[1]),
+            ]
+            return starts, ends
+
+        def is_valid(starts, ends):
+            if not self.linediffer.has_chunk(to_pane, chunk):
+                return False
+            text1 = bufs[0].get_text(starts[0], ends[0], False)
+            textn = bufs[1].get_text(starts[1], ends[1], False)
+            return texts == (text1, textn)
+
+        try:
+            yield
+            starts, ends = get_bounds()
+            generation = self._text_generation
+            if not is_valid(starts, ends):
+                return
+
+            if clear:
+                bufs[0].remove_tag(tags[0], starts[0], ends[0])
+                bufs[1].remove_tag(tags[1], starts[1], ends[1])
+
+            offsets = [
+                ends[0].get_offset() - starts[0].get_offset(),
+                ends[1].get_offset() - starts[1].get_offset(),
+            ]
+
+            def process_matches(match):
+                if match.tag != "equal":
+                    return True
+                # Always keep matches occurring at the start or end
+                is_start = match.start_a == 0 and match.start_b == 0
+                is_end = match.end_a == offsets[0] and match.end_b == offsets[1]
+                if is_start or is_end:
+                    return False
+                # Remove equal matches of size less than 3
+                too_short = (match.end_a - match.start_a < 3) or (
+                    match.end_b - match.start_b < 3
+                )
+                return too_short
+
+            matches = [m for m in matches if process_matches(m)]
+
+            for i in range(2):
+                for batch_start in range(0, len(matches), HIGHLIGHT_BATCH_SIZE):
+                    if batch_start or i:
+                        yield
+                        starts, ends = get_bounds()
+                        if generation != self._text_generation:
+                            generation = self._text_generation
+                            if not is_valid(starts, ends):
+                                return
+
+                    start, end = starts[i].copy(), starts[i].copy()
+                    offset = start.get_offset()
+                    batch_end = batch_start + HIGHLIGHT_BATCH_SIZE
+                    for o in matches[batch_start:batch_end]:
+                        start.set_offset(offset + o[1 + 2 * i])
+                        end.set_offset(offset + o[2 + 2 * i])
+
+                        # Check whether the identified difference is just a
+                        # combining diacritic. If so, we want to highlight
+                        # the visual character it's a part of
+                        if not start.is_cursor_position():
+                            start.backward_cursor_position()
+                        if not end.is_cursor_position():
+                            end.forward_cursor_position()
+
+                        bufs[i].apply_tag(tags[i], start, end)
+        finally:
+            bufs[0].delete_mark(start_marks[0])
+            bufs[0].delete_mark(end_marks[0])
+            bufs[1].delete_mark(start_marks[1])
+            bufs[1].delete_mark(end_marks[1])
+
     def _prompt_long_highlighting(self):
 
         def on_msgarea_highlighting_response(msgarea, respid):
@@ -2209,11 +2716,10 @@ class FileDiff(Gtk.Box, MeldDoc):
             for mgr in self.msgarea_mgr:
                 mgr.clear()
             if respid == Gtk.ResponseType.OK:
-                self.force_load = True
                 buffers = self.textbuffer[: self.num_panes]
                 gfiles = [b.data.gfile for b in buffers]
                 encodings = [b.data.encoding for b in buffers]
-                self.set_files(gfiles, encodings=encodings)
+                self.set_files(gfiles, encodings=encodings, force_load=True)
 
         mgr = self.msgarea_mgr[pane]
         msgarea = mgr.new_from_text_and_icon(
@@ -2224,6 +2730,56 @@ class FileDiff(Gtk.Box, MeldDoc):
         msgarea.add_button(_("_Load anyway"), Gtk.ResponseType.OK)
         msgarea.connect("response", on_load_anyway_response)
 
+    def _prompt_load_large_files(self):
+        def on_load_anyway_response(msgarea, respid):
+            for mgr in self.msgarea_mgr:
+                mgr.clear()
+            if respid == Gtk.ResponseType.OK:
+                buffers = self.textbuffer[: self.num_panes]
+                gfiles = [b.data.gfile for b in buffers]
+                encodings = [b.data.encoding for b in buffers]
+                self.set_files(gfiles, encodings=encodings, load_large_files=True)
+
+        for index, mgr in enumerate(self.msgarea_mgr[: self.num_panes]):
+            msgarea = mgr.new_from_text_and_icon(
+                _("Showing changes only"),
+                _(
+                    "These files are too large to load in full, so only the "
+                    "changed lines and their context are shown, and the files "
+                    "can't be edited. Line numbers in the margin don't match "
+                    "the files; markers between changes give the real ones."
+                ),
+            )
+            button = msgarea.add_button(_("Hide"), Gtk.ResponseType.CLOSE)
+            if index == 0:
+                button.props.label = _("Hi_de")
+            msgarea.add_button(_("_Load full files"), Gtk.ResponseType.OK)
+            msgarea.connect("response", on_load_anyway_response)
+
+    def _prompt_load_identical(self):
+        # Identical files weren't loaded, so offer to load them anyway
+        # in case the user wants to look at them.
+        def on_load_anyway_response(msgarea, respid):
+            for mgr in self.msgarea_mgr:
+                mgr.clear()
+            if respid == Gtk.ResponseType.OK:
+                buffers = self.textbuffer[: self.num_panes]
+                gfiles = [b.data.gfile for b in buffers]
+                encodings = [b.data.encoding for b in buffers]
+                self.set_files(gfiles, encodings=encodings, load_identical=True)
+
+        for index, mgr in enumerate(self.msgarea_mgr[: self.num_panes]):
+            msgarea = mgr.new_from_text_and_icon(
+                _("Files are identical"),
+                _("The files have identical contents, so they have not been loaded."),
+            )
+            mgr.set_msg_id(FileDiff.MSG_SAME)
+            button = msgarea.add_button(_("Hide"), Gtk.ResponseType.CLOSE)
+            if index == 0:
+                button.props.label = _("Hi_de")
+            msgarea.add_button(_("_Load anyway"), Gtk.ResponseType.OK)
+            msgarea.connect("response", on_load_anyway_response)
+
     def on_msgarea_identical_response(self, msgarea, respid):
         for mgr in self.msgarea_mgr:
             mgr.clear()
@@ -2241,6 +2797,9 @@ class FileDiff(Gtk.Box, MeldDoc):
     def save_file(self, pane, saveas=False, force_overwrite=False):
         buf = self.textbuffer[pane]
         bufdata = buf.data
+        # Neither unloaded nor condensed buffers hold the file's contents
+        if bufdata.unloaded or bufdata.condensed:
+            return False
         if saveas or not (bufdata.gfile or bufdata.savefile) or not bufdata.writable:
             if pane == 0:
                 prompt = _("Save Left Pane As")
@@ -2349,7 +2908,11 @@ class FileDiff(Gtk.Box, MeldDoc):
         writable = buf.data.writable
         self.recompute_label()
         index = self.textbuffer.index(buf)
-        self.readonlytoggle[index].props.visible = not writable
+        # Condensed and unloaded views can't be made editable, so don't
+        # offer to
+        self.readonlytoggle[index].props.visible = not (
+            writable or buf.data.condensed or buf.data.unloaded
+        )
         self.set_buffer_editable(buf, writable)
 
     def set_buffer_editable(self, buf, editable):
@@ -2447,6 +3010,11 @@ class FileDiff(Gtk.Box, MeldDoc):
             return
 
         data = self.textbuffer[pane].data
+        if data.condensed:
+            # Condensed views are built from both files, so reload both
+            buffers = self.textbuffer[: self.num_panes]
+            self.set_files([b.data.gfile for b in buffers])
+            return
         self.set_file(pane, data.gfile, data.encoding)
 
     def action_refresh(self, *extra):
@@ -2474,6 +3042,7 @@ class FileDiff(Gtk.Box, MeldDoc):
             if adj is not adjustment:
                 adj.set_value(val)
 
+    @frame_profiled(lambda filediff, adjustment, master: filediff.textview[master])
     @with_scroll_lock("_sync_vscroll_lock")
     def _sync_vscroll(self, adjustment, master):
         syncpoint = misc.calc_syncpoint(adjustment)
@@ -2507,29 +3076,16 @@ class FileDiff(Gtk.Box, MeldDoc):
             adj = self.scrolledwindow[i].get_vadjustment()
 
             # Find the chunk, or more commonly the space between
-            # chunks, that contains the target line.
-            #
-            # This is a naive linear search that remains because it's
-            # never shown up in profiles. We can't reuse our line cache
+            # chunks, that contains the target line, and the matching
+            # line in the other pane. We can't reuse our line cache
             # here; it doesn't have the necessary information in three-
             # way diffs.
-            mbegin, mend = 0, self.textbuffer[master].get_line_count()
-            obegin, oend = 0, self.textbuffer[i].get_line_count()
-            for chunk in self.linediffer.pair_changes(master, i):
-                if chunk.start_a >= target_line:
-                    mend = chunk.start_a
-                    oend = chunk.start_b
-                    break
-                elif chunk.end_a >= target_line:
-                    mbegin, mend = chunk.start_a, chunk.end_a
-                    obegin, oend = chunk.start_b, chunk.end_b
-                    break
-                else:
-                    mbegin = chunk.end_a
-                    obegin = chunk.end_b
-
-            fraction = (target_line - mbegin) / ((mend - mbegin) or 1)
-            other_line = obegin + fraction * (oend - obegin)
+            correspondence = self.linediffer.pair_correspondence(master, i)
+            other_line = correspondence.map_line(
+                target_line,
+                self.textbuffer[master].get_line_count(),
+                self.textbuffer[i].get_line_count(),
+            )
 
             # At this point, we've identified the line within the
             # corresponding chunk that we want to sync to.
@@ -2610,6 +3166,7 @@ class FileDiff(Gtk.Box, MeldDoc):
         for w, i in zip(self.textview, range(self.num_panes)):
             w.chunk_iter = chunk_iter(i)
             w.current_chunk_check = current_chunk_check(i)
+            w.invalidate_chunk_layer()
 
         for w, i in zip(self.linkmap, (0, self.num_panes - 2)):
             w.associate(self, self.textview[i], self.textview[i + 1])
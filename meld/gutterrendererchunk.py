@@ -24,6 +24,7 @@ from gi.repository import Graphene, Gsk, GtkSource, Pango
 
 from meld.settings import get_meld_settings
 from meld.style import get_common_theme
+from meld.tracing import frame_profiled
 from meld.ui.gtkutil import alpha_tint
 
 
@@ -46,6 +47,10 @@ class GutterRendererChunkLines(GtkSource.GutterRendererText):
 
         self.num_line_digits = 0
         self.changed_handler_id = None
+        #: Chunk and background colour for each line being drawn,
+        #: resolved once per frame in do_begin()
+        self._line_chunks = []
+        self._first_line = 0
 
         meld_settings = get_meld_settings()
         meld_settings.connect("changed", self.on_setting_changed)
@@ -75,9 +80,10 @@ class GutterRendererChunkLines(GtkSource.GutterRendererText):
             self.cursor_handler_id = buf.connect("cursor-moved", self.on_cursor_moved)
             self.recalculate_size(buf)
 
-    def _measure_markup(self, markup):
-        layout = self.get_view().create_pango_layout()
-        layout.set_markup(markup)
+    def _measure_text(self, text):
+        # Line numbers are styled (e.g., bold) by our CSS, so measure
+        # with our own layout rather than the view's
+        layout = self.create_pango_layout(text)
         w, h = layout.get_size()
         return w / Pango.SCALE, h / Pango.SCALE
 
@@ -95,23 +101,60 @@ class GutterRendererChunkLines(GtkSource.GutterRendererText):
             return
 
         self.num_line_digits = num_digits
-        line_num_width, height = self._measure_markup(f"<b>{num_lines}</b>")
+        line_num_width, height = self._measure_text(str(num_lines))
         width = line_num_width + self.props.xpad * 2
         self.set_size_request(width, height)
 
     def on_cursor_moved(self, buf, *args):
         self.queue_draw()
 
+    def _resolve_chunk(self, idx, chunks):
+        if idx not in chunks:
+            chunk = self.linediffer.get_chunk(idx, self.from_pane, self.to_pane)
+            background_rgba = None
+            if chunk and chunk[1] != chunk[2]:
+                if self.props.view.current_chunk_check(chunk):
+                    background_rgba = self.chunk_highlights[chunk[0]]
+                else:
+                    background_rgba = self.fill_colors[chunk[0]]
+            chunks[idx] = (chunk, background_rgba)
+        return chunks[idx]
+
+    def do_begin(self, lines):
+        # Resolve chunks once for all of the lines being drawn, rather
+        # than looking up, and possibly reversing, a chunk per line.
+        first, last = lines.get_first(), lines.get_last()
+        chunks = {}
+        line_chunks = []
+        for line in range(first, last + 1):
+            idx = self.linediffer.locate_chunk(self.from_pane, line)[0]
+            if idx is None:
+                line_chunks.append((None, None))
+            else:
+                line_chunks.append(self._resolve_chunk(idx, chunks))
+        self._first_line = first
+        self._line_chunks = line_chunks
+
+        GtkSource.GutterRendererText.do_begin(self, lines)
+
+    def do_end(self):
+        self._line_chunks = []
+        GtkSource.GutterRendererText.do_end(self)
+
+    @frame_profiled(lambda renderer, *args: renderer.get_view())
     def do_snapshot_line(self, snapshot, lines, line):
-        idx = self.linediffer.locate_chunk(self.from_pane, line)[0]
-        if idx is not None:
-            self._chunk = self.linediffer.get_chunk(idx, self.from_pane, self.to_pane)
+        index = line - self._first_line
+        if 0 <= index < len(self._line_chunks):
+            chunk, background_rgba = self._line_chunks[index]
         else:
-            self._chunk = None
+            # Shouldn't happen, but handle lines outside of do_begin()
+            chunk, background_rgba = None, None
+            idx = self.linediffer.locate_chunk(self.from_pane, line)[0]
+            if idx is not None:
+                chunk, background_rgba = self._resolve_chunk(idx, {})
 
-        self.set_markup(f"<b>{line + 1}</b>", -1)
+        self.set_text(str(line + 1), -1)
 
-        chunk = self._chunk
         x, width = 0, self.get_width()
         y, height = lines.get_line_yrange(
             line, GtkSource.GutterRendererAlignmentMode.CELL
@@ -121,12 +164,7 @@ class GutterRendererChunkLines(GtkSource.GutterRendererText):
         # align correctly.
         height += 1
 
-        if chunk and chunk[1] != chunk[2]:
-            if self.props.view.current_chunk_check(chunk):
-                background_rgba = self.chunk_highlights[chunk[0]]
-            else:
-                background_rgba = self.fill_colors[chunk[0]]
-
+        if background_rgba is not None:
             rect = Graphene.Rect()
             rect.init(x, y + 1, width, height)
             snapshot.append_color(background_rgba, rect)
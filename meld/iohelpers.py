@@ -1,11 +1,15 @@
+import codecs
+import contextlib
 import logging
+import mmap
+import os
 import pathlib
-from typing import Optional, Sequence
+from typing import NamedTuple, Optional, Sequence, Tuple
 
 from gi.repository import Adw, Gio, GLib, Gtk
 
 from meld.conf import _
-from meld.misc import get_modal_parent
+from meld.misc import all_same, get_modal_parent
 
 log = logging.getLogger(__name__)
 
@@ -246,3 +250,141 @@ def is_file_on_tmpfs(gfile: Gio.File) -> bool:
         return Gio.unix_mount_get_fs_type(mount) == "tmpfs"
     except Exception:
         return False
+
+
+class FileScan(NamedTuple):
+    #: Whether the file contains NUL bytes
+    binary: bool
+    #: 0-based line number and length of the first over-long line
+    long_line: Optional[Tuple[int, int]]
+
+
+#: Byte order marks of encodings that don't keep ASCII bytes as they are
+WIDE_ENCODING_BOMS = (
+    codecs.BOM_UTF32_LE,
+    codecs.BOM_UTF32_BE,
+    codecs.BOM_UTF16_LE,
+    codecs.BOM_UTF16_BE,
+)
+
+
+def is_ascii_compatible(charset: str) -> bool:
+    """Whether a charset encodes newlines and NULs as single bytes
+
+    Raw byte checks for line lengths and binary content only work for
+    files in these encodings.
+    """
+    try:
+        return "\n\0".encode(charset) == b"\n\0"
+    except (LookupError, UnicodeError):
+        return False
+
+
+def count_newlines(data, end: int, block_size: int = 1024 * 1024) -> int:
+    """Count the newlines in data before end, a block at a time
+
+    This avoids copying everything before end when data is an mmap.
+    """
+    count = 0
+    for start in range(0, end, block_size):
+        count += data[start : min(start + block_size, end)].count(b"\n")
+    return count
+
+
+def find_long_line(data, limit: int) -> Optional[Tuple[int, int]]:
+    """Find the first line longer than limit characters in raw bytes
+
+    Rather than walking every line, this looks for the last newline
+    in each limit-sized window, so that a file is scanned in roughly
+    len(data) / limit steps. Candidate lines are decoded to check their
+    length in characters, assuming UTF-8.
+
+    Returns the 0-based line number and character length of the first
+    over-long line, or None if there isn't one.
+    """
+    size = len(data)
+    pos = 0
+    while pos + limit < size:
+        newline = data.rfind(b"\n", pos, pos + limit + 1)
+        if newline != -1:
+            pos = newline + 1
+            continue
+
+        end = data.find(b"\n", pos)
+        if end == -1:
+            end = size
+        # Handle old-style Mac line endings, which GtkSourceView also
+        # treats as line breaks
+        segments = bytes(data[pos:end]).split(b"\r")
+        for index, segment in enumerate(segments):
+            length = len(segment.decode("utf-8", "replace"))
+            if length > limit:
+                return count_newlines(data, pos) + index, length
+        pos = end + 1
+
+    return None
+
+
+def scan_file(path: str, line_length_limit: int) -> Optional[FileScan]:
+    """Check a file's raw bytes for binary content and over-long lines
+
+    This lets us decide whether a file is safe to load before giving
+    it to GtkSourceView, without iterating over its lines in a buffer.
+
+    Returns None if the file starts with a UTF-16 or UTF-32 byte order
+    mark, since its raw bytes can't be checked this way. Raises OSError
+    if the file can't be read.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return FileScan(binary=False, long_line=None)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:4].startswith(WIDE_ENCODING_BOMS):
+                return None
+            return FileScan(
+                binary=data.find(b"\0") != -1,
+                long_line=find_long_line(data, line_length_limit),
+            )
+
+
+def read_text(path: str, charset: str, line_length_limit: int) -> Optional[str]:
+    """Read and decode a text file as GtkSourceView would load it
+
+    A byte order mark and one trailing line break are removed, matching
+    GtkSourceView's loading of files into buffers with an implicit
+    trailing newline.
+
+    Returns None if the file looks binary or has over-long lines, since
+    those need the checks and prompts of a normal load. Raises OSError
+    if the file can't be read, and LookupError or UnicodeDecodeError if
+    it can't be decoded.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if b"\0" in data or find_long_line(data, line_length_limit):
+        return None
+
+    text = data.decode(charset)
+    text = text.removeprefix("\ufeff")
+    for newline in ("\r\n", "\n", "\r"):
+        if text.endswith(newline):
+            return text[: -len(newline)]
+    return text
+
+
+def files_identical(paths: Sequence[str], chunk_size: int = 1024 * 1024) -> bool:
+    """Check whether the given files have byte-identical contents
+
+    Files are read in chunks, so that differing files are usually
+    rejected without reading them in full.
+
+    Raises OSError if any file can't be read.
+    """
+    with contextlib.ExitStack() as stack:
+        handles = [stack.enter_context(open(path, "rb")) for path in paths]
+        while True:
+            chunks = [handle.read(chunk_size) for handle in handles]
+            if not all_same(chunks):
+                return False
+            if not chunks[0]:
+                return True
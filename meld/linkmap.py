@@ -14,26 +14,29 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-
-import math
-
-from gi.repository import Gdk, Gtk
+from gi.repository import Gsk, Gtk
 
 from meld.settings import get_meld_settings
 from meld.style import get_common_theme
+from meld.tracing import frame_profiled
 
 # Rounded rectangle corner radius for culled changes display
 RADIUS = 3
 
 
-class LinkMap(Gtk.DrawingArea):
+class LinkMap(Gtk.Widget):
     __gtype_name__ = "LinkMap"
 
     def __init__(self):
         self.filediff = None
         self.views = []
-
-        self.set_draw_func(self.draw)
+        #: Chunk line positions in each view's buffer coordinates, by
+        #: chunk index, valid while the geometry key is unchanged
+        self._chunk_geometry = {}
+        self._geometry_key = None
+        #: Last rendered node and the state it was rendered for
+        self._node = None
+        self._node_key = None
 
     def associate(self, filediff, left_view, right_view):
         self.filediff = filediff
@@ -41,6 +44,7 @@ class LinkMap(Gtk.DrawingArea):
         if self.get_direction() == Gtk.TextDirection.RTL:
             self.views.reverse()
         self.view_indices = [filediff.textview.index(t) for t in self.views]
+        self._geometry_key = None
 
         meld_settings = get_meld_settings()
         self.on_setting_changed(meld_settings, "style-scheme")
@@ -48,28 +52,65 @@ class LinkMap(Gtk.DrawingArea):
 
     def on_setting_changed(self, settings, key):
         if key == "font":
+            self._geometry_key = None
             self.queue_draw()
         elif key == "style-scheme":
             self.fill_colors, self.line_colors = get_common_theme()
-
-    def draw(self, _linkmap, context, width, height):
+            self._node_key = None
+
+    def _get_chunk_geometry(self, index, change):
+        """Get the line positions of a change in each view's buffer"""
+        geometry = self._chunk_geometry.get(index)
+        if geometry is None:
+            left_view, right_view = self.views
+            geometry = (
+                left_view.get_y_for_line_num(change[1]),
+                left_view.get_y_for_line_num(change[2]),
+                right_view.get_y_for_line_num(change[3]),
+                right_view.get_y_for_line_num(change[4]),
+            )
+            self._chunk_geometry[index] = geometry
+        return geometry
+
+    @frame_profiled()
+    def do_snapshot(self, snapshot):
         if not self.views:
             return
 
-        pix_start = [t.get_visible_rect().y for t in self.views]
+        visible_rects = [t.get_visible_rect() for t in self.views]
+        pix_start = [rect.y for rect in visible_rects]
         y_offset = [t.translate_coordinates(self, 0, 0)[1] + 1 for t in self.views]
+        width, height = self.get_width(), self.get_height()
 
-        clip_y = min(y_offset) - 1
-        clip_height = max(t.get_visible_rect().height for t in self.views) + 2
-        allocation = self.get_allocation()
-
-        stylecontext = self.get_style_context()
-        Gtk.render_background(
-            stylecontext, context, 0, clip_y, allocation.width, clip_height
+        # Line positions only move when the views' chunks, text or
+        # layout change; the generation covers the first two, and the
+        # adjustment bounds change as line heights are validated.
+        geometry_key = tuple(
+            (t.chunk_generation, t.get_vadjustment().get_upper()) for t in self.views
         )
-        context.set_line_width(1.0)
-
-        height = allocation.height
+        if geometry_key != self._geometry_key:
+            self._chunk_geometry = {}
+            self._geometry_key = geometry_key
+            self._node_key = None
+
+        # Redraws without scrolling, e.g., for cursor movement within
+        # the current chunk, can reuse the last rendering.
+        node_key = (
+            geometry_key,
+            tuple(pix_start),
+            tuple(y_offset),
+            width,
+            height,
+            self.filediff.cursor.chunk,
+        )
+        if node_key != self._node_key:
+            self._node = self._render(pix_start, y_offset, width, height)
+            self._node_key = node_key
+        if self._node:
+            snapshot.append_node(self._node)
+
+    def _render(self, pix_start, y_offset, width, height):
+        snapshot = Gtk.Snapshot()
         visible = [
             self.views[0].get_line_num_for_y(pix_start[0]),
             self.views[0].get_line_num_for_y(pix_start[0] + height),
@@ -78,62 +119,62 @@ class LinkMap(Gtk.DrawingArea):
         ]
 
         # For bezier control points
-        x_steps = [-0.5, allocation.width / 2, allocation.width + 0.5]
-        q_rad = math.pi / 2
-
+        x_steps = [-0.5, width / 2, width + 0.5]
+        stroke = Gsk.Stroke.new(1.0)
+        current_chunk = self.filediff.cursor.chunk
         left, right = self.view_indices
+        from_offset = y_offset[0] - pix_start[0]
+        to_offset = y_offset[1] - pix_start[1]
 
-        def view_offset_line(view_idx, line_num):
-            line_start = self.views[view_idx].get_y_for_line_num(line_num)
-            return line_start - pix_start[view_idx] + y_offset[view_idx]
-
-        for c in self.filediff.linediffer.pair_changes(left, right, visible):
+        changes = self.filediff.linediffer.indexed_pair_changes(left, right, visible)
+        for index, c in changes:
+            geometry = self._get_chunk_geometry(index, c)
             # f and t are short for "from" and "to"
-            f0, f1 = [view_offset_line(0, line) for line in c[1:3]]
-            t0, t1 = [view_offset_line(1, line) for line in c[3:5]]
+            f0, f1 = geometry[0] + from_offset, geometry[1] + from_offset
+            t0, t1 = geometry[2] + to_offset, geometry[3] + to_offset
             # We want the last pixel of the previous line
             f1 = f1 if f1 == f0 else f1 - 1
             t1 = t1 if t1 == t0 else t1 - 1
 
+            builder = Gsk.PathBuilder.new()
             # If either endpoint is completely off-screen, we cull for clarity
             if (t0 < 0 and t1 < 0) or (t0 > height and t1 > height):
                 if f0 == f1:
                     continue
-                context.arc(x_steps[0], f0 - 0.5 + RADIUS, RADIUS, q_rad * 3, 0)
-                context.arc(x_steps[0], f1 + 0.5 - RADIUS, RADIUS, 0, q_rad)
-                context.close_path()
+                x = x_steps[0]
+                builder.move_to(x, f0 - 0.5)
+                builder.arc_to(x + RADIUS, f0 - 0.5, x + RADIUS, f0 - 0.5 + RADIUS)
+                builder.line_to(x + RADIUS, f1 + 0.5 - RADIUS)
+                builder.arc_to(x + RADIUS, f1 + 0.5, x, f1 + 0.5)
+                builder.close()
             elif (f0 < 0 and f1 < 0) or (f0 > height and f1 > height):
                 if t0 == t1:
                     continue
-                context.arc_negative(
-                    x_steps[2], t0 - 0.5 + RADIUS, RADIUS, q_rad * 3, q_rad * 2
-                )
-                context.arc_negative(
-                    x_steps[2], t1 + 0.5 - RADIUS, RADIUS, q_rad * 2, q_rad
-                )
-                context.close_path()
+                x = x_steps[2]
+                builder.move_to(x, t0 - 0.5)
+                builder.arc_to(x - RADIUS, t0 - 0.5, x - RADIUS, t0 - 0.5 + RADIUS)
+                builder.line_to(x - RADIUS, t1 + 0.5 - RADIUS)
+                builder.arc_to(x - RADIUS, t1 + 0.5, x, t1 + 0.5)
+                builder.close()
             else:
-                context.move_to(x_steps[0], f0 - 0.5)
-                context.curve_to(
+                builder.move_to(x_steps[0], f0 - 0.5)
+                builder.cubic_to(
                     x_steps[1], f0 - 0.5, x_steps[1], t0 - 0.5, x_steps[2], t0 - 0.5
                 )
-                context.line_to(x_steps[2], t1 + 0.5)
-                context.curve_to(
+                builder.line_to(x_steps[2], t1 + 0.5)
+                builder.cubic_to(
                     x_steps[1], t1 + 0.5, x_steps[1], f1 + 0.5, x_steps[0], f1 + 0.5
                 )
-                context.close_path()
-
-            Gdk.cairo_set_source_rgba(context, self.fill_colors[c[0]])
-            context.fill_preserve()
+                builder.close()
 
-            chunk_idx = self.filediff.linediffer.locate_chunk(left, c[1])[0]
-            if chunk_idx == self.filediff.cursor.chunk:
+            path = builder.to_path()
+            snapshot.append_fill(path, Gsk.FillRule.WINDING, self.fill_colors[c[0]])
+            if index == current_chunk:
                 highlight = self.fill_colors["current-chunk-highlight"]
-                Gdk.cairo_set_source_rgba(context, highlight)
-                context.fill_preserve()
+                snapshot.append_fill(path, Gsk.FillRule.WINDING, highlight)
+            snapshot.append_stroke(path, stroke, self.line_colors[c[0]])
 
-            Gdk.cairo_set_source_rgba(context, self.line_colors[c[0]])
-            context.stroke()
+        return snapshot.to_node()
 
 
 LinkMap.set_css_name("link-map")
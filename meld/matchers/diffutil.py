@@ -14,7 +14,8 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from typing import ClassVar
+import bisect
+from typing import ClassVar, Iterable, Tuple
 
 from gi.repository import GObject
 
@@ -71,6 +72,53 @@ def consume_blank_lines(chunk, texts, pane1, pane2):
     return DiffChunk._make((tag, c1, c2, c3, c4))
 
 
+class LineCorrespondence:
+    """Mapping of line positions between two panes
+
+    Chunk boundaries for each pane are kept in parallel lists, so that
+    the chunk or the gap between chunks that contains a line can be
+    found by bisection rather than by scanning the chunk list.
+    """
+
+    def __init__(self, chunks: Iterable[DiffChunk]):
+        self.starts_a = []
+        self.ends_a = []
+        self.starts_b = []
+        self.ends_b = []
+        for chunk in chunks:
+            self.starts_a.append(chunk.start_a)
+            self.ends_a.append(chunk.end_a)
+            self.starts_b.append(chunk.start_b)
+            self.ends_b.append(chunk.end_b)
+
+    def get_ranges(self, line: float, len_a: int, len_b: int) -> Tuple[int, ...]:
+        """Get the corresponding line ranges in each pane around line
+
+        The ranges returned are those of the chunk containing line, or
+        of the unchanged lines between chunks that contain it.
+        """
+        index = bisect.bisect_left(self.ends_a, line)
+        if index < len(self.ends_a) and self.starts_a[index] < line:
+            return (
+                self.starts_a[index],
+                self.ends_a[index],
+                self.starts_b[index],
+                self.ends_b[index],
+            )
+
+        begin_a = self.ends_a[index - 1] if index else 0
+        begin_b = self.ends_b[index - 1] if index else 0
+        if index < len(self.starts_a):
+            return begin_a, self.starts_a[index], begin_b, self.starts_b[index]
+        return begin_a, len_a, begin_b, len_b
+
+    def map_line(self, line: float, len_a: int, len_b: int) -> float:
+        """Map a possibly fractional line position from pane a to pane b"""
+        begin_a, end_a, begin_b, end_b = self.get_ranges(line, len_a, len_b)
+        fraction = (line - begin_a) / ((end_a - begin_a) or 1)
+        return begin_b + fraction * (end_b - begin_b)
+
+
 class Differ(GObject.GObject):
     """Utility class to hold diff2 or diff3 chunks"""
 
@@ -93,9 +141,12 @@ class Differ(GObject.GObject):
         self._changed_chunks = tuple()
         self._merge_cache = []
         self._line_cache = [[], [], []]
+        self._correspondences = {}
         self.ignore_blanks = False
         self._initialised = False
         self._has_mergeable_changes = (False, False, False, False)
+        #: Opcodes for pairs diffed ahead of set_sequences_iter()
+        self._pair_diffs = {}
 
     def _update_merge_cache(self, texts):
         if self.num_sequences == 3:
@@ -145,6 +196,7 @@ class Differ(GObject.GObject):
                 self.conflicts.append(i)
 
         self._update_line_cache()
+        self._correspondences = {}
         self.emit("diffs-changed", chunk_changes)
 
     def _update_line_cache(self):
@@ -371,6 +423,12 @@ class Differ(GObject.GObject):
 
     def pair_changes(self, fromindex, toindex, lines=(None, None, None, None)):
         """Give all changes between file1 and either file0 or file2."""
+        for _index, change in self.indexed_pair_changes(fromindex, toindex, lines):
+            yield change
+
+    def indexed_pair_changes(self, fromindex, toindex, lines=(None, None, None, None)):
+        """Give changes as in pair_changes, with their chunk indices"""
+        start = 0
         if None not in lines:
             start1, end1 = self._range_from_lines(fromindex, lines[0:2])
             start2, end2 = self._range_from_lines(toindex, lines[2:4])
@@ -384,14 +442,25 @@ class Differ(GObject.GObject):
 
         if fromindex == 1:
             seq = toindex // 2
-            for c in merge_cache:
+            for i, c in enumerate(merge_cache, start):
                 if c[seq]:
-                    yield c[seq]
+                    yield i, c[seq]
         else:
             seq = fromindex // 2
-            for c in merge_cache:
+            for i, c in enumerate(merge_cache, start):
                 if c[seq]:
-                    yield reverse_chunk(c[seq])
+                    yield i, reverse_chunk(c[seq])
+
+    def pair_correspondence(self, fromindex, toindex):
+        """Get a LineCorrespondence for the changes between two files
+
+        Correspondences are built on first use after the diffs change.
+        """
+        key = (fromindex, toindex)
+        if key not in self._correspondences:
+            changes = self.pair_changes(fromindex, toindex)
+            self._correspondences[key] = LineCorrespondence(changes)
+        return self._correspondences[key]
 
     # FIXME: This is gratuitous copy-n-paste at this point
     def paired_all_single_changes(self, fromindex, toindex):
@@ -505,6 +574,34 @@ class Differ(GObject.GObject):
                 for c in self._auto_merge(using, texts):
                     yield c
 
+    def _pair_diff_iter(self, sequences, i):
+        if self.syncpoints:
+            syncpoints = [(s[i][0](), s[i][1]()) for s in self.syncpoints]
+            matcher = self._sync_matcher(
+                None, sequences[1], sequences[i * 2], syncpoints=syncpoints
+            )
+        else:
+            matcher = self._matcher(None, sequences[1], sequences[i * 2])
+        work = matcher.initialise()
+        while next(work) is None:
+            yield None
+        return matcher.get_difference_opcodes()
+
+    def diff_pair_iter(self, sequences, i):
+        """Diff a single pair of sequences ahead of set_sequences_iter()
+
+        This allows a pair to be compared as soon as both of its
+        sequences are available. Sequences are laid out as for
+        set_sequences_iter(), but only sequence 1 and sequence i * 2
+        are used. The result is used by the next call to
+        set_sequences_iter(), so the caller must ensure that the
+        pair's sequences don't change in the meantime, or call clear().
+        """
+        self._pair_diffs.pop(i, None)
+        opcodes = yield from self._pair_diff_iter(sequences, i)
+        self._pair_diffs[i] = opcodes
+        yield 1
+
     def set_sequences_iter(self, sequences):
         assert 0 <= len(sequences) <= 3
         self.diffs = [[], []]
@@ -512,22 +609,17 @@ class Differ(GObject.GObject):
         self.seqlength = [len(s) for s in sequences]
 
         for i in range(self.num_sequences - 1):
-            if self.syncpoints:
-                syncpoints = [(s[i][0](), s[i][1]()) for s in self.syncpoints]
-                matcher = self._sync_matcher(
-                    None, sequences[1], sequences[i * 2], syncpoints=syncpoints
-                )
-            else:
-                matcher = self._matcher(None, sequences[1], sequences[i * 2])
-            work = matcher.initialise()
-            while next(work) is None:
-                yield None
-            self.diffs[i] = matcher.get_difference_opcodes()
+            if i in self._pair_diffs:
+                self.diffs[i] = self._pair_diffs.pop(i)
+                continue
+            self.diffs[i] = yield from self._pair_diff_iter(sequences, i)
+        self._pair_diffs = {}
         self._initialised = True
         self._update_merge_cache(sequences)
         yield 1
 
     def clear(self):
+        self._pair_diffs = {}
         self.diffs = [[], []]
         self.seqlength = [0] * self.num_sequences
         self._initialised = False
@@ -1,31 +1,151 @@
+import array
+import collections
 import gc
 import logging
 import multiprocessing
 import queue
 import time
+from multiprocessing import shared_memory
+from typing import ClassVar, List, Optional, Tuple
 
 from gi.repository import GLib
 
 from meld.matchers import myers
+from meld.task import Priority
+from meld.tracing import traced
 
 log = logging.getLogger(__name__)
 
+#: Opcode tags, in the order used for their packed integer representation
+OPCODE_TAGS = ("equal", "replace", "delete", "insert")
+OPCODE_TAG_INDEX = {tag: i for i, tag in enumerate(OPCODE_TAGS)}
+
+
+def pack_opcodes(opcodes: List[myers.DiffChunk]) -> bytes:
+    """Pack opcodes into a flat array of integers
+
+    Each opcode is stored as five integers: the tag index followed by
+    the chunk's start and end offsets.
+    """
+    packed = array.array("q")
+    for tag, start_a, end_a, start_b, end_b in opcodes:
+        packed.extend((OPCODE_TAG_INDEX[tag], start_a, end_a, start_b, end_b))
+    return packed.tobytes()
+
+
+def unpack_opcodes(data: bytes) -> List[myers.DiffChunk]:
+    """Unpack opcodes packed by `pack_opcodes`"""
+    packed = array.array("q")
+    packed.frombytes(data)
+    return [
+        myers.DiffChunk(OPCODE_TAGS[packed[i]], *packed[i + 1 : i + 5])
+        for i in range(0, len(packed), 5)
+    ]
+
+
+class SharedTextRing:
+    """Ring buffer in shared memory for passing texts to a worker
+
+    Writing texts to shared memory avoids pickling and copying them
+    through a pipe. Regions are allocated contiguously, and are released
+    in the order they were allocated, which matches the order in which
+    our single worker processes tasks.
+    """
+
+    #: Size in bytes of the shared memory segment
+    SIZE = 4 * 1024 * 1024
+
+    def __init__(self):
+        self.shm = shared_memory.SharedMemory(create=True, size=self.SIZE)
+        # Deque of (task_id, start, end) for regions still in use
+        self.regions = collections.deque()
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def _allocate(self, length: int) -> Optional[int]:
+        if not self.regions:
+            return 0 if length <= self.SIZE else None
+
+        tail = self.regions[0][1]
+        head = self.regions[-1][2]
+        if head > tail:
+            if head + length <= self.SIZE:
+                return head
+            if length <= tail:
+                return 0
+        elif head + length <= tail:
+            return head
+        return None
+
+    def write(
+        self, task_id: int, text1: str, textn: str
+    ) -> Optional[Tuple[int, int, int]]:
+        """Write texts to the buffer, returning their location
+
+        If there is no space in the buffer, None is returned and the
+        caller should send the texts some other way.
+        """
+        data1 = text1.encode("utf-8")
+        datan = textn.encode("utf-8")
+        length = len(data1) + len(datan)
+        if not length:
+            return None
+        start = self._allocate(length)
+        if start is None:
+            return None
+        self.shm.buf[start : start + len(data1)] = data1
+        self.shm.buf[start + len(data1) : start + length] = datan
+        self.regions.append((task_id, start, start + length))
+        return start, len(data1), len(datan)
+
+    def release(self, task_id: int) -> None:
+        """Release regions for the given task and all earlier tasks"""
+        while self.regions and self.regions[0][0] <= task_id:
+            self.regions.popleft()
+
+    def close(self) -> None:
+        self.regions.clear()
+        self.shm.close()
+        self.shm.unlink()
+
+
+def read_shared_texts(
+    buf: memoryview, location: Tuple[int, int, int]
+) -> Tuple[str, str]:
+    start, length1, lengthn = location
+    mid, end = start + length1, start + length1 + lengthn
+    return (
+        str(buf[start:mid], "utf-8"),
+        str(buf[mid:end], "utf-8"),
+    )
+
 
 class MatcherWorker(multiprocessing.Process):
     END_TASK = -1
 
-    matcher_class = myers.InlineMyersSequenceMatcher
+    matcher_classes: ClassVar[dict] = {
+        "char": myers.InlineMyersSequenceMatcher,
+        "word": myers.TokenInlineMyersSequenceMatcher,
+    }
+    line_matcher_class = myers.LineAlignedInlineMatcher
 
-    def __init__(self, tasks, results):
+    def __init__(self, tasks, results, shm_name=None):
         super().__init__()
         self.tasks = tasks
         self.results = results
+        self.shm_name = shm_name
         self.daemon = True
 
     def run(self):
+        shm = None
+        if self.shm_name:
+            shm = shared_memory.SharedMemory(name=self.shm_name)
+
         while True:
             try:
-                task_id, (text1, textn) = self.tasks.get(timeout=1.0)
+                task_id, location, texts, mode = self.tasks.get(timeout=1.0)
             except queue.Empty:
                 if not multiprocessing.parent_process().is_alive():
                     break
@@ -35,12 +155,28 @@ class MatcherWorker(multiprocessing.Process):
                 break
 
             try:
-                matcher = self.matcher_class(None, text1, textn)
-                self.results.put((task_id, matcher.get_opcodes()))
+                if location is not None:
+                    text1, textn = read_shared_texts(shm.buf, location)
+                else:
+                    text1, textn = texts
+                granularity, by_lines = mode
+                matcher_class = self.matcher_classes[granularity]
+                if by_lines:
+                    matcher = self.line_matcher_class(
+                        None, text1, textn, inline_matcher_class=matcher_class
+                    )
+                else:
+                    matcher = matcher_class(None, text1, textn)
+                self.results.put((task_id, pack_opcodes(matcher.get_opcodes())))
             except Exception as e:
                 log.error("Exception while running diff: %s", e)
+                # Report the failure so that the match isn't left queued
+                self.results.put((task_id, None))
             time.sleep(0)
 
+        if shm is not None:
+            shm.close()
+
 
 class CachedSequenceMatcher:
     """Simple class for caching diff results, with LRU-based eviction
@@ -68,13 +204,19 @@ class CachedSequenceMatcher:
         # delayed until we're almost completely finished.
         self.results = multiprocessing.Queue(5)
         self.results.cancel_join_thread()
-        self.thread = MatcherWorker(self.tasks, self.results)
+        try:
+            self.ring = SharedTextRing()
+        except OSError:
+            log.warning("Shared memory unavailable; falling back to pipes")
+            self.ring = None
+        shm_name = self.ring.name if self.ring else None
+        self.thread = MatcherWorker(self.tasks, self.results, shm_name)
         self.task_id = 1
         self.queued_matches = {}
         GLib.idle_add(self.thread.start)
 
     def stop(self) -> None:
-        self.tasks.put((MatcherWorker.END_TASK, ("", "")))
+        self.tasks.put((MatcherWorker.END_TASK, None, None, None))
         if self.thread.is_alive():
             self.thread.join(self.TASK_GRACE_PERIOD)
             if self.thread.exitcode is None:
@@ -94,30 +236,56 @@ class CachedSequenceMatcher:
         self.tasks = None
         self.results = None
         self.thread = None
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
         gc.collect()
 
-    def match(self, text1, textn, cb):
-        texts = (text1, textn)
+    def match(self, text1, textn, cb, by_lines=False, granularity="char"):
+        """Request inline matches between two texts
+
+        :param by_lines: if True, lines are paired up first and matched
+            individually; this is much faster for long texts, but won't
+            find matches that cross line boundaries
+        :param granularity: either "char" to compare individual
+            characters, or "word" to compare words and punctuation
+        """
+        texts = (text1, textn, (granularity, by_lines))
         try:
             self.cache[texts][1] = time.time()
-            opcodes = self.cache[texts][0]
-            GLib.idle_add(lambda: cb(opcodes))
+            packed = self.cache[texts][0]
+            GLib.idle_add(lambda: cb(unpack_opcodes(packed)))
         except KeyError:
             GLib.idle_add(lambda: self.enqueue_task(texts, cb))
 
     def enqueue_task(self, texts, cb):
         if not bool(self.queued_matches):
-            self.scheduler.add_task(self.check_results)
+            # Highlights are shown as results come in, so polling for
+            # results is interactive work.
+            self.scheduler.add_task(self.check_results, priority=Priority.INTERACTIVE)
         self.queued_matches[self.task_id] = (texts, cb)
-        self.tasks.put((self.task_id, texts))
+        text1, textn, mode = texts
+        location = None
+        if self.ring is not None:
+            location = self.ring.write(self.task_id, text1, textn)
+        if location is not None:
+            self.tasks.put((self.task_id, location, None, mode))
+        else:
+            self.tasks.put((self.task_id, None, (text1, textn), mode))
         self.task_id += 1
 
+    @traced("matcher")
     def check_results(self):
         try:
-            task_id, opcodes = self.results.get(block=True, timeout=0.01)
+            task_id, packed = self.results.get_nowait()
+            if self.ring is not None:
+                self.ring.release(task_id)
             texts, cb = self.queued_matches.pop(task_id)
-            self.cache[texts] = [opcodes, time.time()]
-            GLib.idle_add(lambda: cb(opcodes))
+            # Matches that the worker failed on are dropped
+            if packed is not None:
+                # Cached results are kept packed, and only unpacked on use
+                self.cache[texts] = [packed, time.time()]
+                GLib.idle_add(lambda: cb(unpack_opcodes(packed)))
         except queue.Empty:
             pass
 
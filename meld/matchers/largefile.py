@@ -0,0 +1,361 @@
+"""Comparison of files too large to load into text buffers
+
+Rather than loading whole files, each file is memory-mapped and indexed
+by line hashes, and the diff is computed from those hashes. Only the
+changed regions, with some surrounding context, are then decoded for
+display, with each run of unchanged lines in between collapsed to a
+single marker line.
+
+Lines are only treated as equal by hash while diffing. Their bytes are
+compared afterwards, so a hash collision can't hide a change.
+"""
+
+import array
+import itertools
+import mmap
+import operator
+import os
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+from meld.conf import _
+from meld.matchers.myers import DiffChunk, MyersSequenceMatcher
+
+
+class ContextWindow(NamedTuple):
+    """Aligned line ranges around one or more chunks, shown in full"""
+
+    start_a: int
+    end_a: int
+    start_b: int
+    end_b: int
+
+
+class LineIndex:
+    """Line hashes and sparse line offsets for a memory-mapped file"""
+
+    #: Number of lines between each recorded line offset
+    OFFSET_INTERVAL = 64
+    #: Approximate number of bytes indexed in each step
+    BLOCK_SIZE = 16 * 1024 * 1024
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hashes = array.array("q")
+        self.offsets = array.array("q")
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.data = b""
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def close(self) -> None:
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def build_iter(self):
+        """Index the file's lines, yielding after each block of data
+
+        Splitting, hashing and offset calculation are all done over a
+        whole block at a time, to avoid a Python-level loop per line.
+        """
+        data = self.data
+        size = len(data)
+        start = 0
+        while start < size:
+            stop = start + self.BLOCK_SIZE
+            if stop >= size:
+                end = size
+            else:
+                newline = data.find(b"\n", stop)
+                end = size if newline == -1 else newline + 1
+
+            lines = data[start:end].split(b"\n")
+            # A trailing newline doesn't start another line
+            if not lines[-1]:
+                lines.pop()
+
+            first = (-len(self.hashes)) % self.OFFSET_INTERVAL
+            line_starts = itertools.accumulate(
+                map(operator.add, map(len, lines), itertools.repeat(1)),
+                initial=start,
+            )
+            self.offsets.extend(
+                itertools.islice(line_starts, first, len(lines), self.OFFSET_INTERVAL)
+            )
+            self.hashes.extend(map(hash, lines))
+
+            start = end
+            yield None
+        yield 1
+
+    def get_offset(self, line: int) -> int:
+        """Get the byte offset of the start of a line"""
+        if line >= len(self):
+            return len(self.data)
+        block, skip = divmod(line, self.OFFSET_INTERVAL)
+        pos = self.offsets[block]
+        for _i in range(skip):
+            pos = self.data.find(b"\n", pos) + 1
+        return pos
+
+    def get_content_end(self, line: int) -> int:
+        """Get the byte offset of the end of a line, before its newline"""
+        end = self.get_offset(line + 1)
+        if end > 0 and self.data[end - 1 : end] == b"\n":
+            end -= 1
+        return end
+
+    def get_lines(self, start: int, end: int) -> List[str]:
+        """Get the decoded text of lines from start to end"""
+        end = min(end, len(self))
+        if start >= end:
+            return []
+        block, skip = divmod(start, self.OFFSET_INTERVAL)
+        data = self.data
+        pos = self.offsets[block]
+        lines = []
+        for _i in range(skip + end - start):
+            newline = data.find(b"\n", pos)
+            if newline == -1:
+                lines.append(data[pos:])
+                break
+            lines.append(data[pos:newline])
+            pos = newline + 1
+        return [line.decode("utf-8", "replace") for line in lines[skip:]]
+
+
+def common_prefix_length(a, b, block_size: int = 4096) -> int:
+    """Get the number of equal items at the start of two sequences"""
+    length = min(len(a), len(b))
+    pos = 0
+    while pos < length:
+        end = min(pos + block_size, length)
+        # Comparing slices is much faster than comparing item by item
+        if a[pos:end] != b[pos:end]:
+            while a[pos] == b[pos]:
+                pos += 1
+            return pos
+        pos = end
+    return length
+
+
+def common_suffix_length(a, b, limit: int, block_size: int = 4096) -> int:
+    """Get the number of equal items, up to limit, at the end of two sequences"""
+    len_a, len_b = len(a), len(b)
+    pos = 0
+    while pos < limit:
+        end = min(pos + block_size, limit)
+        if a[len_a - end : len_a - pos] != b[len_b - end : len_b - pos]:
+            while a[len_a - pos - 1] == b[len_b - pos - 1]:
+                pos += 1
+            return pos
+        pos = end
+    return limit
+
+
+def equal_runs(
+    chunks: List[DiffChunk], len_a: int, len_b: int
+) -> Iterator[Tuple[int, int, int]]:
+    """Get (start_a, start_b, count) for the unchanged runs between chunks"""
+    pos_a = pos_b = 0
+    for chunk in chunks:
+        if chunk.start_a > pos_a:
+            yield pos_a, pos_b, chunk.start_a - pos_a
+        pos_a, pos_b = chunk.end_a, chunk.end_b
+    if len_a > pos_a:
+        yield pos_a, pos_b, len_a - pos_a
+
+
+def find_unequal_lines(
+    index_a: LineIndex,
+    index_b: LineIndex,
+    start_a: int,
+    start_b: int,
+    count: int,
+    block_size: int = 1024 * 1024,
+) -> Iterator[Optional[int]]:
+    """Find lines in a run with equal hashes whose bytes differ
+
+    Yields the position in the run of each differing line, and None
+    after each block of data compared.
+    """
+    data_a, data_b = index_a.data, index_b.data
+    end_a = index_a.get_content_end(start_a + count - 1)
+    end_b = index_b.get_content_end(start_b + count - 1)
+    line = 0
+    pos_a, pos_b = index_a.get_offset(start_a), index_b.get_offset(start_b)
+    while pos_a < end_a or pos_b < end_b:
+        size = min(block_size, max(end_a - pos_a, end_b - pos_b))
+        block_a = data_a[pos_a : min(pos_a + size, end_a)]
+        block_b = data_b[pos_b : min(pos_b + size, end_b)]
+        if block_a == block_b:
+            line += block_a.count(b"\n")
+            pos_a += len(block_a)
+            pos_b += len(block_b)
+            yield None
+            continue
+
+        diff = next(
+            (i for i, (x, y) in enumerate(zip(block_a, block_b)) if x != y),
+            min(len(block_a), len(block_b)),
+        )
+        line += block_a.count(b"\n", 0, diff)
+        yield line
+        line += 1
+        if line >= count:
+            break
+        pos_a = index_a.get_offset(start_a + line)
+        pos_b = index_b.get_offset(start_b + line)
+
+
+def merge_chunks(chunks: List[DiffChunk]) -> List[DiffChunk]:
+    """Sort chunks, merging adjacent chunks into replacements"""
+    merged: List[DiffChunk] = []
+    for chunk in sorted(chunks, key=lambda c: (c.start_a, c.start_b)):
+        last = merged[-1] if merged else None
+        if last and (last.end_a, last.end_b) == (chunk.start_a, chunk.start_b):
+            merged[-1] = DiffChunk(
+                "replace", last.start_a, chunk.end_a, last.start_b, chunk.end_b
+            )
+        else:
+            merged.append(chunk)
+    return merged
+
+
+def context_windows(
+    chunks: List[DiffChunk], len_a: int, len_b: int, context: int
+) -> List[ContextWindow]:
+    """Get the aligned line ranges to show for a set of chunks
+
+    Each chunk is extended by context lines on either side, and
+    overlapping windows are merged. Since the lines between chunks are
+    equal in both files, the ranges stay aligned.
+    """
+    windows: List[ContextWindow] = []
+    for chunk in chunks:
+        before = min(context, chunk.start_a, chunk.start_b)
+        after = min(context, len_a - chunk.end_a, len_b - chunk.end_b)
+        window = ContextWindow(
+            chunk.start_a - before,
+            chunk.end_a + after,
+            chunk.start_b - before,
+            chunk.end_b + after,
+        )
+        if windows and window.start_a <= windows[-1].end_a:
+            windows[-1] = windows[-1]._replace(end_a=window.end_a, end_b=window.end_b)
+        else:
+            windows.append(window)
+    return windows
+
+
+class LargeFileComparison:
+    """Diff two indexed files, and condense them for display"""
+
+    #: Number of unchanged lines shown around each chunk
+    context = 10
+
+    def __init__(self, index_a: LineIndex, index_b: LineIndex):
+        self.index_a = index_a
+        self.index_b = index_b
+        self.chunks: List[DiffChunk] = []
+
+    def initialise(self):
+        """Diff the files' line hashes, yielding None until finished
+
+        Only the lines between the files' common prefix and suffix are
+        passed to the matcher, so that large mostly-equal files don't
+        need their whole hash arrays copied and processed.
+        """
+        hashes_a, hashes_b = self.index_a.hashes, self.index_b.hashes
+        len_a, len_b = len(hashes_a), len(hashes_b)
+        prefix = common_prefix_length(hashes_a, hashes_b)
+        suffix = common_suffix_length(hashes_a, hashes_b, min(len_a, len_b) - prefix)
+        yield None
+
+        matcher = MyersSequenceMatcher(
+            None, hashes_a[prefix : len_a - suffix], hashes_b[prefix : len_b - suffix]
+        )
+        work = matcher.initialise()
+        while next(work) is None:
+            yield None
+        chunks = [
+            DiffChunk(
+                chunk.tag,
+                chunk.start_a + prefix,
+                chunk.end_a + prefix,
+                chunk.start_b + prefix,
+                chunk.end_b + prefix,
+            )
+            for chunk in matcher.get_difference_opcodes()
+        ]
+
+        # Lines are only known to be equal once their bytes are
+        collisions = []
+        for start_a, start_b, count in equal_runs(chunks, len_a, len_b):
+            runs = find_unequal_lines(
+                self.index_a, self.index_b, start_a, start_b, count
+            )
+            for line in runs:
+                if line is None:
+                    yield None
+                    continue
+                collisions.append(
+                    DiffChunk(
+                        "replace",
+                        start_a + line,
+                        start_a + line + 1,
+                        start_b + line,
+                        start_b + line + 1,
+                    )
+                )
+        self.chunks = merge_chunks(chunks + collisions) if collisions else chunks
+        yield 1
+
+    @staticmethod
+    def marker(start_a: int, start_b: int, count: int) -> str:
+        """Get the marker line for a run of unchanged lines
+
+        Markers give the run's real line numbers in both files, since
+        line numbers in the condensed view don't match the files.
+        """
+        return _(
+            "⋯ {count} unchanged lines: lines {start_a} to {end_a} on the left, "
+            "{start_b} to {end_b} on the right ⋯"
+        ).format(
+            count=count,
+            start_a=start_a + 1,
+            end_a=start_a + count,
+            start_b=start_b + 1,
+            end_b=start_b + count,
+        )
+
+    def get_condensed_texts(self) -> Tuple[str, str]:
+        """Get the texts to display for each file
+
+        The texts contain only the lines around changes, with runs of
+        unchanged lines replaced by identical marker lines in each
+        file, so that they compare as equal.
+        """
+        len_a, len_b = len(self.index_a), len(self.index_b)
+        windows = context_windows(self.chunks, len_a, len_b, self.context)
+
+        lines_a: List[str] = []
+        lines_b: List[str] = []
+        pos_a = pos_b = 0
+        for window in windows:
+            if window.start_a > pos_a:
+                marker = self.marker(pos_a, pos_b, window.start_a - pos_a)
+                lines_a.append(marker)
+                lines_b.append(marker)
+            lines_a.extend(self.index_a.get_lines(window.start_a, window.end_a))
+            lines_b.extend(self.index_b.get_lines(window.start_b, window.end_b))
+            pos_a, pos_b = window.end_a, window.end_b
+        if len_a > pos_a:
+            marker = self.marker(pos_a, pos_b, len_a - pos_a)
+            lines_a.append(marker)
+            lines_b.append(marker)
+
+        return "\n".join(lines_a), "\n".join(lines_b)
@@ -15,6 +15,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import difflib
+import re
 import typing
 
 if typing.TYPE_CHECKING:
@@ -450,3 +451,160 @@ class SyncPointMyersSequenceMatcher(MyersSequenceMatcher):
                 if size:
                     opcodes.append(("equal", ai, i, bj, j))
         return [DiffChunk._make(chunk) for chunk in opcodes]
+
+
+class TokenInlineMyersSequenceMatcher:
+    """Inline matcher that compares words, numbers and punctuation
+
+    Texts are split into tokens, each of which is mapped to an integer
+    ID, and the ID sequences are compared. The resulting opcodes are
+    mapped back to character offsets. Token-level differences are
+    usually more readable than character-level ones, and there are far
+    fewer tokens than characters to compare.
+    """
+
+    #: Words, identifiers and numbers; runs of whitespace; punctuation
+    token_re = re.compile(r"\w+|\s+|[^\w\s]")
+
+    def __init__(self, isjunk=None, a="", b=""):
+        if isjunk is not None:
+            raise NotImplementedError("isjunk is not supported yet")
+        self.a = a
+        self.b = b
+        self.opcodes = None
+
+    def tokenise(self, text, token_ids):
+        tokens, offsets = [], [0]
+        for match in self.token_re.finditer(text):
+            tokens.append(token_ids.setdefault(match.group(), len(token_ids)))
+            offsets.append(match.end())
+        return tokens, offsets
+
+    def get_opcodes(self):
+        if self.opcodes is not None:
+            return self.opcodes
+
+        token_ids = {}
+        a_tokens, a_offsets = self.tokenise(self.a, token_ids)
+        b_tokens, b_offsets = self.tokenise(self.b, token_ids)
+
+        matcher = MyersSequenceMatcher(None, a_tokens, b_tokens)
+        self.opcodes = [
+            DiffChunk(
+                chunk.tag,
+                a_offsets[chunk.start_a],
+                a_offsets[chunk.end_a],
+                b_offsets[chunk.start_b],
+                b_offsets[chunk.end_b],
+            )
+            for chunk in matcher.get_opcodes()
+        ]
+        return self.opcodes
+
+
+class LineAlignedInlineMatcher:
+    """Inline matcher that compares long chunks one line pair at a time
+
+    Running a character-level matcher over a large replaced block is
+    too slow to be useful. Instead, this matcher pairs up lines from
+    both sides using a cheap similarity measure, runs an inline matcher
+    over each pair, and combines the results into opcodes covering the
+    whole of both texts. Lines that can't be paired are reported as
+    changed in their entirety.
+    """
+
+    inline_matcher_class = InlineMyersSequenceMatcher
+
+    #: Number of upcoming lines considered as a pairing candidate
+    search_window = 8
+    #: Minimum quick ratio for two lines to be considered a pair
+    min_similarity = 0.5
+    #: Line pairs longer than this are marked as changed without matching
+    pair_limit = 20000
+
+    def __init__(self, isjunk=None, a="", b="", inline_matcher_class=None):
+        if isjunk is not None:
+            raise NotImplementedError("isjunk is not supported yet")
+        self.a = a
+        self.b = b
+        self.opcodes = None
+        if inline_matcher_class is not None:
+            self.inline_matcher_class = inline_matcher_class
+
+    @staticmethod
+    def line_offsets(lines):
+        offsets = [0]
+        for line in lines:
+            offsets.append(offsets[-1] + len(line))
+        return offsets
+
+    def align_lines(self, a_lines, b_lines):
+        """Greedily pair similar lines, preserving line order
+
+        Yields (a_index, b_index) pairs in increasing order.
+        """
+        matcher = difflib.SequenceMatcher(None, autojunk=False)
+        i = j = 0
+        while i < len(a_lines) and j < len(b_lines):
+            matcher.set_seq2(a_lines[i])
+            best, best_ratio = None, self.min_similarity
+            for k in range(j, min(j + self.search_window, len(b_lines))):
+                matcher.set_seq1(b_lines[k])
+                if matcher.real_quick_ratio() < best_ratio:
+                    continue
+                ratio = matcher.quick_ratio()
+                if ratio > best_ratio or (best is None and ratio == best_ratio):
+                    best, best_ratio = k, ratio
+            if best is not None:
+                yield i, best
+                j = best + 1
+            i += 1
+
+    def get_opcodes(self):
+        if self.opcodes is not None:
+            return self.opcodes
+
+        a_lines = self.a.splitlines(keepends=True)
+        b_lines = self.b.splitlines(keepends=True)
+        a_offsets = self.line_offsets(a_lines)
+        b_offsets = self.line_offsets(b_lines)
+
+        opcodes = []
+
+        def add_gap(start_a, end_a, start_b, end_b):
+            if start_a < end_a and start_b < end_b:
+                tag = "replace"
+            elif start_a < end_a:
+                tag = "delete"
+            elif start_b < end_b:
+                tag = "insert"
+            else:
+                return
+            opcodes.append(DiffChunk(tag, start_a, end_a, start_b, end_b))
+
+        last_a = last_b = 0
+        for i, j in self.align_lines(a_lines, b_lines):
+            start_a, end_a = a_offsets[i], a_offsets[i + 1]
+            start_b, end_b = b_offsets[j], b_offsets[j + 1]
+            add_gap(last_a, start_a, last_b, start_b)
+            last_a, last_b = end_a, end_b
+
+            if len(a_lines[i]) + len(b_lines[j]) > self.pair_limit:
+                add_gap(start_a, end_a, start_b, end_b)
+                continue
+
+            matcher = self.inline_matcher_class(None, a_lines[i], b_lines[j])
+            for chunk in matcher.get_opcodes():
+                opcodes.append(
+                    DiffChunk(
+                        chunk.tag,
+                        chunk.start_a + start_a,
+                        chunk.end_a + start_a,
+                        chunk.start_b + start_b,
+                        chunk.end_b + start_b,
+                    )
+                )
+        add_gap(last_a, len(self.a), last_b, len(self.b))
+
+        self.opcodes = opcodes
+        return opcodes
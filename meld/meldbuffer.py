@@ -115,6 +115,9 @@ class MeldBufferData(GObject.GObject):
             self.label = gfile.get_parse_name() if gfile else None
         self.state = state
         self.savefile = None
+        #: Whether the buffer holds a condensed view of a large file,
+        #: rather than the file's actual contents
+        self.condensed = False
 
     def __del__(self):
         self.disconnect_monitor()
@@ -206,8 +209,15 @@ class MeldBufferData(GObject.GObject):
         except (AttributeError, GLib.GError):
             return None
 
+    @property
+    def unloaded(self) -> bool:
+        """Whether the buffer is for a file whose contents weren't loaded"""
+        return self._gfile is not None and self.state == MeldBufferState.EMPTY
+
     @property
     def writable(self):
+        if self.condensed or self.unloaded:
+            return False
         try:
             info = self.gfiletarget.query_info(
                 Gio.FILE_ATTRIBUTE_ACCESS_CAN_WRITE, 0, None
@@ -74,7 +74,11 @@ class MeldDoc(GObject.GObject):
 
     def action_stop(self, *args) -> None:
         if self.scheduler.tasks_pending():
-            self.scheduler.remove_task(self.scheduler.get_current_task())
+            self.scheduler.cancel_task(self.scheduler.get_current_task())
+        # Tasks waiting on offloaded calls, e.g., a folder scan waiting
+        # on a directory listing, aren't in the task list.
+        for task in list(self.scheduler.waiting):
+            self.scheduler.cancel_task(task)
 
     def on_file_changed(self, filename: str):
         pass
@@ -39,13 +39,21 @@ from meld.misc import error_dialog, guess_if_remote_x11
 from meld.newdifftab import NewDiffTab
 from meld.recent import get_recent_comparisons
 from meld.settings import get_meld_settings
-from meld.task import LifoScheduler
+from meld.task import Priority, PriorityScheduler
 from meld.ui.gtkutil import BIND_DEFAULT_CREATE
 from meld.vcview import VcView
 from meld.windowstate import SavedWindowState
 
 log = logging.getLogger(__name__)
 
+#: Input events that indicate the user is actively interacting
+INTERACTION_EVENT_TYPES = {
+    Gdk.EventType.BUTTON_PRESS,
+    Gdk.EventType.KEY_PRESS,
+    Gdk.EventType.SCROLL,
+    Gdk.EventType.TOUCH_BEGIN,
+}
+
 
 @Gtk.Template(resource_path="/org/gnome/meld/ui/appwindow.ui")
 class MeldWindow(Adw.ApplicationWindow):
@@ -112,9 +120,16 @@ class MeldWindow(Adw.ApplicationWindow):
 
         self.should_close = False
         self.idle_hooked = 0
-        self.scheduler = LifoScheduler()
+        self.scheduler = PriorityScheduler()
         self.scheduler.connect("runnable", self.on_scheduler_runnable)
 
+        # Track user input so that we can throttle work in background tabs
+        # while the user is interacting with the current one.
+        input_controller = Gtk.EventControllerLegacy()
+        input_controller.set_propagation_phase(Gtk.PropagationPhase.CAPTURE)
+        input_controller.connect("event", self.on_input_event)
+        self.add_controller(input_controller)
+
         if IS_DEVEL:
             style_context = self.get_style_context()
             style_context.add_class("devel")
@@ -170,24 +185,48 @@ class MeldWindow(Adw.ApplicationWindow):
         return True
 
     def on_idle(self):
-        ret = self.scheduler.iteration()
+        ret = self.scheduler.run_time_slice()
         if ret and isinstance(ret, str):
             self.spinner.set_tooltip_text(ret)
 
         pending = self.scheduler.tasks_pending()
         if not pending:
-            self.spinner.stop()
-            self.spinner.hide()
-            self.spinner.set_tooltip_text("")
             self.idle_hooked = None
-
-            # On window close, this idle loop races widget destruction,
-            # and so actions may already be gone at this point.
-            stop_action = self.lookup_action("stop")
-            if stop_action:
-                stop_action.set_enabled(False)
+            self.update_busy_state()
         return pending
 
+    def update_busy_state(self):
+        # Tasks waiting on offloaded calls will be runnable again when
+        # the calls complete, so we're still busy until they're done.
+        if self.scheduler.has_work():
+            return
+
+        self.spinner.stop()
+        self.spinner.hide()
+        self.spinner.set_tooltip_text("")
+
+        # On window close, this idle loop races widget destruction,
+        # and so actions may already be gone at this point.
+        stop_action = self.lookup_action("stop")
+        if stop_action:
+            stop_action.set_enabled(False)
+
+    def on_input_event(self, controller, event):
+        if event.get_event_type() in INTERACTION_EVENT_TYPES:
+            self.scheduler.note_interaction()
+        return False
+
+    def update_scheduler_priorities(self):
+        selected = self.tabview.get_selected_page()
+        for page in self.tabview.get_pages():
+            doc = page.get_child()
+            if not hasattr(doc, "scheduler"):
+                continue
+            if page == selected:
+                doc.scheduler.priority = Priority.VISIBLE
+            else:
+                doc.scheduler.priority = Priority.BACKGROUND
+
     def on_scheduler_runnable(self, sched):
         if not self.idle_hooked:
             self.spinner.show()
@@ -232,6 +271,7 @@ class MeldWindow(Adw.ApplicationWindow):
 
         newdoc = newtab.get_child()
         newdoc.on_container_switch_in_event(self)
+        self.update_scheduler_priorities()
 
         self.lookup_action("close").set_enabled(bool(newdoc))
 
@@ -260,10 +300,14 @@ class MeldWindow(Adw.ApplicationWindow):
         # TODO: This is the only window-level action we have that still
         # works on the "current" document like this.
         self.current_doc().action_stop()
+        if not self.idle_hooked:
+            self.update_busy_state()
 
     def page_removed(self, doc, status):
         if hasattr(doc, "scheduler"):
             self.scheduler.remove_scheduler(doc.scheduler)
+            if not self.idle_hooked:
+                self.update_busy_state()
 
         tabpage = self.tabview.get_page(doc)
         if tabpage.props.selected:
@@ -321,6 +365,7 @@ class MeldWindow(Adw.ApplicationWindow):
 
         if hasattr(doc, "scheduler"):
             self.scheduler.add_scheduler(doc.scheduler)
+            self.update_scheduler_priorities()
         if isinstance(doc, MeldDoc):
             doc.file_changed_signal.connect(self.on_file_changed)
             doc.create_diff_signal.connect(
@@ -21,6 +21,7 @@ import collections
 import errno
 import functools
 import os
+import re
 import shutil
 import subprocess
 from pathlib import PurePath
@@ -346,6 +347,122 @@ def merge_intervals(interval_list: List[Tuple[int, int]]) -> List[Tuple[int, int
     return merged_intervals
 
 
+#: Pattern syntax that refers to groups by number or name, which would
+#: change meaning if the pattern were combined with others
+GROUP_REFERENCE_RE = re.compile(r"\\[1-9]|\(\?P=|\(\?\(")
+
+
+def combine_regexes(regexes: Sequence[Pattern]) -> Optional[Pattern]:
+    """Combine regexes into a single alternation matching any of them
+
+    Returns None if the regexes can't be combined, e.g., because they
+    have different flags or use group references.
+    """
+    if len(regexes) == 1:
+        return regexes[0]
+    if not regexes or len({r.flags for r in regexes}) != 1:
+        return None
+
+    patterns = [r.pattern for r in regexes]
+    for pattern in patterns:
+        if isinstance(pattern, bytes):
+            pattern = pattern.decode("latin-1")
+        if GROUP_REFERENCE_RE.search(pattern):
+            return None
+
+    if isinstance(patterns[0], bytes):
+        combined = b"|".join(b"(?:" + p + b")" for p in patterns)
+    else:
+        combined = "|".join("(?:" + p + ")" for p in patterns)
+    try:
+        return re.compile(combined, regexes[0].flags)
+    except re.error:
+        # e.g., duplicate group names, or global inline flags
+        return None
+
+
+class TextFilterSet:
+    """Text filters compiled for applying to lines or whole texts
+
+    As well as the individual filters, we keep a single alternation of
+    all of them, so that one scan finds the first position where any
+    filter matches. Most text is unfiltered, so this usually avoids
+    running every filter over the text. When there is a match, each
+    filter is run from that position on, since a leftmost-first
+    alternation would miss overlapping matches from different filters.
+    """
+
+    def __init__(self, regexes: Sequence[Pattern]):
+        self.regexes = tuple(r for r in regexes if r)
+        self.combined = combine_regexes(self.regexes)
+
+    def filter_ranges(self, txt: AnyStr) -> List[Tuple[int, int]]:
+        """Get the merged ranges of txt matched by the filters"""
+        if not self.regexes:
+            return []
+
+        start = 0
+        if self.combined:
+            match = self.combined.search(txt)
+            if not match:
+                return []
+            start = match.start()
+
+        filter_ranges = []
+        for r in self.regexes:
+            for match in r.finditer(txt, start):
+                # If there are no groups in the match, use the whole match
+                if not r.groups:
+                    span = match.span()
+                    if span[0] != span[1]:
+                        filter_ranges.append(span)
+                    continue
+
+                # If there are groups in the regex, include all groups that
+                # participated in the match
+                for i in range(r.groups):
+                    span = match.span(i + 1)
+                    if span != (-1, -1) and span[0] != span[1]:
+                        filter_ranges.append(span)
+
+        return merge_intervals(filter_ranges)
+
+    def apply(
+        self,
+        txt: AnyStr,
+        apply_fn: Optional[Callable[[int, int], None]] = None,
+    ) -> AnyStr:
+        """Remove filtered ranges from txt
+
+        "apply_fn" is a callable run for each filtered interval
+        """
+        filter_ranges = self.filter_ranges(txt)
+        if not filter_ranges:
+            return txt
+
+        empty_string = b"" if isinstance(txt, bytes) else ""
+        newline = b"\n" if isinstance(txt, bytes) else "\n"
+
+        if apply_fn:
+            for start, end in reversed(filter_ranges):
+                apply_fn(start, end)
+
+        offset = 0
+        result_txts = []
+        for start, end in filter_ranges:
+            assert txt[start:end].count(newline) == 0
+            result_txts.append(txt[offset:start])
+            offset = end
+        result_txts.append(txt[offset:])
+        return empty_string.join(result_txts)
+
+
+@functools.lru_cache(maxsize=16)
+def get_text_filter_set(regexes: Tuple[Pattern, ...]) -> TextFilterSet:
+    """Get a cached filter set for the given active filters"""
+    return TextFilterSet(regexes)
+
+
 def apply_text_filters(
     txt: AnyStr,
     regexes: Sequence[Pattern],
@@ -359,43 +476,7 @@ def apply_text_filters(
 
     "apply_fn" is a callable run for each filtered interval
     """
-    empty_string = b"" if isinstance(txt, bytes) else ""
-    newline = b"\n" if isinstance(txt, bytes) else "\n"
-
-    filter_ranges = []
-    for r in regexes:
-        if not r:
-            continue
-
-        for match in r.finditer(txt):
-            # If there are no groups in the match, use the whole match
-            if not r.groups:
-                span = match.span()
-                if span[0] != span[1]:
-                    filter_ranges.append(span)
-                continue
-
-            # If there are groups in the regex, include all groups that
-            # participated in the match
-            for i in range(r.groups):
-                span = match.span(i + 1)
-                if span != (-1, -1) and span[0] != span[1]:
-                    filter_ranges.append(span)
-
-    filter_ranges = merge_intervals(filter_ranges)
-
-    if apply_fn:
-        for start, end in reversed(filter_ranges):
-            apply_fn(start, end)
-
-    offset = 0
-    result_txts = []
-    for start, end in filter_ranges:
-        assert txt[start:end].count(newline) == 0
-        result_txts.append(txt[offset:start])
-        offset = end
-    result_txts.append(txt[offset:])
-    return empty_string.join(result_txts)
+    return get_text_filter_set(tuple(regexes)).apply(txt, apply_fn)
 
 
 def calc_syncpoint(adj: Gtk.Adjustment) -> float:
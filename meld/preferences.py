@@ -196,6 +196,13 @@ class WrapMode(PreferenceEnum):
     char = ("char", _("Anywhere"), Gtk.WrapMode.CHAR)
 
 
+class InlineGranularity(PreferenceEnum):
+    setting_type = enum.nonmember(str)
+
+    char = ("char", _("Characters"), 0)
+    word = ("word", _("Words"), 1)
+
+
 class StyleVariant(PreferenceEnum):
     setting_type = enum.nonmember(str)
 
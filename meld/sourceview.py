@@ -16,12 +16,14 @@
 
 import logging
 from enum import Enum
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
 from gi.repository import Gdk, Gio, GLib, GObject, Graphene, Gsk, Gtk, GtkSource, Pango
 
 from meld.meldbuffer import MeldBuffer
 from meld.settings import bind_settings, get_meld_settings, settings
 from meld.style import colour_lookup_with_fallback, get_common_theme
+from meld.tracing import frame_profiled
 from meld.ui.gtkutil import make_gdk_rgba
 
 log = logging.getLogger(__name__)
@@ -96,6 +98,14 @@ class TextviewLineAnimation:
         self.anim_type = anim_type
 
 
+class ChunkLayerPage(NamedTuple):
+    """Cached rendering of chunk backgrounds for one page of the view"""
+
+    node: Optional[Gsk.RenderNode]
+    #: Rendered changes, with their y position and height
+    changes: List[Tuple[tuple, int, int]]
+
+
 class SourceViewHelperMixin:
     def get_y_for_line_num(self, line):
         buf = self.get_buffer()
@@ -174,6 +184,10 @@ class MeldSourceView(GtkSource.View, SourceViewHelperMixin):
         flags=(GObject.ParamFlags.READWRITE | GObject.ParamFlags.CONSTRUCT),
     )
 
+    #: Height in pixels of the pages that chunk backgrounds are cached
+    #: in, so that scrolling only renders newly exposed pages
+    CHUNK_LAYER_PAGE_HEIGHT = 512
+
     @GObject.Signal(name="popup-menu")
     def popup_menu(self) -> None: ...
 
@@ -183,6 +197,12 @@ class MeldSourceView(GtkSource.View, SourceViewHelperMixin):
         self.anim_source_id = None
         self.animating_chunks = []
         self._show_line_numbers = None
+        #: Cached chunk background pages, by page index
+        self._chunk_pages: Dict[int, ChunkLayerPage] = {}
+        self._chunk_pages_key = None
+        #: Incremented whenever chunks, or the positions of the lines
+        #: they cover, may have changed
+        self.chunk_generation = 0
 
         self.context_menu = None
 
@@ -199,6 +219,8 @@ class MeldSourceView(GtkSource.View, SourceViewHelperMixin):
             SYNCPOINT_SENTINEL, SYNCPOINT_MARK_CATEGORY, buf.get_start_iter()
         )
         self.set_buffer(buf)
+        # Edits move the lines that chunk backgrounds are drawn for
+        buf.connect("changed", self.invalidate_chunk_layer)
         self.connect("notify::overscroll-num-lines", self.notify_overscroll)
 
     @property
@@ -211,6 +233,11 @@ class MeldSourceView(GtkSource.View, SourceViewHelperMixin):
 
         return self._approx_line_height
 
+    def invalidate_chunk_layer(self, *args):
+        """Discard cached chunk backgrounds, e.g., when chunks change"""
+        self.chunk_generation += 1
+        self._chunk_pages = {}
+
     def notify_overscroll(self, view, param):
         self.props.bottom_margin = self.overscroll_num_lines * self.line_height
 
@@ -254,7 +281,9 @@ class MeldSourceView(GtkSource.View, SourceViewHelperMixin):
     def on_setting_changed(self, settings, key):
         if key == "font":
             self._approx_line_height = None
+            self.invalidate_chunk_layer()
         elif key == "style-scheme":
+            self.invalidate_chunk_layer()
             self.highlight_color = colour_lookup_with_fallback(
                 "meld:current-line-highlight", "background"
             )
@@ -340,6 +369,7 @@ class MeldSourceView(GtkSource.View, SourceViewHelperMixin):
             GLib.source_remove(self.anim_source_id)
         return GtkSource.View.do_unrealize(self)
 
+    @frame_profiled()
     def do_snapshot_layer(self, layer, snapshot):
         if layer != Gtk.TextViewLayer.BELOW_TEXT:
             return GtkSource.View.do_snapshot_layer(self, layer, snapshot)
@@ -364,27 +394,7 @@ class MeldSourceView(GtkSource.View, SourceViewHelperMixin):
         rect = Graphene.Rect()
         rounded_rect = Gsk.RoundedRect()
 
-        # Paint chunk backgrounds and outlines
-        for change in self.chunk_iter(bounds):
-            ypos0 = self.get_y_for_line_num(change[1])
-            ypos1 = self.get_y_for_line_num(change[2])
-            height = max(1, ypos1 - ypos0) + 1
-
-            rect.init(x, ypos0, width, height)
-            if change[1] != change[2]:
-                color = self.fill_colors[change[0]]
-                snapshot.append_color(color, rect)
-                if self.current_chunk_check(change):
-                    highlight = self.fill_colors["current-chunk-highlight"]
-                    snapshot.append_color(highlight, rect)
-
-            color = self.line_colors[change[0]]
-            rounded_rect.init_from_rect(rect, 0.0)
-            snapshot.append_border(
-                rounded_rect,
-                [1.0, 0.0, 1.0, 0.0],
-                [color, color, color, color],
-            )
+        self.snapshot_chunks(snapshot, visible_rect, width)
 
         # Check whether we're drawing past the last line in the buffer
         # (i.e., the overscroll) and draw a custom background if so.
@@ -477,6 +487,98 @@ class MeldSourceView(GtkSource.View, SourceViewHelperMixin):
 
         return GtkSource.View.do_snapshot_layer(self, layer, snapshot)
 
+    def snapshot_chunks(
+        self, snapshot: Gtk.Snapshot, visible_rect: Gdk.Rectangle, width: int
+    ):
+        """Paint chunk backgrounds and outlines for the visible area
+
+        Chunks are rendered in fixed-height pages in buffer coordinates,
+        and pages are reused until chunks or line positions change. The
+        view translates them for scrolling, so scrolling only renders
+        the pages that come into view.
+        """
+        pages_key = (
+            self.chunk_generation,
+            width,
+            # Changes as line heights are validated or wrapped
+            self.get_vadjustment().get_upper(),
+        )
+        if pages_key != self._chunk_pages_key:
+            self._chunk_pages = {}
+            self._chunk_pages_key = pages_key
+
+        page_height = self.CHUNK_LAYER_PAGE_HEIGHT
+        first_page = max(0, visible_rect.y) // page_height
+        last_page = (visible_rect.y + visible_rect.height) // page_height
+
+        # Keep the pages next to the visible ones for scrolling back, but
+        # drop any further away so that the cache doesn't grow unbounded.
+        for index in list(self._chunk_pages):
+            if not first_page - 1 <= index <= last_page + 1:
+                del self._chunk_pages[index]
+
+        visible_changes = {}
+        for index in range(first_page, last_page + 1):
+            page = self._chunk_pages.get(index)
+            if page is None:
+                page = self._build_chunk_page(index, width)
+                self._chunk_pages[index] = page
+            if page.node:
+                snapshot.append_node(page.node)
+            for change, ypos, height in page.changes:
+                visible_changes[change] = (ypos, height)
+
+        # The current chunk changes with the cursor, so its highlight
+        # isn't part of the cached pages.
+        rect = Graphene.Rect()
+        highlight = self.fill_colors["current-chunk-highlight"]
+        for change, (ypos, height) in visible_changes.items():
+            if change[1] == change[2] or not self.current_chunk_check(change):
+                continue
+            rect.init(0, ypos, width, height)
+            snapshot.append_color(highlight, rect)
+
+    def _build_chunk_page(self, index: int, width: int) -> ChunkLayerPage:
+        top = index * self.CHUNK_LAYER_PAGE_HEIGHT
+        bottom = top + self.CHUNK_LAYER_PAGE_HEIGHT
+
+        textbuffer = self.get_buffer()
+        start_line = self.get_line_num_for_y(top)
+        end_line = self.get_line_num_for_y(bottom)
+        end_y, end_height = self.get_line_yrange(textbuffer.get_end_iter())
+        if bottom > end_y + end_height:
+            end_line += 1
+
+        snapshot = Gtk.Snapshot()
+        rect = Graphene.Rect()
+        rounded_rect = Gsk.RoundedRect()
+        changes = []
+
+        # Chunks crossing a page boundary are rendered in both pages, so
+        # clip them to avoid painting translucent fills twice.
+        rect.init(0, top, width, self.CHUNK_LAYER_PAGE_HEIGHT)
+        snapshot.push_clip(rect)
+        for change in self.chunk_iter((start_line, end_line)):
+            ypos0 = self.get_y_for_line_num(change[1])
+            ypos1 = self.get_y_for_line_num(change[2])
+            height = max(1, ypos1 - ypos0) + 1
+            changes.append((change, ypos0, height))
+
+            rect.init(0, ypos0, width, height)
+            if change[1] != change[2]:
+                snapshot.append_color(self.fill_colors[change[0]], rect)
+
+            color = self.line_colors[change[0]]
+            rounded_rect.init_from_rect(rect, 0.0)
+            snapshot.append_border(
+                rounded_rect,
+                [1.0, 0.0, 1.0, 0.0],
+                [color, color, color, color],
+            )
+
+        snapshot.pop()
+        return ChunkLayerPage(snapshot.to_node(), changes)
+
 
 Gtk.WidgetClass.install_action(
     MeldSourceView,
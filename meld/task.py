@@ -16,7 +16,144 @@
 
 """Classes to implement scheduling for cooperative threads."""
 
+import concurrent.futures
+import enum
+import logging
+import time
 import traceback
+import types
+
+from gi.repository import GLib
+
+from meld.tracing import tracer
+
+log = logging.getLogger(__name__)
+
+#: Default time in seconds that a scheduler time slice may run for
+DEFAULT_TIME_BUDGET = 0.008
+
+#: Maximum number of threads used for running offloaded calls
+OFFLOAD_MAX_WORKERS = 4
+
+_executor = None
+
+
+def get_executor():
+    """Get the shared executor used for running offloaded calls"""
+    global _executor
+    if _executor is None:
+        _executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=OFFLOAD_MAX_WORKERS,
+            thread_name_prefix="meld-offload",
+        )
+    return _executor
+
+
+def call_on_main_loop(function, *args):
+    """Schedule a call from a worker thread to run on the main loop"""
+    GLib.idle_add(function, *args)
+
+
+class Offload:
+    """A blocking call for a generator task to run off the main thread
+
+    A generator task yields an `Offload` (or a `concurrent.futures.Future`
+    that it has already submitted) to have the call run on the shared
+    executor. The task is suspended until the call completes, and is
+    then resumed on the main loop with the call's result as the value of
+    the yield expression. If the call raised an exception, that
+    exception is raised from the yield instead. For example::
+
+        try:
+            entries = yield Offload(os.listdir, path)
+        except OSError:
+            ...
+
+    Other tasks continue to run while a task is suspended, so the task
+    must not rely on state that those tasks may change.
+
+    Offloaded calls run on a different thread, and so must not touch
+    any GTK objects or other state shared with the main thread.
+    """
+
+    __slots__ = ("args", "function", "kwargs")
+
+    def __init__(self, function, *args, **kwargs):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+
+    def __repr__(self):
+        return "<Offload %s>" % getattr(self.function, "__qualname__", self.function)
+
+    def submit(self):
+        return get_executor().submit(self.function, *self.args, **self.kwargs)
+
+
+class Priority(enum.IntEnum):
+    """Priority classes for tasks, from most to least important"""
+
+    #: Work the user is actively waiting on
+    INTERACTIVE = 0
+    #: Work for the currently visible comparison
+    VISIBLE = 1
+    #: Work for comparisons that aren't currently visible
+    BACKGROUND = 2
+
+
+def get_task_name(task):
+    """Get a readable, stable name for a task"""
+    if isinstance(task, SchedulerBase):
+        return type(task).__name__
+    name = getattr(task, "__qualname__", None)
+    if name is None:
+        name = getattr(getattr(task, "func", None), "__qualname__", None)
+    return name or type(task).__name__
+
+
+class CancellationToken:
+    """A flag that a task can check to see whether it has been cancelled
+
+    A task is cancelled when it is superseded by a new task with the
+    same key, or when it is cancelled or all tasks are removed from its
+    scheduler. A cancelled generator task is not resumed, so this
+    only needs to be checked by work that runs for a long time between
+    yields, such as calls offloaded to another thread.
+    """
+
+    __slots__ = ("cancelled",)
+
+    def __init__(self):
+        self.cancelled = False
+
+    def __repr__(self):
+        return "<CancellationToken cancelled=%s>" % self.cancelled
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TaskStats:
+    """Accumulated step timings for a single named task"""
+
+    __slots__ = ("count", "max_duration", "total_duration")
+
+    def __init__(self):
+        self.count = 0
+        self.total_duration = 0.0
+        self.max_duration = 0.0
+
+    def __repr__(self):
+        return "<TaskStats count=%d total=%.1fms max=%.1fms>" % (
+            self.count,
+            self.total_duration * 1000,
+            self.max_duration * 1000,
+        )
+
+    def add(self, duration):
+        self.count += 1
+        self.total_duration += duration
+        self.max_duration = max(self.max_duration, duration)
 
 
 class SchedulerBase:
@@ -25,53 +162,211 @@ class SchedulerBase:
     Derived classes must implement get_current_task.
     """
 
-    def __init__(self):
+    def __init__(self, time_budget=DEFAULT_TIME_BUDGET):
         self.tasks = []
         self.callbacks = []
+        self._priority = Priority.VISIBLE
+        #: Priority classes of tasks that were added with one
+        self.task_priorities = {}
+        #: Time in seconds that run_time_slice() may run tasks for
+        self.time_budget = time_budget
+        #: Step timings for tasks run by this scheduler, keyed by task name
+        self.task_stats = {}
+        #: Suspended tasks, mapped to the future they are waiting on
+        self.waiting = {}
+        #: Resumable tasks, mapped to the completed future they waited on
+        self.resumed = {}
+        #: Keyed tasks, mapped from their key
+        self.keyed_tasks = {}
+        #: Keys of keyed tasks, mapped from the task
+        self.task_keys = {}
+        #: Cancellation tokens, mapped from the task they belong to
+        self.task_tokens = {}
+        #: Schedulers added with add_scheduler()
+        self.subschedulers = []
 
     def __repr__(self):
         return "%s" % self.tasks
 
+    @property
+    def priority(self):
+        """Priority class of this scheduler when run as a subscheduler
+
+        A visible scheduler with runnable interactive tasks runs in the
+        interactive class, so that e.g., the focused comparison's
+        result polling isn't held up by other visible work.
+        """
+        if self._priority == Priority.VISIBLE and self.has_interactive_tasks():
+            return Priority.INTERACTIVE
+        return self._priority
+
+    @priority.setter
+    def priority(self, value):
+        previous = self.priority
+        self._priority = value
+        self.notify_priority_changed(previous)
+
+    def has_interactive_tasks(self):
+        return any(
+            priority == Priority.INTERACTIVE and task not in self.waiting
+            for task, priority in self.task_priorities.items()
+        )
+
+    def notify_priority_changed(self, previous):
+        # Parent schedulers place tasks in a class when they're added,
+        # so we re-add ourselves to have our new class take effect.
+        if self.priority != previous and self.tasks:
+            for callback in self.callbacks:
+                callback(self)
+
     def connect(self, signal, action):
         assert signal == "runnable"
         if action not in self.callbacks:
             self.callbacks.append(action)
 
-    def add_task(self, task, atfront=False):
+    def add_task(self, task, atfront=False, key=None, token=None, priority=None):
         """Add a task to the scheduler's task list
 
         The task may be a function, generator or scheduler, and is
         deemed to have finished when it returns a false value or raises
         StopIteration.
+
+        If a key is given, any existing task with the same key is
+        cancelled, so that e.g., repeated refreshes don't queue up
+        redundant passes. If a cancellation token is given, it is
+        cancelled along with the task.
+
+        If a priority class is given, it is used by schedulers that
+        order tasks by priority, and by parent schedulers when this
+        scheduler is run as a subscheduler.
         """
+        if key is not None:
+            superseded = self.keyed_tasks.get(key)
+            if superseded is not None and superseded is not task:
+                self.cancel_task(superseded)
+
         self.remove_task(task)
 
+        if key is not None:
+            self.keyed_tasks[key] = task
+            self.task_keys[task] = key
+        if token is not None:
+            self.task_tokens[task] = token
+        if priority is not None:
+            self.task_priorities[task] = priority
+
+        self.enqueue_task(task, atfront)
+
+        for callback in self.callbacks:
+            callback(self)
+
+    def enqueue_task(self, task, atfront=False):
+        """Add a task to the runnable tasks"""
         if atfront:
             self.tasks.insert(0, task)
         else:
             self.tasks.append(task)
 
-        for callback in self.callbacks:
-            callback(self)
-
-    def remove_task(self, task):
-        """Remove a single task from the scheduler"""
+    def dequeue_task(self, task):
+        """Remove a task from the runnable tasks, if it's there"""
         try:
             self.tasks.remove(task)
         except ValueError:
             pass
 
+    def remove_task(self, task):
+        """Remove a single task from the scheduler"""
+        self.dequeue_task(task)
+        if task in self.task_priorities:
+            previous = self.priority
+            del self.task_priorities[task]
+            self.notify_priority_changed(previous)
+        future = self.waiting.pop(task, None)
+        if future is not None:
+            future.cancel()
+        self.resumed.pop(task, None)
+        key = self.task_keys.pop(task, None)
+        if key is not None and self.keyed_tasks.get(key) is task:
+            del self.keyed_tasks[key]
+        self.task_tokens.pop(task, None)
+
     def remove_all_tasks(self):
-        """Remove all tasks from the scheduler"""
+        """Remove and cancel all tasks"""
+        tasks = self.tasks + list(self.waiting)
+        tokens = self.task_tokens
         self.tasks = []
+        for future in self.waiting.values():
+            future.cancel()
+        self.waiting = {}
+        self.resumed = {}
+        self.keyed_tasks = {}
+        self.task_keys = {}
+        self.task_tokens = {}
+        self.task_priorities = {}
+        for task in tasks:
+            self._cancel(task, tokens.get(task))
+
+    def cancel_keyed_task(self, key):
+        """Cancel the task with the given key, if there is one"""
+        task = self.keyed_tasks.get(key)
+        if task is not None:
+            self.cancel_task(task)
+
+    def cancel_task(self, task):
+        """Remove a task, and stop it from doing any further work"""
+        token = self.task_tokens.get(task)
+        self.remove_task(task)
+        self._cancel(task, token)
+
+    def _cancel(self, task, token):
+        if token is not None:
+            token.cancel()
+        # Close generators so that their cleanup runs now, rather than
+        # whenever they're garbage collected.
+        if isinstance(task, types.GeneratorType):
+            try:
+                task.close()
+            except ValueError:
+                # The task is cancelling itself from inside a step
+                pass
+
+    def suspend_task(self, task, future):
+        """Suspend a task until the given future is done"""
+        previous = self.priority
+        self.dequeue_task(task)
+        self.waiting[task] = future
+        self.notify_priority_changed(previous)
+
+        def done_callback(future):
+            call_on_main_loop(self.resume_task, task, future)
+
+        future.add_done_callback(done_callback)
+
+    def resume_task(self, task, future):
+        """Return a suspended task to the task list with its result"""
+        # The task may have been removed, or re-suspended, in the meantime
+        if self.waiting.get(task) is not future:
+            return False
+        del self.waiting[task]
+        self.resumed[task] = future
+        self.enqueue_task(task)
+        for callback in self.callbacks:
+            callback(self)
+        return False
 
     def add_scheduler(self, sched):
         """Adds a subscheduler as a child task of this scheduler"""
         sched.connect("runnable", lambda t: self.add_task(t))
+        if sched not in self.subschedulers:
+            self.subschedulers.append(sched)
 
     def remove_scheduler(self, sched):
         """Remove a sub-scheduler from this scheduler"""
         self.remove_task(sched)
+        try:
+            self.subschedulers.remove(sched)
+        except ValueError:
+            pass
         try:
             self.callbacks.remove(sched)
         except ValueError:
@@ -90,24 +385,96 @@ class SchedulerBase:
         return self.tasks_pending()
 
     def complete_tasks(self):
-        """Run all of the scheduler's current tasks to completion"""
-        while self.tasks_pending():
-            self.iteration()
+        """Run all of the scheduler's current tasks to completion
+
+        Tasks suspended on offloaded calls are waited for, and resumed
+        directly rather than from the main loop.
+        """
+        while self.has_work():
+            if self.tasks_pending():
+                self.iteration()
+            else:
+                self.resume_waiting_tasks()
 
     def tasks_pending(self):
+        """Whether any tasks are ready to run"""
         return len(self.tasks) != 0
 
+    def has_work(self):
+        """Whether any tasks are ready to run or waiting to resume
+
+        Unlike tasks_pending(), this includes tasks suspended on
+        offloaded calls, here and in subschedulers.
+        """
+        return (
+            self.tasks_pending()
+            or bool(self.waiting)
+            or any(sched.has_work() for sched in self.subschedulers)
+        )
+
+    def get_waiting_tasks(self):
+        """Get (scheduler, task, future) for all suspended tasks"""
+        waiting = [(self, task, future) for task, future in self.waiting.items()]
+        for sched in self.subschedulers:
+            waiting.extend(sched.get_waiting_tasks())
+        return waiting
+
+    def resume_waiting_tasks(self):
+        """Block until an offloaded call completes, and resume its task"""
+        waiting = self.get_waiting_tasks()
+        concurrent.futures.wait(
+            [future for _sched, _task, future in waiting],
+            return_when=concurrent.futures.FIRST_COMPLETED,
+        )
+        for sched, task, future in waiting:
+            if future.done():
+                sched.resume_task(task, future)
+
+    def run_time_slice(self):
+        """Run task iterations until the scheduler's time budget is used
+
+        Iterations continue while there are pending tasks, so that short
+        steps aren't dominated by main loop overhead. A single step that
+        overruns the budget can't be interrupted, so such steps are
+        logged to help identify tasks that need to yield more often.
+
+        Returns the last true value returned by an iteration.
+        """
+        result = 0
+        deadline = time.perf_counter() + self.time_budget
+        while self.tasks_pending():
+            ret = self.iteration()
+            if ret:
+                result = ret
+            if time.perf_counter() >= deadline:
+                break
+        return result
+
     def iteration(self):
         """Perform one iteration of the current task"""
         try:
             task = self.get_current_task()
         except StopIteration:
             return 0
+        start = time.perf_counter()
         try:
-            if hasattr(task, "__iter__"):
-                ret = next(task)
-            else:
-                ret = task()
+            with tracer.span(get_task_name(task), "scheduler"):
+                if task in self.resumed:
+                    future = self.resumed.pop(task)
+                    error = future.exception()
+                    if error is not None:
+                        ret = task.throw(error)
+                    else:
+                        ret = task.send(future.result())
+                elif hasattr(task, "__iter__"):
+                    ret = next(task)
+                else:
+                    ret = task()
+            if isinstance(ret, Offload):
+                ret = ret.submit()
+            if isinstance(ret, concurrent.futures.Future):
+                self.suspend_task(task, ret)
+                return 0
         except StopIteration:
             pass
         except Exception:
@@ -115,9 +482,28 @@ class SchedulerBase:
         else:
             if ret:
                 return ret
-        self.tasks.remove(task)
+        finally:
+            self.record_step(task, time.perf_counter() - start)
+        self.remove_task(task)
         return 0
 
+    def record_step(self, task, duration):
+        """Record the duration of a single step of a task"""
+        name = get_task_name(task)
+        stats = self.task_stats.get(name)
+        if stats is None:
+            stats = self.task_stats[name] = TaskStats()
+        stats.add(duration)
+
+        # Subschedulers record and report their own tasks' steps
+        if duration > self.time_budget and not isinstance(task, SchedulerBase):
+            log.debug(
+                "Step of task %s took %.1fms, exceeding the %.1fms budget",
+                name,
+                duration * 1000,
+                self.time_budget * 1000,
+            )
+
 
 class LifoScheduler(SchedulerBase):
     """Scheduler calling most recently added tasks first"""
@@ -139,6 +525,93 @@ class FifoScheduler(SchedulerBase):
             raise StopIteration
 
 
+class PriorityScheduler(SchedulerBase):
+    """Scheduler calling tasks by priority class, round-robin within a class
+
+    A task's priority is either given when it is added, or is taken
+    from its ``priority`` attribute (as for subschedulers), defaulting
+    to `Priority.VISIBLE`. Tasks within a class take turns, so that no
+    single subscheduler can monopolise its class.
+
+    The highest queued class runs first, but lower classes are given
+    one turn in every `lower_priority_interval`, even while interactive
+    tasks are queued, so that they aren't starved by e.g., continuous
+    result polling. While the user is interacting with the application
+    (see `note_interaction()`), lower classes are not run at all.
+    """
+
+    #: Lower priority classes get one in this many turns
+    lower_priority_interval = 4
+    #: Time in seconds after user input during which we throttle work
+    interaction_timeout = 0.5
+
+    def __init__(self, time_budget=DEFAULT_TIME_BUDGET):
+        super().__init__(time_budget)
+        #: Runnable tasks in each priority class
+        self.queues = {priority: [] for priority in Priority}
+        #: Priority class that each runnable task is queued in
+        self.queued_priorities = {}
+        self.last_interaction = None
+        self.turn = 0
+        self.next_index = {}
+
+    def enqueue_task(self, task, atfront=False):
+        super().enqueue_task(task, atfront)
+        priority = self.get_task_priority(task)
+        self.queued_priorities[task] = priority
+        if atfront:
+            self.queues[priority].insert(0, task)
+        else:
+            self.queues[priority].append(task)
+
+    def dequeue_task(self, task):
+        super().dequeue_task(task)
+        priority = self.queued_priorities.pop(task, None)
+        if priority is not None:
+            self.queues[priority].remove(task)
+
+    def remove_all_tasks(self):
+        super().remove_all_tasks()
+        self.queues = {priority: [] for priority in Priority}
+        self.queued_priorities = {}
+
+    def get_task_priority(self, task):
+        priority = self.task_priorities.get(task)
+        if priority is None:
+            priority = getattr(task, "priority", Priority.VISIBLE)
+        return priority
+
+    def note_interaction(self):
+        """Record that the user has just interacted with the application"""
+        self.last_interaction = time.monotonic()
+
+    def is_interacting(self):
+        if self.last_interaction is None:
+            return False
+        return time.monotonic() - self.last_interaction < self.interaction_timeout
+
+    def get_current_task(self):
+        priorities = [priority for priority, queue in self.queues.items() if queue]
+        if not priorities:
+            raise StopIteration
+
+        priority = priorities[0]
+        self.turn += 1
+        if (
+            len(priorities) > 1
+            and not self.is_interacting()
+            and self.turn % self.lower_priority_interval == 0
+        ):
+            # Lower classes take turns at their share of the time
+            lower = priorities[1:]
+            priority = lower[(self.turn // self.lower_priority_interval) % len(lower)]
+
+        candidates = self.queues[priority]
+        index = self.next_index.get(priority, 0) % len(candidates)
+        self.next_index[priority] = index + 1
+        return candidates[index]
+
+
 if __name__ == "__main__":
     import random
     import time
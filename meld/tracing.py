@@ -0,0 +1,285 @@
+"""Lightweight tracing of scheduled work
+
+When enabled, timed spans are recorded for scheduler iterations and for
+the main comparison entry points. On exit, these are written out in the
+Chrome trace event format, which can be loaded in Perfetto
+(https://ui.perfetto.dev/) or chrome://tracing.
+
+Tracing is enabled by setting the MELD_TRACE_FILE environment variable
+to the path the trace should be written to.
+
+Separately, drawing code can be profiled per frame. When enabled by
+setting the MELD_FRAME_PROFILE environment variable, time spent in the
+main drawing functions is summed for each frame of the drawing widget's
+frame clock, and per-widget frame time percentiles and counts of frames
+over budget are logged on exit.
+"""
+
+import atexit
+import collections
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional
+
+log = logging.getLogger(__name__)
+
+
+class Tracer:
+    """Collects timed spans for export as a Chrome trace"""
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.events: List[Dict[str, Any]] = []
+        self.path: Optional[str] = None
+
+    def enable(self, path: str) -> None:
+        """Start recording spans, writing them to path on exit"""
+        if self.enabled:
+            return
+        self.enabled = True
+        self.path = path
+        atexit.register(self.write)
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str = "meld", **args: Any) -> Iterator[None]:
+        """Record the duration of the enclosed block as a span"""
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            end = time.perf_counter_ns()
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": start / 1000,
+                "dur": (end - start) / 1000,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+            }
+            if args:
+                event["args"] = args
+            self.events.append(event)
+
+    def write(self, path: Optional[str] = None) -> None:
+        """Write recorded spans as a Chrome trace JSON file"""
+        path = path or self.path
+        if not path:
+            return
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"traceEvents": self.events}, f)
+        except OSError as err:
+            log.error("Couldn't write trace to %s: %s", path, err)
+
+
+#: Application-wide tracer
+tracer = Tracer()
+
+
+def traced(category: str) -> Callable[[Callable], Callable]:
+    """Decorator recording each call of a function as a span"""
+
+    def wrap(function):
+        @functools.wraps(function)
+        def wrap_function(*args, **kwargs):
+            if not tracer.enabled:
+                return function(*args, **kwargs)
+            with tracer.span(function.__qualname__, category):
+                return function(*args, **kwargs)
+
+        return wrap_function
+
+    return wrap
+
+
+def traced_iter(category: str) -> Callable[[Callable], Callable]:
+    """Decorator recording each step of a generator function as a span
+
+    Scheduled generator tasks do their work a step at a time, so each
+    step is recorded as a separate span. Values and exceptions sent in
+    to the wrapper are passed on to the wrapped generator.
+    """
+
+    def wrap(function):
+        @functools.wraps(function)
+        def wrap_function(*args, **kwargs):
+            generator = function(*args, **kwargs)
+            if not tracer.enabled:
+                return generator
+
+            def step_generator():
+                sent, error = None, None
+                try:
+                    while True:
+                        with tracer.span(function.__qualname__, category):
+                            try:
+                                if error is not None:
+                                    value = generator.throw(error)
+                                else:
+                                    value = generator.send(sent)
+                            except StopIteration:
+                                return
+                        try:
+                            sent, error = (yield value), None
+                        except Exception as err:
+                            sent, error = None, err
+                finally:
+                    generator.close()
+
+            traced_generator = step_generator()
+            traced_generator.__qualname__ = function.__qualname__
+            return traced_generator
+
+        return wrap_function
+
+    return wrap
+
+
+class FrameSummary(NamedTuple):
+    """Per-frame drawing times for a single widget"""
+
+    widget: str
+    frames: int
+    #: Frames where drawing took longer than the refresh interval
+    dropped: int
+    #: 50th, 95th and 99th percentile and maximum frame times, in ms
+    percentiles: Dict[str, List[float]]
+
+
+def frame_percentiles(times: List[float]) -> List[float]:
+    times = sorted(times)
+    ranks = [int(len(times) * p) for p in (0.5, 0.95, 0.99)]
+    return [times[min(r, len(times) - 1)] * 1000 for r in ranks] + [times[-1] * 1000]
+
+
+class FrameProfiler:
+    """Collects drawing time per frame, by widget and function"""
+
+    #: Refresh interval assumed when the frame clock doesn't know it
+    default_frame_budget = 1 / 60
+
+    def __init__(self) -> None:
+        self.enabled = False
+        #: Drawing time by widget, frame counter and function name
+        self.frames: Dict[str, Dict[int, Dict[str, float]]] = {}
+        #: Refresh interval in seconds by widget and frame counter
+        self.budgets: Dict[str, Dict[int, float]] = {}
+
+    def enable(self) -> None:
+        """Start recording frame times, logging a summary on exit"""
+        if self.enabled:
+            return
+        self.enabled = True
+        log.setLevel(logging.INFO)
+        atexit.register(self.report)
+
+    @staticmethod
+    def get_widget_name(widget) -> str:
+        name = widget.get_buildable_id() or type(widget).__name__
+        return f"{name} {id(widget):#x}"
+
+    @contextlib.contextmanager
+    def measure(self, widget, name: str) -> Iterator[None]:
+        """Add the duration of the enclosed block to widget's frame"""
+        clock = widget.get_frame_clock() if self.enabled else None
+        if clock is None:
+            yield
+            return
+
+        frame = clock.get_frame_counter()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            widget_name = self.get_widget_name(widget)
+            widget_frames = self.frames.setdefault(widget_name, {})
+            frame_times = widget_frames.setdefault(frame, collections.Counter())
+            frame_times[name] += elapsed
+
+            budgets = self.budgets.setdefault(widget_name, {})
+            if frame not in budgets:
+                timings = clock.get_current_timings()
+                interval = timings.get_refresh_interval() if timings else 0
+                budgets[frame] = interval / 1e6 or self.default_frame_budget
+
+    def summary(self) -> List[FrameSummary]:
+        """Summarise recorded frames for each widget"""
+        summaries = []
+        for widget_name, widget_frames in sorted(self.frames.items()):
+            budgets = self.budgets[widget_name]
+            totals = {
+                frame: sum(times.values()) for frame, times in widget_frames.items()
+            }
+            by_function = collections.defaultdict(list)
+            for times in widget_frames.values():
+                for name, elapsed in times.items():
+                    by_function[name].append(elapsed)
+
+            percentiles = {"total": frame_percentiles(list(totals.values()))}
+            for name, times in sorted(by_function.items()):
+                percentiles[name] = frame_percentiles(times)
+            dropped = sum(
+                1 for frame, total in totals.items() if total > budgets[frame]
+            )
+            summaries.append(
+                FrameSummary(widget_name, len(totals), dropped, percentiles)
+            )
+        return summaries
+
+    def report(self) -> None:
+        """Log a summary of recorded frame times"""
+        for summary in self.summary():
+            log.info(
+                "%s: %d frames, %d over budget",
+                summary.widget,
+                summary.frames,
+                summary.dropped,
+            )
+            for name, (p50, p95, p99, worst) in summary.percentiles.items():
+                log.info(
+                    "  %s: p50 %.3fms, p95 %.3fms, p99 %.3fms, max %.3fms",
+                    name,
+                    p50,
+                    p95,
+                    p99,
+                    worst,
+                )
+
+
+#: Application-wide frame profiler
+frame_profiler = FrameProfiler()
+
+
+def frame_profiled(
+    get_widget: Optional[Callable[..., Any]] = None,
+) -> Callable[[Callable], Callable]:
+    """Decorator adding each call of a drawing method to a frame profile
+
+    The time is attributed to the frame of the method's widget, or of
+    the widget returned by get_widget when called with the method's
+    arguments.
+    """
+
+    def wrap(function):
+        @functools.wraps(function)
+        def wrap_function(self, *args, **kwargs):
+            if not frame_profiler.enabled:
+                return function(self, *args, **kwargs)
+            widget = get_widget(self, *args) if get_widget else self
+            with frame_profiler.measure(widget, function.__qualname__):
+                return function(self, *args, **kwargs)
+
+        return wrap_function
+
+    return wrap
@@ -175,23 +175,23 @@ class DiffTreeStore(SearchableTreeStore):
         self.set_state(it, pane, state, display_text, isdir)
 
     def set_state(self, it, pane, state, label, isdir=0):
+        self.unsafe_set(it, pane, self.state_values(state, label, isdir))
+
+    def state_values(self, state, label, isdir=0):
+        """Get the column values for displaying a state"""
         icon = self.icon_details[state][1 if isdir else 0]
         tint = None if isdir else self.icon_details[state][2]
         fg, style, weight, strike = self.text_attributes[state]
-        self.unsafe_set(
-            it,
-            pane,
-            {
-                COL_STATE: str(state),
-                COL_TEXT: label,
-                COL_ICON: icon,
-                COL_TINT: tint,
-                COL_FG: fg,
-                COL_STYLE: style,
-                COL_WEIGHT: weight,
-                COL_STRIKE: strike,
-            },
-        )
+        return {
+            COL_STATE: str(state),
+            COL_TEXT: label,
+            COL_ICON: icon,
+            COL_TINT: tint,
+            COL_FG: fg,
+            COL_STYLE: style,
+            COL_WEIGHT: weight,
+            COL_STRIKE: strike,
+        }
 
     def get_state(self, it, pane):
         state_idx = self.column_index(COL_STATE, pane)
@@ -235,12 +235,7 @@ class DiffTreeStore(SearchableTreeStore):
 
         return None
         """
-        safe_keys_values = {
-            self.column_index(col, pane): val
-            if val is not None
-            else self._none_of_cols.get(self.column_index(col, pane))
-            for col, val in keys_values.items()
-        }
+        safe_keys_values = self._safe_values(pane, keys_values)
         if _GIGtk and treeiter:
             columns = [col for col in safe_keys_values.keys()]
             values = [val for val in safe_keys_values.values()]
@@ -248,6 +243,43 @@ class DiffTreeStore(SearchableTreeStore):
         else:
             self.set(treeiter, safe_keys_values)
 
+    def _safe_values(self, pane, keys_values):
+        return {
+            self.column_index(col, pane): val
+            if val is not None
+            else self._none_of_cols.get(self.column_index(col, pane))
+            for col, val in keys_values.items()
+        }
+
+    def insert_rows(self, parent, rows):
+        """Append fully populated rows to parent
+
+        Each row is given as a list with a dict of column values for
+        each pane. Since each row is inserted with all of its values,
+        only a single row-inserted signal is emitted for it, rather
+        than a row-changed for each subsequent set.
+
+        Returns a list of iters for the inserted rows.
+        """
+        # Values are boxed by their Python type, so a large int would
+        # fail to box as GObject.TYPE_INT; box these explicitly.
+        int64_columns = {
+            col
+            for col in range(self.get_n_columns())
+            if self.get_column_type(col) == GObject.TYPE_INT64
+        }
+        iters = []
+        for row in rows:
+            columns, values = [], []
+            for pane, keys_values in enumerate(row):
+                for col, val in self._safe_values(pane, keys_values).items():
+                    if col in int64_columns:
+                        val = GObject.Value(GObject.TYPE_INT64, val)
+                    columns.append(col)
+                    values.append(val)
+            iters.append(self.insert_with_values(parent, -1, columns, values))
+        return iters
+
 
 class MeldTreeView(Gtk.TreeView):
     __gtype_name__ = "MeldTreeView"
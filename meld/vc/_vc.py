@@ -23,6 +23,7 @@
 # THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import collections
+import copy
 import itertools
 import logging
 import os
@@ -306,6 +307,25 @@ class Vc:
             path = "./"
         self._update_tree_state_cache(path)
 
+    def detached_copy(self):
+        """Return a copy of this VC with its own cached state
+
+        Refreshing the copy doesn't touch this VC's caches, so it can be
+        done off the main thread. The refreshed state is then applied
+        on the main thread with `update_state_from()`.
+        """
+        vc = copy.copy(self)
+        vc._tree_cache = dict(self._tree_cache)
+        vc._tree_meta_cache = dict(self._tree_meta_cache)
+        vc._tree_missing_cache = collections.defaultdict(
+            set, {k: set(v) for k, v in self._tree_missing_cache.items()}
+        )
+        return vc
+
+    def update_state_from(self, vc):
+        """Replace this VC's cached state with that of a detached copy"""
+        self.__dict__.update(vc.__dict__)
+
     def get_entries(self, base):
         parent = Gio.File.new_for_path(base)
         try:
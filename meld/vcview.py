@@ -34,6 +34,8 @@ from meld.iohelpers import trash_or_confirm
 from meld.melddoc import MeldDoc
 from meld.misc import error_dialog, read_pipe_iter
 from meld.settings import bind_settings, settings
+from meld.task import Offload
+from meld.tracing import traced_iter
 from meld.ui.vcdialogs import CommitDialog
 from meld.vc import _null, get_vcs
 from meld.vc._vc import Entry
@@ -418,10 +420,9 @@ class VcView(Gtk.Box, MeldDoc):
         except NotImplementedError:
             pass
 
-        self.scheduler.add_task(self.vc.refresh_vc_state)
-        self.scheduler.add_task(self._search_recursively_iter(root_path))
-        self.scheduler.add_task(self.on_treeview_selection_changed)
-        self.scheduler.add_task(self.on_treeview_cursor_changed)
+        self.scheduler.add_task(
+            self._search_recursively_iter(root_path, refresh_state=True)
+        )
 
     def get_comparison(self):
         if self.location:
@@ -449,12 +450,22 @@ class VcView(Gtk.Box, MeldDoc):
 
         self.recompute_label()
 
-    def _search_recursively_iter(self, start_path, replace=False):
+    @traced_iter("vcview")
+    def _search_recursively_iter(self, start_path, replace=False, refresh_state=False):
 
         # Initial yield so when we add this to our tasks, we don't
         # create iterators that may be invalidated.
         yield _("Scanning repository")
 
+        if refresh_state:
+            # Querying the VC state can block for a long time on large
+            # repositories, so it's done off the main thread. The VC's
+            # caches are read from the main thread, so the refresh is
+            # done on a copy that's only swapped in once it's complete.
+            vc = self.vc.detached_copy()
+            yield Offload(vc.refresh_vc_state)
+            self.vc.update_state_from(vc)
+
         if replace:
             # Replace the row at start_path with a new, empty row ready
             # to be filled.
@@ -527,6 +538,11 @@ class VcView(Gtk.Box, MeldDoc):
         self.treeview.expand_row(Gtk.TreePath.new_first(), False)
         self.treeview.set_cursor(Gtk.TreePath.new_first())
 
+        # The scan may have been suspended while other tasks ran, so
+        # selection-dependent state is only updated once it's finished.
+        self.on_treeview_selection_changed()
+        self.on_treeview_cursor_changed()
+
     # TODO: This doesn't fire when the user selects a shortcut folder
     @Gtk.Template.Callback()
     def on_file_selected(self, button: Gtk.Button, pane: int, file: Gio.File) -> None:
@@ -849,6 +865,11 @@ class VcView(Gtk.Box, MeldDoc):
         open_files_external(gfiles)
 
     def refresh(self):
+        # Refreshes often come in quick succession, e.g., from toggling
+        # several filters, so these are collapsed into a single rescan.
+        self.scheduler.add_task(self._refresh_location, atfront=True, key="refresh")
+
+    def _refresh_location(self):
         root = self.model.get_iter_first()
         if root is None:
             return
@@ -864,8 +885,6 @@ class VcView(Gtk.Box, MeldDoc):
             self.treeview.grab_focus()
             self.vc.refresh_vc_state(where)
             self.scheduler.add_task(self._search_recursively_iter(path, replace=True))
-            self.scheduler.add_task(self.on_treeview_selection_changed)
-            self.scheduler.add_task(self.on_treeview_cursor_changed)
         else:
             # XXX fixme
             self.refresh()
@@ -0,0 +1,12 @@
+def test_insert_rows_large_size():
+    from meld import tree
+    from meld.dirdiff import COL_SIZE, DirDiffTreeStore
+
+    store = DirDiffTreeStore(2)
+    size = 2**31 + 1
+    rows = [[{tree.COL_PATH: "/a/file", COL_SIZE: size}, {COL_SIZE: -1}]]
+
+    (it,) = store.insert_rows(None, rows)
+
+    assert store.get_value(it, store.column_index(COL_SIZE, 0)) == size
+    assert store.get_value(it, store.column_index(COL_SIZE, 1)) == -1
@@ -0,0 +1,221 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from meld.matchers.myers import DiffChunk
+
+LINE_HEIGHT = 10
+
+
+def make_textview(line_count):
+    buf = mock.Mock()
+    buf.get_line_count.return_value = line_count
+    buf.get_end_iter.return_value = line_count - 1
+    buf.get_iter_at_line.side_effect = lambda line: (True, line)
+
+    textview = mock.Mock()
+    textview.get_buffer.return_value = buf
+    textview.get_vadjustment.return_value.get_upper.return_value = (
+        line_count * LINE_HEIGHT
+    )
+    textview.get_line_yrange.side_effect = lambda line: (
+        line * LINE_HEIGHT,
+        LINE_HEIGHT,
+    )
+    return textview
+
+
+def make_chunkmap(chunks, line_count, wrap_mode):
+    from meld.chunkmap import TextViewChunkMap
+
+    chunkmap = SimpleNamespace(
+        chunks=chunks,
+        textview=make_textview(line_count),
+        _coord_chunks=[],
+        _chunk_starts=[],
+        _chunk_ends=[],
+        _coords_max_y=0.0,
+        _coords_line_count=0,
+        _coords_key=None,
+    )
+    chunkmap.textview.get_wrap_mode.return_value = wrap_mode
+    chunkmap._get_line_coords = lambda chunk: TextViewChunkMap._get_line_coords(
+        chunkmap, chunk
+    )
+    return chunkmap
+
+
+def test_chunk_coords_incremental_update():
+    from gi.repository import Gtk
+
+    from meld.chunkmap import TextViewChunkMap
+
+    chunks = [
+        DiffChunk("replace", i * 10, i * 10 + 2, i * 10, i * 10 + 2) for i in range(100)
+    ]
+    chunkmap = make_chunkmap(chunks, 1000, Gtk.WrapMode.NONE)
+    TextViewChunkMap._update_chunk_coords(chunkmap)
+    assert chunkmap._chunk_starts[50] == 5000
+
+    # Extend chunk 50 by editing the lines after it
+    edited = [*chunks[:50], DiffChunk("replace", 500, 504, 500, 502), *chunks[51:]]
+    chunkmap.chunks = edited
+    chunkmap.textview.get_line_yrange.reset_mock()
+    TextViewChunkMap._update_chunk_coords(chunkmap)
+
+    # Only the end of the document and the edited chunk are looked up
+    assert chunkmap.textview.get_line_yrange.call_count == 3
+
+    expected = make_chunkmap(edited, 1000, Gtk.WrapMode.NONE)
+    TextViewChunkMap._update_chunk_coords(expected)
+    assert chunkmap._chunk_starts == expected._chunk_starts
+    assert chunkmap._chunk_ends == expected._chunk_ends
+    assert chunkmap._coords_max_y == expected._coords_max_y
+
+
+def test_chunk_coords_layout_change_recalculates():
+    from gi.repository import Gtk
+
+    from meld.chunkmap import TextViewChunkMap
+
+    chunks = [
+        DiffChunk("replace", i * 10, i * 10 + 2, i * 10, i * 10 + 2) for i in range(10)
+    ]
+    chunkmap = make_chunkmap(chunks, 100, Gtk.WrapMode.NONE)
+    TextViewChunkMap._update_chunk_coords(chunkmap)
+
+    # Line heights change without any change to the chunks
+    line_height = LINE_HEIGHT * 2
+    chunkmap.textview.get_line_yrange.side_effect = lambda line: (
+        line * line_height,
+        line_height,
+    )
+    chunkmap.textview.get_vadjustment.return_value.get_upper.return_value = (
+        100 * line_height
+    )
+    TextViewChunkMap._update_chunk_coords(chunkmap)
+    assert chunkmap._chunk_starts == [i * 10 * line_height for i in range(10)]
+
+    # A font change forces recalculation on the next update
+    chunkmap.invalidate_map = mock.Mock()
+    TextViewChunkMap.on_setting_changed(chunkmap, None, "font")
+    assert chunkmap._coords_key is None
+    chunkmap.invalidate_map.assert_called_once_with()
+
+
+def test_map_rects_invalidate_changed_tiles():
+    from meld.chunkmap import ChunkMap
+
+    coords = [("replace", i / 10, (i + 0.5) / 10) for i in range(10)]
+    chunkmap = SimpleNamespace(
+        TILE_HEIGHT=ChunkMap.TILE_HEIGHT,
+        chunk_coords=lambda: coords,
+        _tiles=[None] * 16,
+        _map_rects=[],
+        _map_scale=None,
+        _map_dirty=True,
+    )
+    ChunkMap._update_map_rects(chunkmap, 1000, 16)
+    chunkmap._tiles = [object()] * 16
+
+    # Move the chunk at 500-550 to 520-550
+    coords[5] = ("replace", 0.52, 0.55)
+    ChunkMap._update_map_rects(chunkmap, 1000, 16)
+
+    dirty = [i for i, tile in enumerate(chunkmap._tiles) if tile is None]
+    assert dirty == [7, 8]
+    assert not chunkmap._map_dirty
+
+
+def test_tree_chunk_map_batched_updates():
+    from meld.chunkmap import TreeViewChunkMap
+
+    model = mock.Mock()
+    chunkmap = mock.Mock()
+    chunkmap.model_signal_ids = [(model, 1), (model, 2)]
+
+    with TreeViewChunkMap.batched_updates(chunkmap):
+        assert model.handler_block.call_count == 2
+        chunkmap.clear_cached_map.assert_not_called()
+
+    assert model.handler_unblock.call_count == 2
+    chunkmap.clear_cached_map.assert_called_once_with()
+
+
+class FakeTreePath:
+    def __init__(self, *indices):
+        self.indices = list(indices)
+
+    def get_indices(self):
+        return self.indices
+
+    def get_depth(self):
+        return len(self.indices)
+
+    def copy(self):
+        return FakeTreePath(*self.indices)
+
+    def up(self):
+        self.indices.pop()
+        return bool(self.indices)
+
+
+def test_tree_chunk_map_row_updates():
+    from meld.chunkmap import TreeViewChunkMap
+
+    expanded = {(0,)}
+    states = {(0,): 1, (0, 0): 2, (0, 1): 3}
+    model = mock.Mock()
+    model.get_state.side_effect = lambda it, pane: states[it]
+
+    chunkmap = mock.Mock(treeview_idx=0, _row_states=[1, 2, 3])
+    chunkmap._row_indices = {(0,): 0, (0, 0): 1, (0, 1): 2}
+    chunkmap.treeview.row_expanded.side_effect = lambda path: (
+        tuple(path.get_indices()) in expanded
+    )
+    chunkmap._parent_shown = lambda path: TreeViewChunkMap._parent_shown(chunkmap, path)
+
+    # Changed states of shown rows are updated in place
+    states[(0, 1)] = 4
+    TreeViewChunkMap.on_row_changed(chunkmap, model, FakeTreePath(0, 1), (0, 1))
+    assert chunkmap._row_states == [1, 2, 4]
+    chunkmap._queue_throttled_update.assert_called_once_with()
+    chunkmap.clear_cached_map.assert_not_called()
+
+    # Rows in collapsed folders aren't shown, and don't change the map
+    TreeViewChunkMap.on_row_inserted(chunkmap, model, FakeTreePath(0, 0, 0), None)
+    TreeViewChunkMap.on_row_deleted(chunkmap, model, FakeTreePath(0, 0, 1))
+    chunkmap.clear_cached_map.assert_not_called()
+
+    TreeViewChunkMap.on_row_inserted(chunkmap, model, FakeTreePath(0, 2), None)
+    chunkmap.clear_cached_map.assert_called_once_with()
+
+
+def test_tree_chunk_map_expansion_updates_immediately():
+    from meld.chunkmap import TreeViewChunkMap
+
+    chunkmap = mock.Mock(_row_states=[1, 2], _update_source_id=5)
+
+    with mock.patch("meld.chunkmap.GLib") as glib:
+        TreeViewChunkMap.on_row_expansion_changed(chunkmap)
+
+    assert chunkmap._row_states is None
+    glib.source_remove.assert_called_once_with(5)
+    chunkmap._update_map.assert_called_once_with()
+
+
+def test_tree_chunk_map_unrealize_removes_update():
+    from meld.chunkmap import ChunkMap, TreeViewChunkMap
+
+    chunkmap = mock.Mock(_update_source_id=5, treeview_signal_ids=[1, 2])
+
+    with (
+        mock.patch("meld.chunkmap.GLib") as glib,
+        mock.patch.object(ChunkMap, "do_unrealize", create=True) as unrealize,
+    ):
+        TreeViewChunkMap.do_unrealize(chunkmap)
+
+    glib.source_remove.assert_called_once_with(5)
+    assert chunkmap._update_source_id == 0
+    assert chunkmap.treeview.disconnect.call_count == 2
+    chunkmap.disconnect_model.assert_called_once_with()
+    unrealize.assert_called_once_with(chunkmap)
@@ -0,0 +1,109 @@
+import pytest
+
+from meld.matchers.diffutil import Differ
+
+
+@pytest.mark.parametrize(
+    "sequences",
+    [
+        (["a", "b", "c"], ["a", "c", "d"], ["b", "c", "d", "e"]),
+        (["a"], ["a"], ["a"]),
+        ([], ["a", "b"], ["b"]),
+    ],
+)
+def test_pair_diffs_match_full_diff(sequences):
+    expected = Differ()
+    for _step in expected.set_sequences_iter(sequences):
+        pass
+
+    differ = Differ()
+    for pair in (1, 0):
+        for _step in differ.diff_pair_iter(sequences, pair):
+            pass
+    for _step in differ.set_sequences_iter(sequences):
+        pass
+
+    assert differ.diffs == expected.diffs
+    assert list(differ.all_changes()) == list(expected.all_changes())
+
+
+def test_clear_discards_pair_diffs():
+    differ = Differ()
+    for _step in differ.diff_pair_iter((["a"], ["b"], ["c"]), 0):
+        pass
+    differ.clear()
+
+    sequences = (["a"], ["a"], ["a"])
+    for _step in differ.set_sequences_iter(sequences):
+        pass
+    assert differ.diffs == [[], []]
+
+
+@pytest.mark.parametrize("fromindex, toindex", [(0, 1), (1, 0), (1, 2), (2, 1)])
+@pytest.mark.parametrize("lines", [(None, None, None, None), (2, 6, 2, 6)])
+def test_indexed_pair_changes(fromindex, toindex, lines):
+    sequences = (
+        ["a", "x", "c", "d", "y", "f", "g", "z"],
+        ["a", "b", "c", "d", "e", "f", "g", "h"],
+        ["a", "b", "q", "d", "e", "r", "g", "h"],
+    )
+    differ = Differ()
+    for _step in differ.set_sequences_iter(sequences):
+        pass
+
+    indexed = list(differ.indexed_pair_changes(fromindex, toindex, lines))
+    assert indexed
+    assert [c for _i, c in indexed] == list(
+        differ.pair_changes(fromindex, toindex, lines)
+    )
+    for index, change in indexed:
+        assert differ.locate_chunk(fromindex, change.start_a)[0] == index
+
+
+def linear_map_line(chunks, line, len_a, len_b):
+    mbegin, mend, obegin, oend = 0, len_a, 0, len_b
+    for chunk in chunks:
+        if chunk.start_a >= line:
+            mend, oend = chunk.start_a, chunk.start_b
+            break
+        elif chunk.end_a >= line:
+            mbegin, mend = chunk.start_a, chunk.end_a
+            obegin, oend = chunk.start_b, chunk.end_b
+            break
+        else:
+            mbegin, obegin = chunk.end_a, chunk.end_b
+    fraction = (line - mbegin) / ((mend - mbegin) or 1)
+    return obegin + fraction * (oend - obegin)
+
+
+@pytest.mark.parametrize("fromindex, toindex", [(0, 1), (1, 0), (1, 2), (2, 1)])
+def test_pair_correspondence_matches_linear_search(fromindex, toindex):
+    sequences = (
+        ["a", "x", "c", "d", "y", "f", "g", "z", "w"],
+        ["a", "b", "c", "d", "e", "f", "g", "h"],
+        ["a", "b", "e", "e", "q", "d", "e", "r", "g"],
+    )
+    differ = Differ()
+    for _step in differ.set_sequences_iter(sequences):
+        pass
+
+    chunks = list(differ.pair_changes(fromindex, toindex))
+    correspondence = differ.pair_correspondence(fromindex, toindex)
+    assert correspondence is differ.pair_correspondence(fromindex, toindex)
+
+    len_a, len_b = len(sequences[fromindex]), len(sequences[toindex])
+    for step in range(len_a * 4 + 1):
+        line = step / 4
+        assert correspondence.map_line(line, len_a, len_b) == pytest.approx(
+            linear_map_line(chunks, line, len_a, len_b)
+        )
+
+
+def test_pair_correspondence_rebuilt_on_change():
+    differ = Differ()
+    for _step in differ.set_sequences_iter((["a", "b"], ["a", "c"])):
+        pass
+    correspondence = differ.pair_correspondence(1, 0)
+    differ.clear()
+    assert differ.pair_correspondence(1, 0) is not correspondence
+    assert differ.pair_correspondence(1, 0).starts_a == []
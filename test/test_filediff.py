@@ -1,3 +1,4 @@
+from collections import deque
 from unittest import mock
 
 import pytest
@@ -113,3 +114,119 @@ def test_filter_text(text, ignored_ranges, expected_text):
 
     assert toggles == ignored_ranges
     assert text == expected_text
+
+
+def test_refresh_replaces_running_comparison():
+    from meld.filediff import FileDiff
+    from meld.task import FifoScheduler
+
+    log = []
+
+    def comparison(name):
+        for i in range(3):
+            log.append((name, i))
+            yield 1
+
+    filediff = mock.Mock(scheduler=FifoScheduler(), _initial_comparison=None)
+    filediff._compare_files_internal.side_effect = lambda: comparison("compare")
+    filediff._diff_files.side_effect = lambda refresh: comparison("refresh")
+
+    # Refreshing during the initial comparison restarts it
+    FileDiff._queue_comparison(filediff)
+    filediff.scheduler.iteration()
+    FileDiff._queue_comparison(filediff, refresh=True)
+    filediff.scheduler.complete_tasks()
+    assert log == [("compare", 0), ("compare", 0), ("compare", 1), ("compare", 2)]
+
+    # Later refreshes replace each other
+    log.clear()
+    FileDiff._queue_comparison(filediff, refresh=True)
+    filediff.scheduler.iteration()
+    FileDiff._queue_comparison(filediff, refresh=True)
+    filediff.scheduler.complete_tasks()
+    assert log == [("refresh", 0), ("refresh", 0), ("refresh", 1), ("refresh", 2)]
+
+
+def test_reload_without_encoding_reverts():
+    from meld.filediff import FileDiff
+    from meld.meldbuffer import MeldBufferState
+
+    buf = mock.Mock(handlers=[1])
+    buf.data.state = MeldBufferState.LOAD_FINISHED
+    buf.data.condensed = False
+    buf.data.encoding = None
+    buf.get_modified.return_value = False
+
+    filediff = mock.Mock(textbuffer=[buf])
+    filediff._can_reload_incrementally = lambda buf: FileDiff._can_reload_incrementally(
+        filediff, buf
+    )
+    FileDiff.reload_pane(filediff, 0)
+
+    filediff.revert_pane.assert_called_once_with(0)
+    filediff.scheduler.add_task.assert_not_called()
+
+
+def test_unmapped_highlights_drain_from_idle(monkeypatch):
+    from meld import filediff as filediff_module
+    from meld.filediff import FileDiff
+
+    applied = []
+
+    def highlight_job(name, steps):
+        yield
+        for _i in range(steps):
+            applied.append(name)
+            yield
+
+    view = mock.Mock()
+    view.get_mapped.return_value = False
+    filediff = mock.Mock(
+        textview=[view],
+        _pending_highlights=deque(),
+        _highlight_tick_id=0,
+        _highlight_idle_id=0,
+        _counted_highlights=0,
+        deferred_highlights=0,
+        _inline_highlight_iter=highlight_job,
+    )
+    for name in ("_schedule_highlights", "_run_highlight_jobs", "_on_highlight_idle"):
+        method = getattr(FileDiff, name)
+        setattr(filediff, name, method.__get__(filediff))
+
+    # Run a single job step per idle callback
+    monkeypatch.setattr(filediff_module, "HIGHLIGHT_FRAME_BUDGET", -1)
+    idle_add = mock.Mock(return_value=1)
+    monkeypatch.setattr(filediff_module.GLib, "idle_add", idle_add)
+
+    FileDiff._queue_inline_highlight(filediff, "a", 2)
+    FileDiff._queue_inline_highlight(filediff, "b", 1)
+    view.add_tick_callback.assert_not_called()
+    idle_add.assert_called_once()
+
+    callback = idle_add.call_args[0][0]
+    while callback():
+        pass
+
+    assert applied == ["a", "a", "b"]
+    assert not filediff._pending_highlights
+    assert filediff._highlight_idle_id == 0
+    # Each job is counted once, however many frames it was deferred for
+    assert filediff.deferred_highlights == 2
+
+
+@pytest.mark.parametrize("unloaded, condensed", [(True, False), (False, True)])
+def test_save_refuses_partial_buffers(unloaded, condensed):
+    from meld.filediff import FileDiff
+
+    buf = mock.Mock()
+    buf.data.unloaded = unloaded
+    buf.data.condensed = condensed
+    filediff = mock.Mock(textbuffer=[buf])
+
+    with mock.patch("meld.filediff.prompt_save_filename") as prompt:
+        assert not FileDiff.save_file(filediff, 0)
+        assert not FileDiff.save_file(filediff, 0, saveas=True)
+
+    prompt.assert_not_called()
+    filediff._do_save_file.assert_not_called()
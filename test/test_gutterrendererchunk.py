@@ -1,3 +1,4 @@
+import functools
 from unittest import mock
 
 import pytest
@@ -74,3 +75,76 @@ def test_classify_change_actions(mode, editable, chunk, expected_action):
 
         action = renderer._classify_change_actions(chunk)
         assert action == expected_action
+
+
+def test_chunk_lines_resolved_once_per_chunk():
+    from meld.gutterrendererchunk import GutterRendererChunkLines
+
+    chunks = [DiffChunk("replace", 1, 4, 1, 2), DiffChunk("insert", 6, 6, 5, 6)]
+    line_chunks = [None, 0, 0, 0, None, None, 1, None]
+
+    renderer = mock.MagicMock()
+    renderer.from_pane, renderer.to_pane = 0, 1
+    renderer.fill_colors = {"replace": "fill", "insert": "fill"}
+    renderer.props.view.current_chunk_check.return_value = False
+    renderer.linediffer.locate_chunk.side_effect = lambda pane, line: (
+        line_chunks[line],
+        None,
+        None,
+    )
+    renderer.linediffer.get_chunk.side_effect = lambda idx, *args: chunks[idx]
+    renderer._resolve_chunk.side_effect = lambda *args: (
+        GutterRendererChunkLines._resolve_chunk(renderer, *args)
+    )
+
+    lines = mock.Mock()
+    lines.get_first.return_value = 0
+    lines.get_last.return_value = 7
+    with mock.patch("meld.gutterrendererchunk.GtkSource.GutterRendererText.do_begin"):
+        GutterRendererChunkLines.do_begin(renderer, lines)
+
+    assert renderer.linediffer.get_chunk.call_count == 2
+    assert renderer._line_chunks == [
+        (None, None),
+        (chunks[0], "fill"),
+        (chunks[0], "fill"),
+        (chunks[0], "fill"),
+        (None, None),
+        (None, None),
+        (chunks[1], None),
+        (None, None),
+    ]
+
+
+def test_action_gutter_pointer_hit_test():
+    from meld.actiongutter import ActionGutter, ChunkLayout
+
+    chunks = [
+        DiffChunk("replace", 1, 3, 1, 2),
+        DiffChunk("delete", 5, 6, 4, 4),
+        DiffChunk("insert", 5, 5, 5, 6),
+    ]
+    gutter = mock.MagicMock()
+    gutter.chunks = chunks
+    gutter.chunk_starts = [c.start_a for c in chunks]
+    gutter.pointer_chunk = None
+    gutter._y_translate = -100
+    gutter._layout_key = ("generation", 1000, 20)
+    gutter._chunk_layouts = {
+        0: ChunkLayout(10, 20, ActionMode.Replace, 11, 8, None),
+        1: ChunkLayout(50, 10, ActionMode.Delete, 51, 8, None),
+        2: ChunkLayout(50, 2, None, 0, 0, None),
+    }
+    gutter.get_width.return_value = 20
+    gutter.source_view.get_line_num_for_y.side_effect = lambda y: y // 10
+    for name in ("_get_button_bounds", "_get_chunk_indices_at_line"):
+        method = getattr(ActionGutter, name)
+        getattr(gutter, name).side_effect = functools.partial(method, gutter)
+
+    ActionGutter.update_pointer_chunk(gutter, 5, -45)
+    assert gutter.pointer_chunk == chunks[1]
+    assert ActionGutter.get_coords_for_button(gutter, chunks[1]) == (1, -49, 19, -41)
+
+    ActionGutter.update_pointer_chunk(gutter, 5, -60)
+    assert gutter.pointer_chunk is None
+    assert ActionGutter.get_coords_for_button(gutter, chunks[2]) is None
@@ -4,9 +4,16 @@ import pytest
 from gi.repository import Gio
 
 from meld.iohelpers import (
+    FileScan,
+    count_newlines,
+    files_identical,
+    find_long_line,
     find_shared_parent_path,
     format_home_relative_path,
     format_parent_relative_path,
+    is_ascii_compatible,
+    read_text,
+    scan_file,
 )
 
 
@@ -127,3 +134,120 @@ def test_format_parent_relative_path_no_parent():
 
     with pytest.raises(ValueError, match="has no parent"):
         format_parent_relative_path(parent_gfile, child_gfile)
+
+
+@pytest.mark.parametrize(
+    "data, expected",
+    [
+        # Empty data
+        (b"", None),
+        # Short lines only
+        (b"abc\ndefg\nhi", None),
+        # Line exactly at the limit
+        (b"abc\n" + b"x" * 10 + b"\nabc", None),
+        # Long first line
+        (b"x" * 11 + b"\nabc", (0, 11)),
+        # Long last line with no trailing newline
+        (b"abc\ndef\n" + b"x" * 12, (2, 12)),
+        # Long line after many short lines
+        (b"a\n" * 50 + b"x" * 20 + b"\n", (50, 20)),
+        # Multi-byte characters within the limit
+        (b"abc\n" + "\u00e9".encode("utf-8") * 8 + b"\n", None),
+        # Carriage return line endings
+        (b"abcdef\rghijkl\r", None),
+        # Long line with CRLF line endings
+        (b"abc\r\n" + b"x" * 11 + b"\r\n", (1, 11)),
+    ],
+)
+def test_find_long_line(data, expected):
+    assert find_long_line(data, 10) == expected
+
+
+def test_scan_file(tmp_path):
+    text_path = tmp_path / "text.txt"
+    text_path.write_bytes(b"abc\n" + b"x" * 20 + b"\n")
+    assert scan_file(str(text_path), 10) == FileScan(binary=False, long_line=(1, 20))
+
+    binary_path = tmp_path / "binary.bin"
+    binary_path.write_bytes(b"abc\0def\n")
+    assert scan_file(str(binary_path), 10) == FileScan(binary=True, long_line=None)
+
+    empty_path = tmp_path / "empty.txt"
+    empty_path.write_bytes(b"")
+    assert scan_file(str(empty_path), 10) == FileScan(binary=False, long_line=None)
+
+    # Wide encodings' raw bytes can't be checked
+    utf16_path = tmp_path / "utf16.txt"
+    utf16_path.write_bytes(("abc\n" + "x" * 20 + "\n").encode("utf-16"))
+    assert scan_file(str(utf16_path), 10) is None
+
+
+@pytest.mark.parametrize(
+    "charset, expected",
+    [
+        ("UTF-8", True),
+        ("ISO-8859-15", True),
+        ("UTF-16", False),
+        ("UTF-32LE", False),
+        ("no-such-charset", False),
+    ],
+)
+def test_is_ascii_compatible(charset, expected):
+    assert is_ascii_compatible(charset) == expected
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 1024])
+def test_count_newlines(block_size):
+    data = b"a\nbb\n\nccc\nd"
+    assert count_newlines(data, len(data), block_size) == 4
+    assert count_newlines(data, 5, block_size) == 2
+    assert count_newlines(data, 0, block_size) == 0
+
+
+@pytest.mark.parametrize(
+    "contents, expected",
+    [
+        ([b"", b""], True),
+        ([b"abc" * 100, b"abc" * 100], True),
+        ([b"abc" * 100, b"abc" * 99 + b"abd"], False),
+        ([b"abc", b"abcd"], False),
+        ([b"abc", b"abc", b"abc"], True),
+        ([b"abc", b"abc", b"abd"], False),
+    ],
+)
+def test_files_identical(tmp_path, contents, expected):
+    paths = []
+    for i, content in enumerate(contents):
+        path = tmp_path / str(i)
+        path.write_bytes(content)
+        paths.append(str(path))
+    assert files_identical(paths, chunk_size=16) == expected
+
+
+@pytest.mark.parametrize(
+    "data, charset, expected",
+    [
+        (b"", "UTF-8", ""),
+        (b"abc\ndef", "UTF-8", "abc\ndef"),
+        # Only one trailing line break is removed
+        (b"abc\ndef\n\n", "UTF-8", "abc\ndef\n"),
+        (b"abc\r\ndef\r\n", "UTF-8", "abc\r\ndef"),
+        (b"abc\rdef\r", "UTF-8", "abc\rdef"),
+        (b"\xef\xbb\xbfabc\n", "UTF-8", "abc"),
+        ("abé\n".encode("latin-1"), "ISO-8859-1", "abé"),
+        # Binary content and over-long lines need a normal load
+        (b"abc\0def\n", "UTF-8", None),
+        (b"abc\n" + b"x" * 11 + b"\n", "UTF-8", None),
+    ],
+)
+def test_read_text(tmp_path, data, charset, expected):
+    path = tmp_path / "file.txt"
+    path.write_bytes(data)
+    assert read_text(str(path), charset, 10) == expected
+
+
+def test_read_text_decode_error(tmp_path):
+    path = tmp_path / "file.txt"
+    path.write_bytes(b"ab\xe9\n")
+    with pytest.raises(UnicodeDecodeError):
+        read_text(str(path), "UTF-8", 10)
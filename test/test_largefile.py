@@ -0,0 +1,152 @@
+import pytest
+
+from meld.matchers.largefile import (
+    ContextWindow,
+    LargeFileComparison,
+    LineIndex,
+    common_prefix_length,
+    common_suffix_length,
+    context_windows,
+)
+from meld.matchers.myers import DiffChunk
+
+
+def make_index(tmp_path, name, data, block_size=None):
+    path = tmp_path / name
+    path.write_bytes(data)
+    index = LineIndex(str(path))
+    if block_size:
+        index.BLOCK_SIZE = block_size
+    for _step in index.build_iter():
+        pass
+    return index
+
+
+@pytest.mark.parametrize("block_size", [None, 7, 64])
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"",
+        b"one line",
+        b"one line\n",
+        b"a\nb\n\nc",
+        b"".join(b"line %d\n" % i for i in range(300)),
+        b"".join(b"line %d\r\n" % i for i in range(300)),
+    ],
+)
+def test_line_index(tmp_path, data, block_size):
+    index = make_index(tmp_path, "file", data, block_size)
+    expected = data.decode().splitlines()
+
+    assert len(index) == len(expected)
+    assert index.get_lines(0, len(index)) == [
+        line.decode() for line in data.split(b"\n")[: len(expected)]
+    ]
+    for start in range(0, len(expected), 37):
+        assert [line.rstrip("\r") for line in index.get_lines(start, start + 5)] == (
+            expected[start : start + 5]
+        )
+    index.close()
+
+
+def test_line_index_hashes_equal_lines(tmp_path):
+    index = make_index(tmp_path, "file", b"a\nb\na\n")
+    assert index.hashes[0] == index.hashes[2]
+    assert index.hashes[0] != index.hashes[1]
+
+
+@pytest.mark.parametrize(
+    "chunks, expected",
+    [
+        ([], []),
+        (
+            [DiffChunk("replace", 10, 11, 10, 12)],
+            [ContextWindow(8, 13, 8, 14)],
+        ),
+        # Context is clamped at the start and end of the files
+        (
+            [DiffChunk("delete", 0, 1, 0, 0), DiffChunk("insert", 20, 20, 19, 20)],
+            [ContextWindow(0, 3, 0, 2), ContextWindow(18, 20, 17, 20)],
+        ),
+        # Overlapping windows are merged
+        (
+            [DiffChunk("replace", 5, 6, 5, 6), DiffChunk("replace", 9, 10, 9, 10)],
+            [ContextWindow(3, 12, 3, 12)],
+        ),
+    ],
+)
+def test_context_windows(chunks, expected):
+    assert context_windows(chunks, 20, 20, 2) == expected
+
+
+def test_condensed_texts(tmp_path):
+    lines_a = ["line %d" % i for i in range(100)]
+    lines_b = list(lines_a)
+    lines_b[50] = "changed"
+    index_a = make_index(tmp_path, "a", "\n".join(lines_a).encode())
+    index_b = make_index(tmp_path, "b", "\n".join(lines_b).encode())
+
+    comparison = LargeFileComparison(index_a, index_b)
+    comparison.context = 2
+    for _step in comparison.initialise():
+        pass
+    text_a, text_b = comparison.get_condensed_texts()
+
+    marker_before = comparison.marker(0, 0, 48)
+    marker_after = comparison.marker(53, 53, 47)
+    assert text_a.split("\n") == [
+        marker_before,
+        "line 48",
+        "line 49",
+        "line 50",
+        "line 51",
+        "line 52",
+        marker_after,
+    ]
+    assert text_b.split("\n") == [
+        marker_before,
+        "line 48",
+        "line 49",
+        "changed",
+        "line 51",
+        "line 52",
+        marker_after,
+    ]
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 4096])
+def test_common_prefix_suffix_length(block_size):
+    a = list(range(20))
+    b = [*range(8), -1, *range(9, 20)]
+    assert common_prefix_length(a, b, block_size) == 8
+    assert common_suffix_length(a, b, 20 - 8, block_size) == 11
+    assert common_prefix_length(a, a[:5], block_size) == 5
+    assert common_suffix_length(a, a, 3, block_size) == 3
+
+
+def compare(index_a, index_b):
+    comparison = LargeFileComparison(index_a, index_b)
+    for _step in comparison.initialise():
+        pass
+    return comparison.chunks
+
+
+def test_hash_collisions_are_changes(tmp_path):
+    lines_a = [b"line %d" % i for i in range(200)]
+    lines_b = list(lines_a)
+    lines_b[20] = b"changed"
+    lines_b[120] = b"collides"
+    index_a = make_index(tmp_path, "a", b"\n".join(lines_a) + b"\n")
+    index_b = make_index(tmp_path, "b", b"\n".join(lines_b) + b"\n")
+    index_b.hashes[120] = index_a.hashes[120]
+
+    assert compare(index_a, index_b) == [
+        DiffChunk("replace", 20, 21, 20, 21),
+        DiffChunk("replace", 120, 121, 120, 121),
+    ]
+
+
+def test_final_newline_is_not_a_change(tmp_path):
+    index_a = make_index(tmp_path, "a", b"a\nb\nc\n")
+    index_b = make_index(tmp_path, "b", b"a\nb\nc")
+    assert compare(index_a, index_b) == []
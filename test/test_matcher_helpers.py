@@ -0,0 +1,72 @@
+import queue
+from unittest import mock
+
+import pytest
+
+from meld.matchers.helpers import (
+    CachedSequenceMatcher,
+    SharedTextRing,
+    pack_opcodes,
+    read_shared_texts,
+    unpack_opcodes,
+)
+from meld.matchers.myers import DiffChunk
+
+
+def test_pack_opcodes_roundtrip():
+    opcodes = [
+        DiffChunk("equal", 0, 3, 0, 3),
+        DiffChunk("replace", 3, 5, 3, 4),
+        DiffChunk("delete", 5, 9, 4, 4),
+        DiffChunk("insert", 9, 9, 4, 7),
+    ]
+    assert unpack_opcodes(pack_opcodes(opcodes)) == opcodes
+    assert unpack_opcodes(pack_opcodes([])) == []
+
+
+@pytest.fixture
+def ring(monkeypatch):
+    monkeypatch.setattr(SharedTextRing, "SIZE", 10)
+    ring = SharedTextRing()
+    yield ring
+    ring.close()
+
+
+def test_shared_text_ring_roundtrip(ring):
+    location = ring.write(1, "héllo", "wörld")
+    assert location is None
+
+    location = ring.write(1, "hé", "wö")
+    assert location == (0, 3, 3)
+    assert read_shared_texts(ring.shm.buf, location) == ("hé", "wö")
+
+
+def test_shared_text_ring_wraps(ring):
+    assert ring.write(1, "aaa", "b") == (0, 3, 1)
+    assert ring.write(2, "cc", "cc") == (4, 2, 2)
+    assert ring.write(3, "dd", "") == (8, 2, 0)
+    # Buffer is full
+    assert ring.write(4, "x", "") is None
+
+    ring.release(1)
+    assert ring.write(5, "ee", "ee") == (0, 2, 2)
+    # Releasing a later task also releases all earlier tasks
+    ring.release(3)
+    assert ring.write(6, "ffff", "") == (4, 4, 0)
+
+
+def test_check_results_drops_failed_matches():
+    callback = mock.Mock()
+    matcher = mock.Mock(ring=None, cache={})
+    matcher.results = queue.Queue()
+    matcher.results.put((1, None))
+    matcher.queued_matches = {1: (("a", "b", ("char", False)), callback)}
+
+    assert not CachedSequenceMatcher.check_results(matcher)
+    assert matcher.queued_matches == {}
+    assert matcher.cache == {}
+    callback.assert_not_called()
+
+    # Polling an empty queue returns right away
+    matcher.queued_matches = {2: (("c", "d", ("char", False)), callback)}
+    assert CachedSequenceMatcher.check_results(matcher)
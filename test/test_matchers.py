@@ -1,3 +1,4 @@
+import itertools
 import unittest
 
 from meld.matchers import myers
@@ -28,6 +29,25 @@ class MatchersTests(unittest.TestCase):
         blocks = matcher.get_matching_blocks()
         self.assertEqual(blocks, r)
 
+    def test_token_inline_matcher(self):
+        a = "self.foo_bar(12, baz)  # comment"
+        b = "self.foo_baz(13, baz) # comment!"
+        matcher = myers.TokenInlineMyersSequenceMatcher(None, a, b)
+        changes = [
+            (c.tag, a[c.start_a : c.end_a], b[c.start_b : c.end_b])
+            for c in matcher.get_opcodes()
+            if c.tag != "equal"
+        ]
+        self.assertEqual(
+            changes,
+            [
+                ("replace", "foo_bar", "foo_baz"),
+                ("replace", "12", "13"),
+                ("replace", "  ", " "),
+                ("insert", "", "!"),
+            ],
+        )
+
     def test_sync_point_matcher0(self):
         a = list("012a3456c789")
         b = list("0a3412b5678")
@@ -51,3 +71,31 @@ class MatchersTests(unittest.TestCase):
         matcher = myers.SyncPointMyersSequenceMatcher(None, a, b, [(3, 2), (8, 6)])
         blocks = matcher.get_matching_blocks()
         self.assertEqual(blocks, r)
+
+    def test_line_aligned_inline_matcher(self):
+        a = "red, blue, yellow\nfoo bar baz\nsomething else\nqqq\n"
+        b = "red, blue, yelow\nfoo bar baz!\nzzzzzzzz\nsomething els\n"
+        matcher = myers.LineAlignedInlineMatcher(None, a, b)
+        opcodes = matcher.get_opcodes()
+
+        # Opcodes must cover both texts contiguously
+        self.assertEqual((opcodes[0].start_a, opcodes[0].start_b), (0, 0))
+        self.assertEqual((opcodes[-1].end_a, opcodes[-1].end_b), (len(a), len(b)))
+        for prev, chunk in itertools.pairwise(opcodes):
+            self.assertEqual((prev.end_a, prev.end_b), (chunk.start_a, chunk.start_b))
+
+        changes = [
+            (c.tag, a[c.start_a : c.end_a], b[c.start_b : c.end_b])
+            for c in opcodes
+            if c.tag != "equal"
+        ]
+        self.assertEqual(
+            changes,
+            [
+                ("delete", "l", ""),
+                ("insert", "", "!"),
+                ("insert", "", "zzzzzzzz\n"),
+                ("delete", "e", ""),
+                ("delete", "qqq\n", ""),
+            ],
+        )
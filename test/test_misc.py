@@ -1,9 +1,16 @@
+import re
 from unittest import mock
 
 import pytest
 from gi.repository import Gtk
 
-from meld.misc import all_same, calc_syncpoint, merge_intervals
+from meld.misc import (
+    TextFilterSet,
+    all_same,
+    calc_syncpoint,
+    combine_regexes,
+    merge_intervals,
+)
 
 
 @pytest.mark.parametrize(
@@ -28,6 +35,51 @@ def test_merge_intervals(intervals, expected):
     assert merged == expected
 
 
+@pytest.mark.parametrize(
+    "patterns, combinable",
+    [
+        (["a(.*)b", "#.*"], True),
+        ([rb"a(.*)b", rb"#.*"], True),
+        # Numbered and named group references would change meaning
+        ([r"(a)\1", "#.*"], False),
+        ([r"(?P<x>a)(?P=x)", "#.*"], False),
+        # Duplicate group names can't be compiled together
+        ([r"(?P<x>a)", r"(?P<x>b)"], False),
+    ],
+)
+def test_combine_regexes(patterns, combinable):
+    regexes = [re.compile(p, re.M) for p in patterns]
+    combined = combine_regexes(regexes)
+    assert (combined is not None) == combinable
+
+
+@pytest.mark.parametrize(
+    "text, expected_ranges",
+    [
+        ("no match", []),
+        ("# comment", [(0, 9)]),
+        ("xasdyasdz", [(1, 4), (5, 8)]),
+        # Matches from different filters overlap, and so must all be found
+        ("qaqxqbyqzq", [(2, 6), (7, 8)]),
+        ("#ab\na2b", [(0, 3), (5, 6)]),
+    ],
+)
+def test_text_filter_set(text, expected_ranges):
+    regexes = [re.compile(p, re.M) for p in ("#.*", "a(.*)b", "x(.*)y(.*)z")]
+    filter_set = TextFilterSet(regexes)
+    assert filter_set.combined is not None
+    assert filter_set.filter_ranges(text) == expected_ranges
+
+
+def test_text_filter_set_apply():
+    regexes = [re.compile(rb"#.*", re.M), None]
+    applied = []
+    filter_set = TextFilterSet(regexes)
+    result = filter_set.apply(b"a # b\nc", apply_fn=lambda *span: applied.append(span))
+    assert result == b"a \nc"
+    assert applied == [(2, 5)]
+
+
 @pytest.mark.parametrize(
     "value, page_size, lower, upper, expected",
     [
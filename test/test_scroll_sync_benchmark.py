@@ -0,0 +1,95 @@
+"""Benchmark for finding corresponding lines when syncing scrolling
+
+This scrolls through a comparison with a change every few lines,
+mapping the sync line between panes as FileDiff._sync_vscroll does. It
+is skipped unless MELD_BENCHMARK is set:
+
+    MELD_BENCHMARK=1 pytest -s test/test_scroll_sync_benchmark.py
+"""
+
+import os
+import statistics
+import time
+
+import pytest
+
+from meld.matchers.diffutil import Differ
+
+pytestmark = pytest.mark.skipif(
+    not os.environ.get("MELD_BENCHMARK"), reason="MELD_BENCHMARK not set"
+)
+
+NUM_CHUNKS = 50_000
+#: Unchanged lines between each changed line
+SPACING = 3
+NUM_FRAMES = 500
+
+
+def make_differ():
+    lines_a, lines_b = [], []
+    for i in range(NUM_CHUNKS):
+        lines_a.extend(["same"] * SPACING + [f"a{i}"])
+        lines_b.extend(["same"] * SPACING + [f"b{i}", f"b{i}"])
+
+    differ = Differ()
+    for _step in differ.set_sequences_iter((lines_a, lines_b)):
+        pass
+    return differ, len(lines_a), len(lines_b)
+
+
+def linear_map_line(chunks, line, len_a, len_b):
+    """The linear chunk search previously used by _sync_vscroll"""
+    mbegin, mend, obegin, oend = 0, len_a, 0, len_b
+    for chunk in chunks:
+        if chunk.start_a >= line:
+            mend, oend = chunk.start_a, chunk.start_b
+            break
+        elif chunk.end_a >= line:
+            mbegin, mend = chunk.start_a, chunk.end_a
+            obegin, oend = chunk.start_b, chunk.end_b
+            break
+        else:
+            mbegin, obegin = chunk.end_a, chunk.end_b
+    fraction = (line - mbegin) / ((mend - mbegin) or 1)
+    return obegin + fraction * (oend - obegin)
+
+
+def time_frames(map_line, len_a):
+    frame_times = []
+    for frame in range(NUM_FRAMES):
+        line = len_a * frame / NUM_FRAMES + 0.5
+        start = time.perf_counter()
+        map_line(line)
+        frame_times.append(time.perf_counter() - start)
+    return frame_times
+
+
+def test_scroll_sync_frame_time():
+    differ, len_a, len_b = make_differ()
+    assert differ.diff_count() == NUM_CHUNKS
+
+    def linear(line):
+        chunks = differ.pair_changes(0, 1)
+        return linear_map_line(chunks, line, len_a, len_b)
+
+    def bisected(line):
+        correspondence = differ.pair_correspondence(0, 1)
+        return correspondence.map_line(line, len_a, len_b)
+
+    for frame in range(0, NUM_FRAMES, 7):
+        line = len_a * frame / NUM_FRAMES + 0.5
+        assert bisected(line) == pytest.approx(linear(line))
+
+    linear_times = time_frames(linear, len_a)
+    bisected_times = time_frames(bisected, len_a)
+
+    def describe(times):
+        times = sorted(times)
+        return "mean {:.4f}ms, p95 {:.4f}ms".format(
+            statistics.mean(times) * 1000, times[int(len(times) * 0.95)] * 1000
+        )
+
+    print()
+    print(f"Scroll sync, linear search: {describe(linear_times)}")
+    print(f"Scroll sync, bisection:     {describe(bisected_times)}")
+    assert statistics.mean(bisected_times) < statistics.mean(linear_times)
@@ -0,0 +1,162 @@
+"""Frame-time benchmark for chunk background rendering
+
+This compares the cached, paged chunk backgrounds with drawing every
+visible chunk on every frame, as MeldSourceView used to. Frames that
+render a newly exposed page are the slowest, so the maximum frame time
+is reported along with the mean and 95th percentile.
+
+This needs a display (e.g., run under xvfb-run, or with
+GDK_BACKEND=broadway) and is skipped unless MELD_BENCHMARK is set:
+
+    MELD_BENCHMARK=1 pytest -s test/test_sourceview_benchmark.py
+"""
+
+import bisect
+import os
+import statistics
+import time
+
+import pytest
+from gi.repository import Gdk, GLib, Graphene, Gsk, Gtk, GtkSource
+
+from meld.matchers.myers import DiffChunk
+
+pytestmark = pytest.mark.skipif(
+    not os.environ.get("MELD_BENCHMARK"), reason="MELD_BENCHMARK not set"
+)
+
+NUM_LINES = 100_000
+NUM_CHUNKS = 10_000
+NUM_FRAMES = 2000
+#: Pixels scrolled between frames, as for smooth or kinetic scrolling
+SCROLL_STEP = 24
+
+CHUNK_TAGS = ("replace", "insert", "delete", "conflict")
+
+
+def make_rgba(spec):
+    rgba = Gdk.RGBA()
+    rgba.parse(spec)
+    return rgba
+
+
+def make_view():
+    from meld.sourceview import MeldSourceView
+
+    class BenchmarkSourceView(MeldSourceView):
+        """Source view that skips Meld settings and UI resources"""
+
+        __gtype_name__ = "MeldBenchmarkSourceView"
+
+        def do_realize(self):
+            return GtkSource.View.do_realize(self)
+
+    view = BenchmarkSourceView()
+    colours = dict(zip(CHUNK_TAGS, ("#bdf", "#bfb", "#fbb", "#fdb")))
+    view.fill_colors = {tag: make_rgba(c) for tag, c in colours.items()}
+    view.fill_colors["current-chunk-highlight"] = make_rgba("rgba(0,0,0,0.1)")
+    view.fill_colors["overscroll"] = make_rgba("#eee")
+    view.line_colors = {tag: make_rgba("#888") for tag in CHUNK_TAGS}
+    view.syncpoint_color = make_rgba("#555")
+
+    step = NUM_LINES // NUM_CHUNKS
+    chunks = [
+        DiffChunk(CHUNK_TAGS[i % len(CHUNK_TAGS)], line, line + 2, line, line + 2)
+        for i, line in enumerate(range(0, NUM_LINES, step))
+    ]
+    chunk_ends = [c.end_a for c in chunks]
+
+    def chunk_iter(bounds):
+        start = bisect.bisect_left(chunk_ends, bounds[0])
+        end = bisect.bisect_right(chunk_ends, bounds[1] + 2)
+        return iter(chunks[start:end])
+
+    view.chunk_iter = chunk_iter
+    view.current_chunk_check = lambda change: change is chunks[0]
+    view.get_buffer().set_text("\n".join(f"line {i}" for i in range(NUM_LINES)), -1)
+    return view
+
+
+def snapshot_chunks_uncached(view, snapshot, visible_rect, width):
+    """The per-frame chunk drawing previously used by MeldSourceView"""
+    start_line = view.get_line_num_for_y(visible_rect.y)
+    end_line = view.get_line_num_for_y(visible_rect.y + visible_rect.height)
+    end_y, end_height = view.get_line_yrange(view.get_buffer().get_end_iter())
+    if visible_rect.y + visible_rect.height > end_y + end_height:
+        end_line += 1
+
+    rect = Graphene.Rect()
+    rounded_rect = Gsk.RoundedRect()
+    for change in view.chunk_iter((start_line, end_line)):
+        ypos0 = view.get_y_for_line_num(change[1])
+        ypos1 = view.get_y_for_line_num(change[2])
+        height = max(1, ypos1 - ypos0) + 1
+
+        rect.init(0, ypos0, width, height)
+        if change[1] != change[2]:
+            snapshot.append_color(view.fill_colors[change[0]], rect)
+            if view.current_chunk_check(change):
+                highlight = view.fill_colors["current-chunk-highlight"]
+                snapshot.append_color(highlight, rect)
+
+        color = view.line_colors[change[0]]
+        rounded_rect.init_from_rect(rect, 0.0)
+        snapshot.append_border(
+            rounded_rect, [1.0, 0.0, 1.0, 0.0], [color, color, color, color]
+        )
+
+
+def run_frames(view, snapshot_chunks):
+    adjustment = view.get_vadjustment()
+    context = GLib.MainContext.default()
+    frame_times = []
+    value = 0
+    for _i in range(NUM_FRAMES):
+        value = (value + SCROLL_STEP) % (adjustment.get_upper() - SCROLL_STEP)
+        adjustment.set_value(value)
+        while context.pending():
+            context.iteration(False)
+
+        visible_rect = view.get_visible_rect()
+        width = view.get_width() + 1
+        start = time.perf_counter()
+        snapshot_chunks(view, Gtk.Snapshot(), visible_rect, width)
+        frame_times.append(time.perf_counter() - start)
+    return frame_times
+
+
+def test_chunk_layer_scroll_frame_time():
+    if Gdk.Display.get_default() is None:
+        pytest.skip("No display available")
+
+    view = make_view()
+    scroller = Gtk.ScrolledWindow()
+    scroller.set_child(view)
+    window = Gtk.Window(default_width=800, default_height=1000)
+    window.set_child(scroller)
+    window.present()
+
+    # Let the view size itself and validate its layout
+    context = GLib.MainContext.default()
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        context.iteration(False)
+
+    try:
+        uncached = run_frames(view, snapshot_chunks_uncached)
+        cached = run_frames(view, type(view).snapshot_chunks)
+    finally:
+        window.destroy()
+
+    def describe(times):
+        times = sorted(times)
+        return "mean {:.3f}ms, p95 {:.3f}ms, max {:.3f}ms".format(
+            statistics.mean(times) * 1000,
+            times[int(len(times) * 0.95)] * 1000,
+            times[-1] * 1000,
+        )
+
+    print()
+    print(f"Chunks, drawn every frame: {describe(uncached)}")
+    print(f"Chunks, cached pages:      {describe(cached)}")
+    assert statistics.mean(cached) < statistics.mean(uncached)
@@ -0,0 +1,393 @@
+import concurrent.futures
+import threading
+from unittest import mock
+
+import pytest
+
+from meld.task import (
+    CancellationToken,
+    FifoScheduler,
+    LifoScheduler,
+    Offload,
+    Priority,
+    PriorityScheduler,
+)
+
+
+def counting_task(log, name, steps):
+    for i in range(steps):
+        log.append((name, i))
+        yield 1
+
+
+def test_fifo_scheduler_order():
+    log = []
+    scheduler = FifoScheduler()
+    scheduler.add_task(counting_task(log, "a", 2))
+    scheduler.add_task(counting_task(log, "b", 1))
+    scheduler.complete_tasks()
+    assert log == [("a", 0), ("a", 1), ("b", 0)]
+
+
+def test_lifo_scheduler_order():
+    log = []
+    scheduler = LifoScheduler()
+    scheduler.add_task(counting_task(log, "a", 1))
+    scheduler.add_task(counting_task(log, "b", 2))
+    scheduler.complete_tasks()
+    assert log == [("b", 0), ("b", 1), ("a", 0)]
+
+
+def test_time_slice_runs_multiple_steps():
+    log = []
+    scheduler = FifoScheduler(time_budget=10)
+    scheduler.add_task(counting_task(log, "a", 3))
+    scheduler.add_task(counting_task(log, "b", 2))
+    scheduler.run_time_slice()
+    assert len(log) == 5
+    assert not scheduler.tasks_pending()
+
+
+def test_time_slice_stops_at_budget():
+    log = []
+    scheduler = FifoScheduler(time_budget=0.5)
+    scheduler.add_task(counting_task(log, "a", 10))
+
+    # Each call to perf_counter advances the clock by 0.1 seconds
+    clock = iter(x * 0.1 for x in range(1000))
+    with mock.patch("meld.task.time.perf_counter", lambda: next(clock)):
+        scheduler.run_time_slice()
+
+    assert 0 < len(log) < 10
+    assert scheduler.tasks_pending()
+
+
+def test_time_slice_returns_last_result():
+    def status_task():
+        yield "first"
+        yield "second"
+
+    scheduler = FifoScheduler(time_budget=10)
+    scheduler.add_task(status_task())
+    assert scheduler.run_time_slice() == "second"
+
+
+def test_task_stats_recorded():
+    log = []
+    scheduler = FifoScheduler()
+    scheduler.add_task(counting_task(log, "a", 3))
+    scheduler.complete_tasks()
+
+    stats = scheduler.task_stats["counting_task"]
+    # Three yielding steps, plus the final step that finishes the task
+    assert stats.count == 4
+    assert stats.max_duration <= stats.total_duration
+
+
+def test_priority_scheduler_round_robin():
+    log = []
+    scheduler = PriorityScheduler()
+    scheduler.add_task(counting_task(log, "a", 2))
+    scheduler.add_task(counting_task(log, "b", 2))
+    scheduler.complete_tasks()
+    assert [name for name, _ in log] == ["a", "b", "a", "b"]
+
+
+def test_priority_scheduler_interactive_first():
+    log = []
+    scheduler = PriorityScheduler()
+    scheduler.add_task(counting_task(log, "bg", 2), priority=Priority.BACKGROUND)
+    scheduler.add_task(counting_task(log, "visible", 2))
+    scheduler.add_task(counting_task(log, "ui", 5), priority=Priority.INTERACTIVE)
+    scheduler.complete_tasks()
+    # Lower classes still get their periodic share
+    assert [name for name, _ in log][:5] == ["ui", "ui", "ui", "bg", "ui"]
+
+
+def test_priority_scheduler_polling_doesnt_starve_lower_classes():
+    log = []
+    scheduler = PriorityScheduler()
+    # A poll that stays queued, like waiting for matcher results
+    scheduler.add_task(lambda: True, priority=Priority.INTERACTIVE)
+    scheduler.add_task(counting_task(log, "bg", 2), priority=Priority.BACKGROUND)
+    for _ in range(3 * PriorityScheduler.lower_priority_interval):
+        scheduler.iteration()
+    assert log == [("bg", 0), ("bg", 1)]
+
+
+def test_priority_scheduler_background_share():
+    log = []
+    scheduler = PriorityScheduler()
+    scheduler.add_task(counting_task(log, "bg", 100), priority=Priority.BACKGROUND)
+    scheduler.add_task(counting_task(log, "visible", 100))
+    for _ in range(40):
+        scheduler.iteration()
+
+    names = [name for name, _ in log]
+    share = names.count("bg") / len(names)
+    assert share == 1 / PriorityScheduler.lower_priority_interval
+
+
+def test_priority_scheduler_throttles_background_on_interaction():
+    log = []
+    scheduler = PriorityScheduler()
+    scheduler.add_task(counting_task(log, "bg", 100), priority=Priority.BACKGROUND)
+    scheduler.add_task(counting_task(log, "visible", 100))
+    scheduler.note_interaction()
+    for _ in range(40):
+        scheduler.iteration()
+    assert "bg" not in [name for name, _ in log]
+
+
+def test_priority_scheduler_subscheduler_priority():
+    log = []
+    scheduler = PriorityScheduler()
+    visible, background = FifoScheduler(), FifoScheduler()
+    background.priority = Priority.BACKGROUND
+    scheduler.add_scheduler(background)
+    scheduler.add_scheduler(visible)
+    background.add_task(counting_task(log, "bg", 1))
+    visible.add_task(counting_task(log, "visible", 2))
+    scheduler.note_interaction()
+    scheduler.complete_tasks()
+    assert [name for name, _ in log] == ["visible", "visible", "bg"]
+
+
+def test_priority_scheduler_interactive_subscheduler_task():
+    log = []
+    scheduler = PriorityScheduler()
+    focused, other, background = FifoScheduler(), FifoScheduler(), FifoScheduler()
+    background.priority = Priority.BACKGROUND
+    for sub in (focused, other, background):
+        scheduler.add_scheduler(sub)
+    other.add_task(counting_task(log, "other", 3))
+    background.add_task(counting_task(log, "bg", 1), priority=Priority.INTERACTIVE)
+    focused.add_task(counting_task(log, "poll", 2), priority=Priority.INTERACTIVE)
+
+    # Only a visible scheduler's interactive tasks make it interactive
+    assert focused.priority == Priority.INTERACTIVE
+    assert background.priority == Priority.BACKGROUND
+    assert scheduler.queues[Priority.INTERACTIVE] == [focused]
+
+    scheduler.complete_tasks()
+    assert [name for name, _ in log][:2] == ["poll", "poll"]
+    assert focused.priority == Priority.VISIBLE
+    assert not any(scheduler.queues.values())
+
+
+def test_priority_scheduler_requeues_on_priority_change():
+    scheduler = PriorityScheduler()
+    sub = FifoScheduler()
+    scheduler.add_scheduler(sub)
+    sub.add_task(counting_task([], "a", 5))
+    assert scheduler.queues[Priority.VISIBLE] == [sub]
+
+    sub.priority = Priority.BACKGROUND
+    assert scheduler.queues[Priority.VISIBLE] == []
+    assert scheduler.queues[Priority.BACKGROUND] == [sub]
+
+
+@pytest.fixture
+def main_loop_calls():
+    """Collect calls made from worker threads, to run them synchronously"""
+    calls = []
+    with mock.patch("meld.task.call_on_main_loop", lambda *args: calls.append(args)):
+        yield calls
+
+
+def run_offloaded(scheduler, calls):
+    while scheduler.tasks_pending() or scheduler.waiting:
+        scheduler.complete_tasks()
+        concurrent.futures.wait(scheduler.waiting.values(), timeout=5)
+        while calls:
+            function, *args = calls.pop(0)
+            function(*args)
+
+
+def test_offload_resumes_task_with_result(main_loop_calls):
+    log = []
+
+    def offloading_task():
+        result = yield Offload(sum, [1, 2, 3])
+        log.append(result)
+
+    scheduler = FifoScheduler()
+    scheduler.add_task(offloading_task())
+    run_offloaded(scheduler, main_loop_calls)
+    assert log == [6]
+
+
+def test_offload_raises_error_in_task(main_loop_calls):
+    log = []
+
+    def failing():
+        raise OSError("failed")
+
+    def offloading_task():
+        try:
+            yield Offload(failing)
+        except OSError as err:
+            log.append(str(err))
+
+    scheduler = FifoScheduler()
+    scheduler.add_task(offloading_task())
+    run_offloaded(scheduler, main_loop_calls)
+    assert log == ["failed"]
+
+
+def test_offload_other_tasks_run_while_suspended(main_loop_calls):
+    log = []
+
+    def offloading_task():
+        yield Offload(lambda: None)
+        log.append(("offload", 0))
+
+    scheduler = FifoScheduler()
+    scheduler.add_task(offloading_task())
+    scheduler.add_task(counting_task(log, "a", 2))
+    while scheduler.tasks_pending():
+        scheduler.iteration()
+    assert log == [("a", 0), ("a", 1)]
+    assert len(scheduler.waiting) == 1
+    assert scheduler.has_work()
+
+    run_offloaded(scheduler, main_loop_calls)
+    assert log[-1] == ("offload", 0)
+
+
+def test_offload_removed_task_not_resumed(main_loop_calls):
+    log = []
+
+    def offloading_task():
+        yield Offload(lambda: None)
+        log.append("resumed")
+
+    task = offloading_task()
+    scheduler = FifoScheduler()
+    scheduler.add_task(task)
+    scheduler.iteration()
+    future = scheduler.waiting[task]
+    scheduler.remove_all_tasks()
+
+    concurrent.futures.wait([future], timeout=5)
+    for function, *args in main_loop_calls:
+        function(*args)
+    assert not scheduler.tasks_pending()
+    assert log == []
+
+
+def test_keyed_task_supersedes():
+    log = []
+    scheduler = FifoScheduler()
+    first, second = CancellationToken(), CancellationToken()
+    scheduler.add_task(counting_task(log, "a", 3), key="scan", token=first)
+    scheduler.iteration()
+    scheduler.add_task(counting_task(log, "b", 3), key="scan", token=second)
+    scheduler.complete_tasks()
+
+    assert log == [("a", 0), ("b", 0), ("b", 1), ("b", 2)]
+    assert first.cancelled
+    assert not second.cancelled
+    assert scheduler.keyed_tasks == {}
+
+
+def test_different_keys_dont_supersede():
+    log = []
+    scheduler = FifoScheduler()
+    scheduler.add_task(counting_task(log, "a", 1), key="a")
+    scheduler.add_task(counting_task(log, "b", 1), key="b")
+    scheduler.complete_tasks()
+    assert log == [("a", 0), ("b", 0)]
+
+
+def test_cancel_task_closes_generator():
+    log = []
+
+    def cleanup_task():
+        try:
+            yield 1
+            yield 1
+        finally:
+            log.append("closed")
+
+    task = cleanup_task()
+    token = CancellationToken()
+    scheduler = FifoScheduler()
+    scheduler.add_task(task, token=token)
+    scheduler.iteration()
+    scheduler.cancel_task(task)
+
+    assert log == ["closed"]
+    assert token.cancelled
+    assert not scheduler.tasks_pending()
+
+
+def test_remove_all_tasks_cancels_tokens():
+    tokens = [CancellationToken(), CancellationToken()]
+    scheduler = FifoScheduler()
+    for i, token in enumerate(tokens):
+        scheduler.add_task(counting_task([], i, 2), key=i, token=token)
+    scheduler.remove_all_tasks()
+    assert all(token.cancelled for token in tokens)
+    assert scheduler.keyed_tasks == {}
+
+
+def test_finished_task_token_not_cancelled():
+    token = CancellationToken()
+    scheduler = FifoScheduler()
+    scheduler.add_task(counting_task([], "a", 1), key="a", token=token)
+    scheduler.complete_tasks()
+    scheduler.remove_all_tasks()
+    assert not token.cancelled
+
+
+def test_complete_tasks_waits_for_offloads(main_loop_calls):
+    log = []
+
+    def offloading_task():
+        log.append((yield Offload(sum, [1, 2])))
+
+    scheduler, sub = PriorityScheduler(), FifoScheduler()
+    scheduler.add_scheduler(sub)
+    sub.add_task(offloading_task())
+    scheduler.complete_tasks()
+    assert log == [3]
+    assert not scheduler.has_work()
+
+
+def test_stop_cancels_task_waiting_on_offload(main_loop_calls):
+    from meld.melddoc import MeldDoc
+
+    log = []
+    release = threading.Event()
+
+    def scanning_task():
+        try:
+            yield Offload(release.wait, 5)
+            log.append("resumed")
+        finally:
+            log.append("closed")
+
+    token = CancellationToken()
+    window_scheduler, doc = PriorityScheduler(), mock.Mock()
+    doc.scheduler = FifoScheduler()
+    window_scheduler.add_scheduler(doc.scheduler)
+    doc.scheduler.add_task(scanning_task(), token=token)
+    doc.scheduler.iteration()
+    (future,) = doc.scheduler.waiting.values()
+
+    # The scan is suspended, so nothing is runnable but there's work
+    while window_scheduler.tasks_pending():
+        window_scheduler.iteration()
+    assert window_scheduler.has_work()
+
+    MeldDoc.action_stop(doc)
+    release.set()
+    concurrent.futures.wait([future], timeout=5)
+    for function, *args in main_loop_calls:
+        function(*args)
+
+    assert log == ["closed"]
+    assert token.cancelled
+    window_scheduler.complete_tasks()
+    assert not window_scheduler.has_work()
@@ -0,0 +1,139 @@
+import json
+from unittest import mock
+
+import pytest
+
+from meld.tracing import FrameProfiler, Tracer, frame_profiled, traced, traced_iter
+
+
+@pytest.fixture
+def tracer(monkeypatch):
+    tracer = Tracer()
+    tracer.enabled = True
+    monkeypatch.setattr("meld.tracing.tracer", tracer)
+    return tracer
+
+
+def test_span_records_complete_event(tracer):
+    with tracer.span("step", "test", size=3):
+        pass
+
+    (event,) = tracer.events
+    assert event["name"] == "step"
+    assert event["cat"] == "test"
+    assert event["ph"] == "X"
+    assert event["dur"] >= 0
+    assert event["args"] == {"size": 3}
+
+
+def test_span_disabled_records_nothing():
+    tracer = Tracer()
+    with tracer.span("step"):
+        pass
+    assert tracer.events == []
+
+
+def test_traced_records_call(tracer):
+    @traced("test")
+    def work(x):
+        return x * 2
+
+    assert work(2) == 4
+    assert [e["name"] for e in tracer.events] == [work.__qualname__]
+
+
+def test_traced_iter_records_each_step(tracer):
+    @traced_iter("test")
+    def work():
+        yield 1
+        yield 2
+
+    assert list(work()) == [1, 2]
+    # One span per yielded value, plus the final exhausting step
+    assert len(tracer.events) == 3
+    assert {e["cat"] for e in tracer.events} == {"test"}
+
+
+def test_write_chrome_trace(tracer, tmp_path):
+    with tracer.span("step"):
+        pass
+
+    path = tmp_path / "trace.json"
+    tracer.write(str(path))
+    data = json.loads(path.read_text())
+    assert [e["name"] for e in data["traceEvents"]] == ["step"]
+
+
+def test_traced_iter_forwards_sent_values(tracer):
+    @traced_iter("test")
+    def work():
+        received = yield "first"
+        yield received
+
+    generator = work()
+    assert next(generator) == "first"
+    assert generator.send("sent") == "sent"
+
+
+@pytest.fixture
+def frame_profiler(monkeypatch):
+    profiler = FrameProfiler()
+    profiler.enabled = True
+    monkeypatch.setattr("meld.tracing.frame_profiler", profiler)
+    return profiler
+
+
+def make_widget(name, refresh_interval=0):
+    widget = mock.Mock()
+    widget.get_buildable_id.return_value = name
+    clock = widget.get_frame_clock.return_value
+    clock.get_frame_counter.return_value = 0
+    timings = clock.get_current_timings.return_value
+    timings.get_refresh_interval.return_value = refresh_interval
+    return widget
+
+
+def test_frame_profiled_sums_calls_per_frame(frame_profiler):
+    class View:
+        def __init__(self):
+            self.widget = make_widget("textview0")
+
+        @frame_profiled(lambda view, line: view.widget)
+        def draw_line(self, line):
+            return line
+
+    view = View()
+    assert view.draw_line(1) == 1
+    view.draw_line(2)
+    view.widget.get_frame_clock().get_frame_counter.return_value = 1
+    view.draw_line(3)
+
+    (widget_frames,) = frame_profiler.frames.values()
+    assert sorted(widget_frames) == [0, 1]
+    assert list(widget_frames[0]) == [View.draw_line.__qualname__]
+
+
+def test_frame_profiler_summary(frame_profiler):
+    widget = make_widget("linkmap0", refresh_interval=10_000)
+    clock = widget.get_frame_clock()
+    with mock.patch("time.perf_counter") as perf_counter:
+        for frame, elapsed in enumerate((0.002, 0.004, 0.020)):
+            clock.get_frame_counter.return_value = frame
+            perf_counter.side_effect = [0, elapsed]
+            with frame_profiler.measure(widget, "draw"):
+                pass
+
+    (summary,) = frame_profiler.summary()
+    assert summary.widget.startswith("linkmap0 ")
+    assert summary.frames == 3
+    # Only the last frame is over the 10ms refresh interval
+    assert summary.dropped == 1
+    assert summary.percentiles["total"] == pytest.approx([4, 20, 20, 20])
+    assert summary.percentiles["draw"] == summary.percentiles["total"]
+
+
+def test_frame_profiler_disabled_records_nothing():
+    profiler = FrameProfiler()
+    with profiler.measure(make_widget("chunkmap0"), "draw"):
+        pass
+    assert profiler.frames == {}
@@ -0,0 +1,25 @@
+from meld.vc import _null
+from meld.vc._vc import STATE_MODIFIED, STATE_NORMAL
+
+
+class StateVc(_null.Vc):
+    def _update_tree_state_cache(self, path):
+        self._tree_cache[self.location + "/file"] = STATE_MODIFIED
+        self._tree_missing_cache[self.location].add("missing")
+
+
+def test_detached_refresh_leaves_state_until_applied(tmp_path):
+    vc = StateVc(str(tmp_path))
+    vc._tree_cache[str(tmp_path / "old")] = STATE_MODIFIED
+
+    detached = vc.detached_copy()
+    detached.refresh_vc_state()
+
+    # The original's caches are untouched by the detached refresh
+    assert vc._tree_cache == {str(tmp_path / "old"): STATE_MODIFIED}
+    assert not vc._tree_missing_cache
+
+    vc.update_state_from(detached)
+    assert vc._tree_cache == {str(tmp_path / "file"): STATE_MODIFIED}
+    assert vc._tree_missing_cache[str(tmp_path)] == {"missing"}
+    assert vc.get_entry(str(tmp_path / "other")).state == STATE_NORMAL